@@ -1,4 +1,5 @@
 # Local imports
+import hashlib
 import io
 import os
 
@@ -6,19 +7,78 @@ import os
 import numpy as np
 import pandas as pd
 import matplotlib
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 matplotlib.use('Agg')
 
+# Project imports
+from app.rollups import rollup_day
+from app.telemetry import get_logger, timed
+
+logger = get_logger(__name__)
+
+# 'rollup' reads the per day rollups, 'pipeline' aggregates the feature rows in Mongo,
+# 'python' reads whole message documents
+ANALYTICS_MODE = os.getenv("ANALYTICS_MODE", "rollup")
+ANALYTICS_BATCH_SIZE = int(os.getenv("ANALYTICS_BATCH_SIZE", "1000"))
+
+# Chart name -> (DataAnalyzer method that renders it, method that returns its aggregated series)
+CHARTS = {
+    'emotion_pie': ('plot_emotion_pie_chart', 'emotion_totals'),
+    'emotion_evolution': ('plot_emotion_evolution_over_time', 'daily_emotions'),
+    'sentiments': ('plot_sentiments_over_time', 'sentiment_by_date'),
+    'most_positive_entities': ('plot_most_positive_entities', 'most_positive_entities'),
+    'least_positive_entities': ('plot_least_positive_entities', 'least_positive_entities'),
+    'hate_evolution': ('plot_hate_speech_evolution', 'hate_by_conversation'),
+    'irony_evolution': ('plot_irony_evolution', 'irony_by_conversation'),
+}
+
+def new_figure():
+    """
+    Figure outside pyplot's global state, so concurrent requests can render charts safely
+
+    Returns:
+        fig, ax (Figure, Axes): Figure with a single axes
+    """
+    fig = Figure(figsize=(10, 6))
+    ax = fig.subplots()
+    return fig, ax
+
+def figure_png(fig):
+    """
+    Render a figure to PNG in memory
+
+    Args:
+        fig (Figure): Figure to render
+
+    Returns:
+        png (bytes): PNG image
+    """
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format='png')
+    return buffer.getvalue()
+
+def chart_label(label):
+    """
+    Text of an x axis label, days without their time
+    """
+    if isinstance(label, pd.Timestamp):
+        return label.strftime('%Y-%m-%d' if label == label.normalize() else '%Y-%m-%d %H:%M')
+    return str(label)
+
 def clean_emotions(df):
     """
     Preprocess detected emotions for analytics
     Args:
         df (pd.DataFrame): Emotion dataset to clean
+
+    Returns:
+        df (pd.DataFrame): New frame with the emotion names normalized, the input frame is not modified
     """
-    df['probability'] = pd.to_numeric(df['probability'], errors='coerce')
     df = df.dropna(subset=['emotion', 'probability'])
-    df['emotion'] = df['emotion'].astype(str).str.strip().str.lower()
-    return df
+    # Only the categories are normalized, not every row
+    names = df['emotion'].cat.categories.str.strip().str.lower()
+    emotion = pd.Categorical(names[df['emotion'].cat.codes])
+    return df.assign(emotion=emotion)
 
 def clean_empty_convers(analyzer):
     """
@@ -27,16 +87,248 @@ def clean_empty_convers(analyzer):
         analyzer (Object)
     """
     if analyzer.emotion_df.empty and analyzer.entity_df.empty and analyzer.sentiment_df.empty and analyzer.hate_df.empty:
-        print("No useful data found in the current conversation. Skipping.")
+        logger.debug("No useful analytics data found", extra={'user_id': str(analyzer.user_id)})
         return False
-    print("Conversations with valid data found.")
-    return True 
+    return True
+
+# Column types of the analytics frames: 'float' arrays, 'category', parsed 'timestamp' or plain 'object'
+EMOTION_SCHEMA = [('emotion', 'category'), ('probability', 'float'), ('timestamp', 'timestamp'), ('conversation_id', 'category')]
+HATE_SCHEMA = [('hateful', 'float'), ('targeted', 'float'), ('aggressive', 'float'), ('timestamp', 'timestamp'), ('conversation_id', 'category')]
+IRONY_SCHEMA = [('ironic', 'float'), ('not_ironic', 'float'), ('timestamp', 'timestamp'), ('conversation_id', 'category')]
+SENTIMENT_SCHEMA = [('Positive', 'float'), ('Neutral', 'float'), ('Negative', 'float'), ('timestamp', 'timestamp'), ('conversation_id', 'category')]
+ENTITY_SCHEMA = [('category', 'category'), ('entity', 'object'), ('sentiment_neg', 'float'), ('sentiment_neu', 'float'),
+                 ('sentiment_pos', 'float'), ('timestamp', 'timestamp'), ('conversation_id', 'category')]
+
+class ColumnarBuilder:
+    """
+    Builds a typed DataFrame column by column: probabilities in float32 arrays, repeated labels as categoricals
+    and timestamps parsed once. Rows are appended as plain values, no dict is created per row.
+    """
+    def __init__(self, schema):
+        """
+        Initialize builder
+
+        Args:
+            schema (list): (column, type) pairs, in the order of the appended values
+        """
+        self.schema = schema
+        self.columns = [[] for _ in schema]
+
+    def append(self, *values):
+        """
+        Append a row, one value per column of the schema
+        """
+        for column, value in zip(self.columns, values):
+            column.append(value)
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def build(self):
+        """
+        Typed frame with the appended rows
+
+        Returns:
+            df (pd.DataFrame): One typed column per schema entry
+        """
+        data = {}
+        for (name, kind), values in zip(self.schema, self.columns):
+            if kind == 'float':
+                data[name] = np.fromiter((np.nan if value is None else value for value in values), dtype=np.float32, count=len(values))
+            elif kind == 'category':
+                data[name] = pd.Categorical(values)
+            elif kind == 'timestamp':
+                data[name] = pd.to_datetime(pd.Series(values, dtype=object), errors='coerce')
+            else:
+                data[name] = pd.Series(values, dtype=object)
+        return pd.DataFrame(data)
+
+def read_columns(cursor, schema):
+    """
+    Read an aggregation cursor batch by batch into typed columns, without keeping the documents
+
+    Args:
+        cursor (CommandCursor): Aggregation results, flat documents
+        schema (list): (column, type) pairs
+
+    Returns:
+        df (pd.DataFrame): One column per schema entry
+    """
+    builder = ColumnarBuilder(schema)
+    names = [name for name, _ in schema]
+    for row in cursor:
+        builder.append(*[row.get(name) for name in names])
+    return builder.build()
+
+def rollup_frames(rollups):
+    """
+    Frames of the charts from the per day rollups. Every day is a row with the mean of its messages,
+    and entities get the mean sentiment of all the messages that mention them.
+
+    Args:
+        rollups (iterable): Rollup documents sorted by day
+
+    Returns:
+        frames (dict): Frame name -> DataFrame
+    """
+    emotions = ColumnarBuilder(EMOTION_SCHEMA + [('messages', 'float')])
+    sentiments = ColumnarBuilder(SENTIMENT_SCHEMA)
+    hate = ColumnarBuilder(HATE_SCHEMA)
+    irony = ColumnarBuilder(IRONY_SCHEMA)
+    entities = {}
+    for rollup in rollups:
+        day = rollup['day']
+        # Days stand for the conversations in the per conversation charts
+        day_id = day.strftime('%Y-%m-%d')
+
+        emotion_count = rollup.get('emotions_count', 0)
+        for emotion, total in rollup.get('emotions', {}).items():
+            emotions.append(emotion, total / emotion_count, day, day_id, emotion_count)
+
+        sentiment_count = rollup.get('sentiment_count', 0)
+        if sentiment_count:
+            sentiment = rollup['sentiment']
+            sentiments.append(sentiment.get('POS', 0) / sentiment_count, sentiment.get('NEU', 0) / sentiment_count,
+                              sentiment.get('NEG', 0) / sentiment_count, day, day_id)
+
+        hate_count = rollup.get('hate_count', 0)
+        if hate_count:
+            hate_sums = rollup['hate']
+            hate.append(hate_sums.get('hateful', 0) / hate_count, hate_sums.get('targeted', 0) / hate_count,
+                        hate_sums.get('aggressive', 0) / hate_count, day, day_id)
+
+        irony_count = rollup.get('irony_count', 0)
+        if irony_count:
+            irony_sums = rollup['irony']
+            irony.append(irony_sums.get('ironic', 0) / irony_count, irony_sums.get('not ironic', 0) / irony_count, day, day_id)
+
+        for category, category_entities in rollup.get('entities', {}).items():
+            for key, accumulator in category_entities.items():
+                entity = entities.setdefault((category, key), {'name': accumulator['name'], 'mentions': 0, 'NEG': 0, 'NEU': 0, 'POS': 0})
+                for field in ('mentions', 'NEG', 'NEU', 'POS'):
+                    entity[field] += accumulator.get(field, 0)
+                entity['timestamp'] = day
+
+    entity_rows = ColumnarBuilder(ENTITY_SCHEMA + [('mentions', 'float')])
+    for (category, _), entity in entities.items():
+        mentions = entity['mentions']
+        if mentions:
+            entity_rows.append(category, entity['name'], entity['NEG'] / mentions, entity['NEU'] / mentions, entity['POS'] / mentions,
+                               entity['timestamp'], entity['timestamp'].strftime('%Y-%m-%d'), mentions)
+
+    return {
+        'emotion': emotions.build(),
+        'sentiment': sentiments.build(),
+        'hate': hate.build(),
+        'irony': irony.build(),
+        'entity': entity_rows.build()
+    }
+
+def time_range(field, start=None, end=None):
+    """
+    Mongo filter of a time window, empty without limits
+
+    Args:
+        field (str): Time field
+        start (datetime): First time included
+        end (datetime): Last time included
+
+    Returns:
+        query (dict): Filter on the field
+    """
+    bounds = {}
+    if start is not None:
+        bounds['$gte'] = start
+    if end is not None:
+        bounds['$lte'] = end
+    return {field: bounds} if bounds else {}
+
+def feature_pipelines(user_id, start=None, end=None):
+    """
+    Aggregation pipelines returning only the numeric feature rows of a user's messages
+
+    Args:
+        user_id (ObjectId): User id
+        start (datetime): First message time included
+        end (datetime): Last message time included
+
+    Returns:
+        pipelines (dict): Frame name -> (pipeline, schema of its rows)
+    """
+    # Served by the (user_id, timestamp) index
+    match = {'$match': {'user_id': user_id, **time_range('timestamp', start, end)}}
+    conversation = {'$toString': '$conversation_id'}
+    return {
+        'emotion': ([
+            match,
+            {'$project': {'_id': 0, 'conversation_id': 1, 'timestamp': 1, 'emotions': {'$objectToArray': {'$ifNull': ['$emotions', {}]}}}},
+            {'$unwind': '$emotions'},
+            {'$project': {'emotion': '$emotions.k', 'probability': '$emotions.v', 'timestamp': 1, 'conversation_id': conversation}},
+        ], EMOTION_SCHEMA),
+        # The charts only use the means per conversation
+        'hate': ([
+            match,
+            {'$match': {'hate': {'$exists': True, '$ne': {}}}},
+            {'$group': {
+                '_id': '$conversation_id',
+                'hateful': {'$avg': {'$ifNull': ['$hate.hateful', 0]}},
+                'targeted': {'$avg': {'$ifNull': ['$hate.targeted', 0]}},
+                'aggressive': {'$avg': {'$ifNull': ['$hate.aggressive', 0]}},
+                'timestamp': {'$max': '$timestamp'}
+            }},
+            {'$project': {'_id': 0, 'hateful': 1, 'targeted': 1, 'aggressive': 1, 'timestamp': 1, 'conversation_id': {'$toString': '$_id'}}},
+        ], HATE_SCHEMA),
+        'irony': ([
+            match,
+            {'$match': {'irony': {'$exists': True, '$ne': {}}}},
+            {'$group': {
+                '_id': '$conversation_id',
+                'ironic': {'$avg': {'$ifNull': ['$irony.ironic', 0]}},
+                'not_ironic': {'$avg': {'$ifNull': ['$irony.not ironic', 0]}},
+                'timestamp': {'$max': '$timestamp'}
+            }},
+            {'$project': {'_id': 0, 'ironic': 1, 'not_ironic': 1, 'timestamp': 1, 'conversation_id': {'$toString': '$_id'}}},
+        ], IRONY_SCHEMA),
+        'sentiment': ([
+            match,
+            {'$match': {'sentiment': {'$exists': True, '$ne': {}}}},
+            {'$project': {
+                '_id': 0,
+                'Positive': {'$ifNull': ['$sentiment.POS', 0]},
+                'Neutral': {'$ifNull': ['$sentiment.NEU', 0]},
+                'Negative': {'$ifNull': ['$sentiment.NEG', 0]},
+                'timestamp': 1,
+                'conversation_id': conversation
+            }},
+        ], SENTIMENT_SCHEMA),
+        # Entities take the sentiment of the message that mentions them
+        'entity': ([
+            match,
+            {'$match': {'sentiment': {'$exists': True, '$ne': {}}}},
+            {'$project': {'_id': 0, 'conversation_id': 1, 'timestamp': 1, 'sentiment': 1, 'entities': {'$objectToArray': {'$ifNull': ['$entities', {}]}}}},
+            {'$unwind': '$entities'},
+            {'$unwind': '$entities.v'},
+            {'$project': {
+                'category': '$entities.k',
+                'entity': '$entities.v',
+                'sentiment_neg': {'$ifNull': ['$sentiment.NEG', 0]},
+                'sentiment_neu': {'$ifNull': ['$sentiment.NEU', 0]},
+                'sentiment_pos': {'$ifNull': ['$sentiment.POS', 0]},
+                'timestamp': 1,
+                'conversation_id': conversation
+            }},
+        ], ENTITY_SCHEMA),
+    }
 
 class DataAnalyzer():
-    def __init__(self, db, conversation_id, image_dir : str) -> None:
+    def __init__(self, db, conversation_id, start=None, end=None) -> None:
         self.user_id = None
         self.username = None
         self.db = db
+
+        # Time window of the analytics, the whole history by default
+        self.start = start
+        self.end = end
         
         # DataFrames inicializados para emociones, ironía, hate speech y sentimiento
         self.emotion_df = pd.DataFrame()
@@ -44,123 +336,225 @@ class DataAnalyzer():
         self.hate_df = pd.DataFrame()
         self.sentiment_df = pd.DataFrame()
         self.entity_df = pd.DataFrame()
-        self.image_dir = image_dir
         self.conversation_id = conversation_id
-    
-    def get_history(self):
+
+    def rollups_query(self):
+        """
+        Rollups of the user in the time window, whole days as rollups are daily
+        """
+        start = rollup_day(self.start) if self.start is not None else None
+        end = rollup_day(self.end) if self.end is not None else None
+        return {'user_id': self.user_id, **time_range('day', start, end)}
+
+    def messages_query(self):
+        """
+        Messages of the user in the time window
+        """
+        return {'user_id': self.user_id, **time_range('timestamp', self.start, self.end)}
+
+    @timed("data_version")
+    def data_version(self, mode=ANALYTICS_MODE):
+        """
+        Hash of the user's analytics data in the time window, it changes with every message saved in it. Only the day,
+        message count and last message time of each rollup are read, so it is much cheaper than get_history.
+
+        Args:
+            mode (str): History mode, charts of different modes are versioned apart
+
+        Returns:
+            version (str): Data version hash
+        """
+        version = hashlib.sha1(f"{mode}|{self.start}|{self.end}".encode('utf-8'))
+        projection = {'_id': 0, 'day': 1, 'messages': 1, 'last_message': 1}
+        for rollup in self.db.analytics_rollups.find(self.rollups_query(), projection).sort('day', 1):
+            version.update(f"{rollup['day']}|{rollup.get('messages')}|{rollup.get('last_message')};".encode('utf-8'))
+        return version.hexdigest()[:16]
+
+    @timed("chart_render")
+    def plot(self, chart):
+        """
+        Render a chart by name
+
+        Args:
+            chart (str): Key of CHARTS
+
+        Returns:
+            png (bytes): PNG image, None without data
+        """
+        return getattr(self, CHARTS[chart][0])()
+
+    @timed("chart_data")
+    def chart_data(self, chart):
+        """
+        Aggregated series of a chart, to render it in the browser
+
+        Args:
+            chart (str): Key of CHARTS
+
+        Returns:
+            data (dict): 'labels' of the x axis and 'series' name -> values, None without data
+        """
+        series = getattr(self, CHARTS[chart][1])()
+        if series is None:
+            return None
+        labels = [chart_label(label) for label in series.index]
+        return {
+            'chart': chart,
+            'labels': labels,
+            'series': {str(name): [round(float(value), 4) for value in series[name]] for name in series.columns}
+        }
+
+    @timed("analytics_load")
+    def get_history(self, mode=ANALYTICS_MODE):
         """
         Recover user's historical feature_dicts
+
+        Args:
+            mode (str): 'rollup' to read the per day rollups, 'pipeline' to aggregate in Mongo,
+                'python' to build the frames from the message documents
         """
-        conversations = list(self.db.conversations.find({'user_id': self.user_id}))
-        if not conversations:
-            print(f"No conversations found for user with ObjectId: {self.user_id}")
+        if mode == 'rollup':
+            found = self.load_rollups()
+        elif mode == 'pipeline':
+            found = self.load_aggregated()
+        else:
+            found = self.load_messages()
+        if not found:
             return False
 
-        print(f"Found {len(conversations)} conversations for user {self.username}")
-        entities_list = []
-        emotions_list = []
-        irony_list = []
-        hate_list = []
-        sentiment_list = []
-
-        for conversation in conversations:
-            conversation_id = conversation['_id']
-            messages = conversation.get('messages', [])
-            entities = conversation.get('entities', {})
-            for message in messages:
-                timestamp = message.get('timestamp', conversation.get('start_time'))
-
-                if 'emotions' in message:
-                    for emotion, probability in message['emotions'].items():
-                        emotions_list.append({
-                            'emotion': emotion,
-                            'probability': probability,
-                            'timestamp': timestamp,
-                            'conversation_id': str(conversation_id)
-                        })
-
-                hate_data = message.get('hate', {})
-                if hate_data:
-                    hate_list.append({
-                        'hateful': hate_data.get('hateful', 0),
-                        'targeted': hate_data.get('targeted', 0),
-                        'aggressive': hate_data.get('aggressive', 0),
-                        'timestamp': timestamp,
-                        'conversation_id': str(conversation_id)
-                    })
-
-                irony_data = message.get('irony', {})
-                if irony_data:
-                    irony_list.append({
-                        'ironic': irony_data.get('ironic', 0),
-                        'not_ironic': irony_data.get('not ironic', 0),
-                        'timestamp': timestamp,
-                        'conversation_id': str(conversation_id)
-                    })
-
-                if 'sentiment' in message:
-                    sentiment_list.append({
-                        'Positive': message['sentiment'].get('POS', 0),
-                        'Neutral': message['sentiment'].get('NEU', 0),
-                        'Negative': message['sentiment'].get('NEG', 0),
-                        'timestamp': timestamp,
-                        'conversation_id': str(conversation_id)
-                    })
-
-
-            for category, entities_in_category in entities.items():
-                for entity_info in entities_in_category:
-                    if len(entity_info) == 2 and isinstance(entity_info[1], dict):
-                        entity_name, sentiment_data = entity_info
-                        entities_list.append({
-                            'category': category,
-                            'entity': entity_name,
-                            'sentiment_neg': sentiment_data.get('NEG', 0),
-                            'sentiment_neu': sentiment_data.get('NEU', 0),
-                            'sentiment_pos': sentiment_data.get('POS', 0),
-                            'timestamp': timestamp,
-                            'conversation_id': str(conversation_id)
-                        })
-        # Converting lists to DataFrames
-        self.emotion_df = pd.DataFrame(emotions_list)
-        self.hate_df = pd.DataFrame(hate_list)
-        self.irony_df = pd.DataFrame(irony_list)
-        self.sentiment_df = pd.DataFrame(sentiment_list)
-        self.entity_df = pd.DataFrame(entities_list)
-        # Assume entities are extracted elsewhere and appended similarly
-
-        print(f"DataFrames created with entries: Emotion({len(self.emotion_df)}), Hate({len(self.hate_df)}), Irony({len(self.irony_df)}), Sentiment({len(self.sentiment_df)})")
+        # Frames are built once with their final types, the chart methods only read them
+        self.emotion_df = clean_emotions(self.emotion_df)
+        logger.debug("Analytics frames built", extra={'user_id': str(self.user_id), 'mode': mode, 'emotion_rows': len(self.emotion_df),
+                                                      'hate_rows': len(self.hate_df), 'irony_rows': len(self.irony_df),
+                                                      'sentiment_rows': len(self.sentiment_df)})
         return clean_empty_convers(self)
 
-    def plot_sentiments_over_time(self):
+    def load_rollups(self):
         """
-        Generate a barplot with historical sentiments
+        Build the frames from the user's per day rollups, the cost grows with the days used instead of the messages
 
         Returns:
-            filename_irony (str): Output file name
+            found (bool): The user has rollups
+        """
+        rollups = self.db.analytics_rollups.find(self.rollups_query(), {'_id': 0, 'user_id': 0}).sort('day', 1)
+        frames = rollup_frames(rollups)
+        self.emotion_df = frames['emotion']
+        self.hate_df = frames['hate']
+        self.irony_df = frames['irony']
+        self.sentiment_df = frames['sentiment']
+        self.entity_df = frames['entity']
+        return any(not df.empty for df in frames.values())
+
+    def load_aggregated(self, batch_size=ANALYTICS_BATCH_SIZE):
+        """
+        Build the frames from aggregation pipelines, Mongo only returns the numeric feature rows
+
+        Args:
+            batch_size (int): Rows per cursor batch
+
+        Returns:
+            found (bool): The user has messages with features
+        """
+        frames = {}
+        for name, (pipeline, schema) in feature_pipelines(self.user_id, self.start, self.end).items():
+            cursor = self.db.messages.aggregate(pipeline, batchSize=batch_size)
+            frames[name] = read_columns(cursor, schema)
+
+        self.emotion_df = frames['emotion']
+        self.hate_df = frames['hate']
+        self.irony_df = frames['irony']
+        self.sentiment_df = frames['sentiment']
+        self.entity_df = frames['entity']
+        return any(not df.empty for df in frames.values())
+
+    def load_messages(self):
+        """
+        Build the frames from the message documents
+
+        Returns:
+            found (bool): The user has messages
+        """
+        # Features of every message, without the message texts
+        projection = {'user_message': 0, 'bot_message': 0}
+        emotions = ColumnarBuilder(EMOTION_SCHEMA)
+        hate = ColumnarBuilder(HATE_SCHEMA)
+        irony = ColumnarBuilder(IRONY_SCHEMA)
+        sentiments = ColumnarBuilder(SENTIMENT_SCHEMA)
+        entities = ColumnarBuilder(ENTITY_SCHEMA)
+
+        n_messages = 0
+        for message in self.db.messages.find(self.messages_query(), projection):
+            n_messages += 1
+            conversation_id = str(message['conversation_id'])
+            timestamp = message.get('timestamp')
+
+            for emotion, probability in message.get('emotions', {}).items():
+                emotions.append(emotion, probability, timestamp, conversation_id)
+
+            hate_data = message.get('hate', {})
+            if hate_data:
+                hate.append(hate_data.get('hateful', 0), hate_data.get('targeted', 0), hate_data.get('aggressive', 0),
+                            timestamp, conversation_id)
+
+            irony_data = message.get('irony', {})
+            if irony_data:
+                irony.append(irony_data.get('ironic', 0), irony_data.get('not ironic', 0), timestamp, conversation_id)
+
+            sentiment_data = message.get('sentiment', {})
+            if sentiment_data:
+                sentiments.append(sentiment_data.get('POS', 0), sentiment_data.get('NEU', 0), sentiment_data.get('NEG', 0),
+                                  timestamp, conversation_id)
+
+                # Entities take the sentiment of the message that mentions them
+                for category, entities_in_category in message.get('entities', {}).items():
+                    for entity_name in entities_in_category:
+                        entities.append(category, entity_name, sentiment_data.get('NEG', 0), sentiment_data.get('NEU', 0),
+                                        sentiment_data.get('POS', 0), timestamp, conversation_id)
+        if not n_messages:
+            return False
+
+        logger.debug("Analytics messages loaded", extra={'user_id': str(self.user_id), 'messages': n_messages})
+        self.emotion_df = emotions.build()
+        self.hate_df = hate.build()
+        self.irony_df = irony.build()
+        self.sentiment_df = sentiments.build()
+        self.entity_df = entities.build()
+        return True
+
+    def sentiment_by_date(self):
         """
+        Mean sentiment probabilities per day
 
-        # Filepath definition
-        filename_irony = f'irony_evolution.png'
-        temp_file_path = os.path.join(self.image_dir, filename_irony)
+        Returns:
+            sentiment_by_date (pd.DataFrame): Positive, Negative and Neutral means indexed by date, None without data
+        """
+        if self.sentiment_df.empty:
+            logger.debug("No sentiment data to plot")
+            return None
 
         # Delete empty
-        self.sentiment_df.dropna(subset=['timestamp'], inplace=True)
-        
-        # Set types
-        self.sentiment_df['timestamp'] = pd.to_datetime(self.sentiment_df['timestamp'], errors='coerce')
-        self.sentiment_df['Positive'] = pd.to_numeric(self.sentiment_df['Positive'], errors='coerce')
-        self.sentiment_df['Negative'] = pd.to_numeric(self.sentiment_df['Negative'], errors='coerce')
-        self.sentiment_df['Neutral'] = pd.to_numeric(self.sentiment_df['Neutral'], errors='coerce')
+        sentiment_df = self.sentiment_df.dropna(subset=['timestamp'])
 
         # Group by date
-        sentiment_by_date = self.sentiment_df.groupby(self.sentiment_df['timestamp'].dt.date).mean(numeric_only=True)
+        sentiment_by_date = sentiment_df.groupby(sentiment_df['timestamp'].dt.date)[['Positive', 'Negative', 'Neutral']].mean()
 
         if sentiment_by_date.empty:
-            print("No data available for plotting.")
+            logger.debug("No data available for plotting")
+            return None
+        return sentiment_by_date
+
+    def plot_sentiments_over_time(self):
+        """
+        Generate a barplot with historical sentiments
+
+        Returns:
+            png (bytes): PNG image, None without data
+        """
+        sentiment_by_date = self.sentiment_by_date()
+        if sentiment_by_date is None:
             return None
 
-        fig, ax = plt.subplots(figsize=(10, 6))
+        fig, ax = new_figure()
         bar_width = 0.25
         positions = np.arange(len(sentiment_by_date.index))
         ax.bar(positions - bar_width, sentiment_by_date['Positive'], width=bar_width, label='Positive', color='green')
@@ -172,49 +566,49 @@ class DataAnalyzer():
         ax.set_xticklabels(sentiment_by_date.index, rotation=45)
         ax.legend(loc='upper right')
 
-        # Save in temporal folder
-        fig.savefig(temp_file_path, format='png')
-        plt.close(fig)
+        return figure_png(fig)
 
-        return filename_irony
-
-    def plot_emotion_pie_chart(self):
+    def emotion_totals(self):
         """
-        Generate pie chart with all emotions
+        Total probability of each emotion
 
         Returns:
-            filename_pie (str): Output file name
+            emotion_totals (pd.DataFrame): 'probability' indexed by emotion, None without data
         """
         if self.emotion_df.empty:
-            print("No emotion data to plot.")
+            logger.debug("No emotion data to plot")
             return None
 
-        # Path definition
-        filename_pie = f'emotion_pie.png'
-        temp_file_path = os.path.join(self.image_dir, filename_pie)
-
-        # Data cleaning
-        self.emotion_df = clean_emotions(self.emotion_df)
+        # Group by emotion, rollup rows are daily means weighted by their messages
+        if 'messages' in self.emotion_df:
+            weighted = self.emotion_df['probability'] * self.emotion_df['messages']
+            emotion_totals = weighted.groupby(self.emotion_df['emotion'], observed=True).sum()
+        else:
+            emotion_totals = self.emotion_df.groupby('emotion', observed=True)['probability'].sum()
 
-        # Check enough data
-        if self.emotion_df.empty:
-            print("No emotion data to plot after cleaning.")
+        # Check emptyness
+        if emotion_totals.empty:
+            logger.debug("No emotion totals to plot")
             return None
+        return emotion_totals.to_frame('probability')
 
-        # Group by emotion
-        emotion_totals = self.emotion_df.groupby('emotion')['probability'].sum()
+    def plot_emotion_pie_chart(self):
+        """
+        Generate pie chart with all emotions
 
-        # Check emptyness
-        if emotion_totals.empty:
-            print("No emotion totals to plot.")
+        Returns:
+            png (bytes): PNG image, None without data
+        """
+        emotion_totals = self.emotion_totals()
+        if emotion_totals is None:
             return None
 
-        fig, ax = plt.subplots(figsize=(10, 6))
+        fig, ax = new_figure()
         wedges, texts, autotexts = ax.pie(
-            emotion_totals,
+            emotion_totals['probability'],
             labels=emotion_totals.index,
             autopct='%1.1f%%',
-            colors=plt.cm.Paired.colors
+            colors=matplotlib.colormaps['Paired'].colors
         )
         ax.legend(
             wedges,
@@ -224,43 +618,45 @@ class DataAnalyzer():
             bbox_to_anchor=(1, 0, 0.5, 1)
         )
 
-        # Save in temporal file
-        fig.savefig(temp_file_path, format='png')
-        plt.close(fig)
-
-        return filename_pie
+        return figure_png(fig)
 
-    def plot_emotion_evolution_over_time(self):
+    def daily_emotions(self):
         """
-        Generate line graph with emotion evolution
+        Mean probability of each emotion per day
 
         Returns:
-            filename_emotion (str): Output file name
+            daily_emotions (pd.DataFrame): One column per emotion indexed by day, None without data
         """
-        
         if self.emotion_df.empty:
-            print("No emotion data to plot.")
+            logger.debug("No emotion data to plot")
             return None
-        
-        # Path definition
-        filename_emotion = f'emotion_evolution.png'
-        temp_file_path = os.path.join(self.image_dir, filename_emotion)
 
         # Data cleaning
-        self.emotion_df['timestamp'] = pd.to_datetime(self.emotion_df['timestamp'], format='%d/%m/%Y %H:%M:%S', errors='coerce')
-        self.emotion_df.dropna(subset=['timestamp'], inplace=True)
+        emotion_df = self.emotion_df.dropna(subset=['timestamp'])
 
         # Group by emotion and date
-        daily_emotions = self.emotion_df.groupby(['emotion', pd.Grouper(key='timestamp', freq='D')])['probability'].mean().unstack(0)
-        daily_emotions.fillna(0, inplace=True)
+        daily_emotions = emotion_df.groupby(['emotion', pd.Grouper(key='timestamp', freq='D')], observed=True)['probability'].mean().unstack(0)
+        daily_emotions = daily_emotions.fillna(0)
+        daily_emotions.columns = daily_emotions.columns.astype(str)
 
         # Check enough data
         if daily_emotions.empty:
-            print("No data available for plotting.")
+            logger.debug("No data available for plotting")
             return None
+        return daily_emotions
 
-      
-        fig, ax = plt.subplots(figsize=(10, 6))
+    def plot_emotion_evolution_over_time(self):
+        """
+        Generate line graph with emotion evolution
+
+        Returns:
+            png (bytes): PNG image, None without data
+        """
+        daily_emotions = self.daily_emotions()
+        if daily_emotions is None:
+            return None
+
+        fig, ax = new_figure()
         for emotion in daily_emotions.columns:
             if not daily_emotions[emotion].empty:
                 ax.plot(daily_emotions.index, daily_emotions[emotion], label=emotion)
@@ -268,167 +664,182 @@ class DataAnalyzer():
         ax.set_ylabel('Average Probability')
         ax.legend(loc='upper right')
         
-        # Save to temporal folder
-        fig.savefig(temp_file_path, format='png')
-        plt.close(fig)
+        return figure_png(fig)
 
-        return filename_emotion
-
-    def plot_most_positive_entities(self):
+    def entity_positivity(self, most_positive=True, n=10):
         """
-        Generates a bar plot with the entities that have the most positivity associated with them.
+        Entities with the most or least positivity associated with them
+
+        Args:
+            most_positive (bool): Most positive entities first, least positive otherwise
+            n (int): Number of entities
 
         Returns:
-            filename_most_pos(str): Output file name
+            entities (pd.DataFrame): 'sentiment_pos' indexed by entity, None without data
         """
         if self.entity_df.empty:
-            print("No entity data to plot.")
+            logger.debug("No entity data to plot")
             return None
 
-        most_positive_entities = self.entity_df.sort_values(by='sentiment_pos', ascending=False).head(10)
+        entities = self.entity_df.sort_values(by='sentiment_pos', ascending=not most_positive).head(n)
 
-        # Checkk enough data
-        if most_positive_entities.empty:
-            print("No data to plot after filtering.")
+        # Check enough data
+        if entities.empty:
+            logger.debug("No data to plot after filtering")
             return None
+        return entities.set_index('entity')[['sentiment_pos']]
 
-        # Path definition
-        filename_most_pos = f'most_positive_entities.png'
-        temp_file_path = os.path.join(self.image_dir, filename_most_pos)
-        
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.barh(most_positive_entities['entity'], most_positive_entities['sentiment_pos'], color='green')
+    def most_positive_entities(self):
+        """
+        Ten entities with the most positivity
+        """
+        return self.entity_positivity(most_positive=True)
+
+    def least_positive_entities(self):
+        """
+        Ten entities with the least positivity
+        """
+        return self.entity_positivity(most_positive=False)
+
+    def plot_most_positive_entities(self):
+        """
+        Generates a bar plot with the entities that have the most positivity associated with them.
+
+        Returns:
+            png (bytes): PNG image, None without data
+        """
+        most_positive_entities = self.most_positive_entities()
+        if most_positive_entities is None:
+            return None
+
+        fig, ax = new_figure()
+        ax.barh(most_positive_entities.index, most_positive_entities['sentiment_pos'], color='green')
         ax.set_xlabel('Positivity Score')
         ax.set_ylabel('Entity')
-        fig.savefig(temp_file_path, format='png')
-        plt.close(fig)
 
-        return filename_most_pos
+        return figure_png(fig)
 
     def plot_least_positive_entities(self):
         """
         Generate a barplot with the least positive entities for the user
 
         Returns:
-            filename_least_pos (str): Output file name
+            png (bytes): PNG image, None without data
         """
-        if self.entity_df.empty:
-            print("No entity data to plot.")
+        least_positive_entities = self.least_positive_entities()
+        if least_positive_entities is None:
             return None
 
-        least_positive_entities = self.entity_df.sort_values(by='sentiment_pos', ascending=True).head(10)
-
-        # Check  enough data
-        if least_positive_entities.empty:
-            print("No data to plot after filtering.")
-            return None
-
-        # Path definition
-        filename_least_pos = f'least_positive_entities.png'
-        temp_file_path = os.path.join(self.image_dir, filename_least_pos)
-        
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.barh(least_positive_entities['entity'], least_positive_entities['sentiment_pos'], color='red')
+        fig, ax = new_figure()
+        ax.barh(least_positive_entities.index, least_positive_entities['sentiment_pos'], color='red')
         ax.set_xlabel('Positivity Score')
         ax.set_ylabel('Entity')
         ax.invert_yaxis()
-        fig.savefig(temp_file_path, format='png')
-        plt.close(fig)
 
-        return filename_least_pos
+        return figure_png(fig)
 
-    def plot_hate_speech_evolution(self):
+    def hate_by_conversation(self):
         """
-        Generate a plot with hate speech evolution in time
+        Mean hate speech probabilities per conversation
 
         Returns:
-            filename_hate (Str): Output filename
+            grouped_df (pd.DataFrame): hateful, targeted and aggressive means indexed by the last message time, None without data
         """
         if self.hate_df.empty:
-            print("No hate speech data to plot.")
+            logger.debug("No hate speech data to plot")
             return None
 
         # Group by conversation
-        grouped_df = self.hate_df.groupby('conversation_id').agg({
+        grouped_df = self.hate_df.groupby('conversation_id', observed=True).agg({
             'hateful': 'mean',
             'targeted': 'mean',
             'aggressive': 'mean',
             'timestamp': 'max'
-        }).reset_index()
-
-        # Path definition
-        filename_hate = f'hate_evolution.png'
-        temp_file_path = os.path.join(self.image_dir, filename_hate)
-
-        img = io.BytesIO()
-        plt.figure(figsize=(10, 6))
-        plt.plot(grouped_df['timestamp'], grouped_df['hateful'], label='Hate Speech', color='blue', marker='o')
-        plt.plot(grouped_df['timestamp'], grouped_df['targeted'], label='Targeted Speech', color='green', marker='o')
-        plt.plot(grouped_df['timestamp'], grouped_df['aggressive'], label='Aggressive Speech', color='red', marker='o')
-        plt.xlabel('Time')
-        plt.ylabel('Probability')
-        plt.xticks(rotation=45, ha='right')
-        plt.legend(['Hateful', 'Targeted', 'Aggressive'],loc='upper right')
-        plt.grid(True)
-        plt.tight_layout()
-        plt.savefig(temp_file_path, format='png') 
-        plt.clf()
-        plt.close()
-
-        img.seek(0)
-        return filename_hate
+        })
+        return grouped_df.set_index('timestamp').sort_index()
 
-    def plot_irony_evolution(self):
+    def plot_hate_speech_evolution(self):
         """
-        Generate a plot with irony evolution in time
+        Generate a plot with hate speech evolution in time
+
+        Returns:
+            png (bytes): PNG image, None without data
+        """
+        grouped_df = self.hate_by_conversation()
+        if grouped_df is None:
+            return None
+
+        fig, ax = new_figure()
+        ax.plot(grouped_df.index, grouped_df['hateful'], label='Hate Speech', color='blue', marker='o')
+        ax.plot(grouped_df.index, grouped_df['targeted'], label='Targeted Speech', color='green', marker='o')
+        ax.plot(grouped_df.index, grouped_df['aggressive'], label='Aggressive Speech', color='red', marker='o')
+        ax.set_xlabel('Time')
+        ax.set_ylabel('Probability')
+        ax.tick_params(axis='x', labelrotation=45)
+        for label in ax.get_xticklabels():
+            label.set_horizontalalignment('right')
+        ax.legend(['Hateful', 'Targeted', 'Aggressive'], loc='upper right')
+        ax.grid(True)
+        fig.tight_layout()
+
+        return figure_png(fig)
+
+    def irony_by_conversation(self):
+        """
+        Mean irony probabilities per conversation
 
         Returns:
-            filename_irony (str): Filename output
+            grouped_irony_df (pd.DataFrame): ironic and not_ironic means indexed by the last message time, None without data
         """
         if self.irony_df.empty:
-            print("No irony data to plot.")
+            logger.debug("No irony data to plot")
             return None
-        
-        # Path definition
-        filename_irony = f'irony_evolution.png'
-        temp_file_path = os.path.join(self.image_dir, filename_irony)
 
         # Data cleaning
-        self.irony_df['timestamp'] = pd.to_datetime(self.irony_df['timestamp'], errors='coerce')
-        self.irony_df.dropna(subset=['timestamp'], inplace=True)
+        irony_df = self.irony_df.dropna(subset=['timestamp'])
 
         # Check enough data
-        if self.irony_df.empty:
-            print("No valid irony data after cleaning.")
+        if irony_df.empty:
+            logger.debug("No valid irony data after cleaning")
             return None
 
         # Group by conversation
-        grouped_irony_df = self.irony_df.groupby('conversation_id').agg({
+        grouped_irony_df = irony_df.groupby('conversation_id', observed=True).agg({
             'ironic': 'mean',
             'not_ironic': 'mean',
             'timestamp': 'max'
-        }).reset_index()
+        })
 
         # Check empty
         if grouped_irony_df.empty:
-            print("No data to plot after grouping.")
+            logger.debug("No data to plot after grouping")
             return None
+        return grouped_irony_df.set_index('timestamp').sort_index()
+
+    def plot_irony_evolution(self):
+        """
+        Generate a plot with irony evolution in time
 
-        fig, ax = plt.subplots(figsize=(10, 6))
+        Returns:
+            png (bytes): PNG image, None without data
+        """
+        grouped_irony_df = self.irony_by_conversation()
+        if grouped_irony_df is None:
+            return None
+
+        fig, ax = new_figure()
         width = 0.35  
-        x = np.arange(len(grouped_irony_df['conversation_id']))
+        x = np.arange(len(grouped_irony_df))
         ax.bar(x - width/2, grouped_irony_df['ironic'], width=width, label='Ironic', color='green')
         ax.bar(x + width/2, grouped_irony_df['not_ironic'], width=width, label='Not Ironic', color='orange')
         ax.set_xlabel('Conversation ID')
         ax.set_ylabel('Probability')
         ax.set_xticks(x)
-        ax.set_xticklabels(grouped_irony_df['timestamp'].dt.strftime('%Y-%m-%d'), rotation=45, ha='right')
+        ax.set_xticklabels(grouped_irony_df.index.strftime('%Y-%m-%d'), rotation=45, ha='right')
         ax.legend(loc='upper right')
-        fig.savefig(temp_file_path, format='png')
-        plt.close(fig)
 
-        return filename_irony
-    
+        return figure_png(fig)
+
     #### TO CHECK EVERYHING IS WORKING -> Also uncomment its use in analyics page (app.py)
 
     # def save_all_dfs_to_excel(self, base_path):
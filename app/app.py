@@ -1,17 +1,20 @@
 # -*- coding: utf-8 -*-
 # Local imports
+import importlib
+import json
 import random
-from datetime import timedelta
+from datetime import datetime, timedelta
 import os
 import time
 
 # Third party imports
-from flask import Flask, render_template, redirect, request, url_for, session, jsonify, flash, send_from_directory, abort
+from flask import Flask, Response, g, render_template, redirect, request, url_for, session, jsonify, flash, abort, stream_with_context
 from flask_bcrypt import Bcrypt
 from flask import flash
 from bson import ObjectId
 from dotenv import load_dotenv
 from pymongo import MongoClient
+from pymongo.errors import DuplicateKeyError
 import pymongo
 import shutil
 import os
@@ -19,12 +22,23 @@ import os
 TF_ENABLE_ONEDNN_OPTS=0
 
 # Project imports
+from app.chart_cache import ChartCache, chart_etag
 from app.chatbot import Chatbot
-from app.feature_extraction import feature_extraction
-from app.settings import *
-from app.analytics import *
+from app.db_indexes import bootstrap_indexes
+from app.feature_extraction import empty_features, extractor, feature_extraction, inference_client
+from app.model_registry import registry
+from app.pipeline import PERSIST_ASYNC, stage_executor, writer
+from app.sessions import ConversationStore
+from app.settings import get_user_settings
+from app.telemetry import REQUEST_SECONDS, Trace, current_trace, get_logger, in_context, metrics, timed
+from app.warmup import WARMUP_MODELS, warmup
 
 load_dotenv()
+logger = get_logger(__name__)
+
+# Requests that log the time of each of their stages
+TRACED_PREFIXES = ('/chat', '/analytics', '/api/analytics')
+
 # Flask app configuration
 app = Flask(__name__)
 
@@ -35,19 +49,138 @@ app.config['SESSION_PERMANENT'] = True
 app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(minutes=60)
 app.permanent_session_lifetime = timedelta(minutes=60)
 
-# Database configuration
+# Database configuration, the client connects on its first operation so importing the app doesn't wait for Mongo
 bcrypt = Bcrypt(app)
-client = MongoClient(uri,server_api=pymongo.server_api.ServerApi(version="1", strict=True, deprecation_errors=True) )
+client = MongoClient(uri, connect=False, server_api=pymongo.server_api.ServerApi(version="1", strict=True, deprecation_errors=True))
 db = client['procstop']
 
-# Temporal directory
-analytics_dir = os.path.join(os.getcwd(), 'analytics')
-if not os.path.exists(analytics_dir):
-    os.makedirs(analytics_dir)
+# Rendered analytics charts
+chart_cache = ChartCache()
+
+# Chatbot initialization, one chatbot per logged in session
+conversations = ConversationStore(db, lambda: Chatbot(api_key=app.config["API_KEY"], language = 'ES', model = "gpt-4", db = db))
+
+def models_ready():
+    """
+    Check whether the feature extraction models can serve without loading anything, in this process
+    or in the inference server. The inference server is asked over its socket, down or slow to answer
+    counts as not ready.
+    """
+    if inference_client is None:
+        return registry.is_loaded()
+    try:
+        return inference_client.ping()['ready']
+    except (OSError, EOFError, TimeoutError, RuntimeError) as e:
+        logger.warning("Inference server not reachable", extra={'error': str(e)})
+        return False
+
+def warmup_tasks(models=True, before_fork=False):
+    """
+    Startup work that used to block the import of the app or stall the first requests
+
+    Args:
+        models (bool): Load the models and run a first inference
+        before_fork (bool): Only the tasks that are safe in a gunicorn master before it forks the workers: no Mongo
+            operations and no inference thread pools. ONNX Runtime sessions are left to the workers too.
+
+    Return:
+        tasks (list): (name, callable) pairs for the warm-up
+    """
+    tasks = []
+    # Indexes of the login, signup, analytics and delete queries
+    if os.getenv("CREATE_INDEXES", "1") == "1" and not before_fork:
+        tasks.append(('indexes', lambda: bootstrap_indexes(db)))
+    # With an inference server the models are loaded there
+    if models and inference_client is None and not (before_fork and registry.backend == 'onnx'):
+        tasks.append(('models', registry.load_all))
+        if not before_fork:
+            tasks.append(('inference', lambda: extractor.extract("Hola, ¿qué tal estás hoy?")))
+    # pandas and matplotlib are only imported by the analytics routes
+    tasks.append(('analytics', lambda: importlib.import_module('app.analytics')))
+    return tasks
+
+# Startup work runs in the background, or before serving with PRELOAD_MODELS=1.
+# gunicorn.conf.py turns it off and runs it in the master before fork and then in each worker.
+if os.getenv("WARMUP_ON_IMPORT", "1") == "1":
+    if os.getenv("PRELOAD_MODELS", "0") == "1":
+        warmup.run(warmup_tasks())
+    else:
+        warmup.start(warmup_tasks(models=WARMUP_MODELS))
+
+def session_chatbot():
+    """
+    Get the chatbot of the current session
+
+    Return:
+        chatbot (Chatbot): Session chatbot, None if the session has no conversation
+    """
+    if 'user_id' not in session or 'conversation_id' not in session:
+        return None
+    return conversations.get(session['user_id'], session['conversation_id'])
 
-# Chatbot initialization
-procstop = Chatbot(api_key=app.config["API_KEY"], language = 'ES', model = "gpt-4", db = db)
-analyzer = DataAnalyzer(db=db, conversation_id=procstop.conversation_id, image_dir=analytics_dir)
+def request_time_range():
+    """
+    Time window of an analytics request from its ?from= and ?to= ISO dates or times. A date alone in 'to'
+    includes that whole day.
+
+    Return:
+        start, end (datetime): Window limits, None when not given
+    """
+    try:
+        start = datetime.fromisoformat(request.args['from']) if request.args.get('from') else None
+        end = datetime.fromisoformat(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        abort(400, description="Invalid date, use YYYY-MM-DD or YYYY-MM-DDTHH:MM:SS")
+    if end is not None and len(request.args['to']) == 10:
+        end = end.replace(hour=23, minute=59, second=59, microsecond=999000)
+    return start, end
+
+def session_analyzer():
+    """
+    Build the data analyzer of the current session user, limited to the request's time window
+
+    Return:
+        analyzer (DataAnalyzer): Analyzer of the logged in user
+    """
+    from app.analytics import DataAnalyzer
+
+    start, end = request_time_range()
+    analyzer = DataAnalyzer(db=db, conversation_id=session.get('conversation_id'), start=start, end=end)
+    analyzer.user_id = ObjectId(session['user_id'])
+    analyzer.username = session.get('username')
+    return analyzer
+
+@app.before_request
+def start_trace():
+    """
+    Start the stage trace of chat and analytics requests
+    """
+    g.request_start = time.perf_counter()
+    g.trace = Trace(request.url_rule.rule if request.url_rule else request.path) if request.path.startswith(TRACED_PREFIXES) else None
+    current_trace.set(g.trace)
+
+@app.after_request
+def finish_trace(response):
+    """
+    Record the request time once its body is sent, streamed replies included, and log the stage timings
+    """
+    start = g.get('request_start', time.perf_counter())
+    trace = g.get('trace')
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    method = request.method
+    status = response.status_code
+
+    def finish():
+        seconds = time.perf_counter() - start
+        REQUEST_SECONDS.observe(seconds, route=route, method=method, status=status)
+        if trace is not None:
+            logger.info("Request served", extra={'route': route, 'method': method, 'status': status,
+                                                 'duration_ms': round(seconds * 1000, 2), 'stages_ms': trace.timings_ms()})
+        current_trace.set(None)
+        metrics.flush()
+
+    response.call_on_close(finish)
+    return response
 
 def hash_password(password):
     """
@@ -88,14 +221,10 @@ def login():
         if user and bcrypt.check_password_hash(user['password'], password):
             session['username'] = username
             session['user_id'] = str(user['_id'])
-            procstop.user_id = ObjectId(user['_id'])
-            analyzer.user_id = procstop.user_id
-            procstop.username = username
-            analyzer.username = username
-            print(f' -----> Username {username}\nUser_ID: {procstop.user_id}')
-            procstop.gender = str(user['gender'])
+            logger.info("User logged in", extra={'user_id': str(user['_id'])})
             session.pop('login_attempts', None)
-            procstop.start_conver()
+            chatbot = conversations.start(user)
+            session['conversation_id'] = str(chatbot.conversation_id)
             return redirect(url_for('chatbot'))
         else:
             session['login_attempts'] += 1
@@ -144,17 +273,21 @@ def signup():
         # Password hassing
         hashed_password = hash_password(password)
 
-        # User registration in mongo
-        db.users.insert_one({
-            'fullname': fullname, 
-            'email': email, 
-            'username': username,
-            'password': hashed_password,
-            'age': age,
-            'gender': gender,
-            'country': country,
-            'language': 'Español'
-        })
+        # User registration in mongo, the unique indexes catch concurrent signups with the same username or email
+        try:
+            db.users.insert_one({
+                'fullname': fullname, 
+                'email': email, 
+                'username': username,
+                'password': hashed_password,
+                'age': age,
+                'gender': gender,
+                'country': country,
+                'language': 'Español'
+            })
+        except DuplicateKeyError:
+            flash('El nombre de usuario o el correo electrónico ya están registrados.', 'error')
+            return render_template('signup.html', error="Usuario ya existe", form_data=form_data)
         
       # Login redirection
         flash('Registro exitoso. Por favor, inicie sesión.', 'success')
@@ -192,35 +325,108 @@ def chat():
     """
     Chatbot backend to get responses and analyze user's input messages
     """
-    # User definition
-    username = session.get('username')
-    if procstop.user_id is None:
-        procstop.user_id = username
+    # Session chatbot
+    procstop = session_chatbot()
+    if procstop is None:
+        return jsonify({"error": "Session expired, please log in again."}), 401
 
     # Input message form
     user_message = request.json.get("message")
     if not user_message:
         return jsonify({"error": "No message provided"}), 400
 
-    # Input message processing
+    # Input message processing, the five extractors run concurrently
     features_dict = feature_extraction(user_message)
 
-    # Update conversation context
-    procstop.update_context(features_dict)
+    # Response message from procstop with exceptions, messages of a session are answered one at a time
+    with procstop.lock:
+        # Update conversation context
+        with timed("context_update"):
+            procstop.update_context(features_dict)
+        try:
+            response = procstop.get_response(user_message)
+        except TimeoutError:
+            return jsonify({"error": "The chatbot service is temporarily unavailable. Please try again later."}), 503
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except Exception as e:
+            return jsonify({"error": "An unexpected error occurred: " + str(e)}), 500
+
+    # Save conversation data to mongo, in the background unless disabled
+    if PERSIST_ASYNC:
+        writer.submit(procstop.save_conver, db, user_message, response, features_dict, conversation_id=procstop.conversation_id, timestamp=datetime.now())
+        return jsonify({"reply": response, "update_status": "queued"})
+    message_id = procstop.save_conver(db, user_message, response, features_dict)
+    return jsonify({"reply": response, "update_status": int(message_id is not None)})
+
+def sse_event(event, payload):
+    """
+    Format a server-sent event
 
-    # Response message from procstop with exceptions
-    try:
-        response = procstop.get_response(user_message)
-    except TimeoutError:
-        return jsonify({"error": "The chatbot service is temporarily unavailable. Please try again later."}), 503
-    except ValueError as e:
-        return jsonify({"error": str(e)}), 400
-    except Exception as e:
-        return jsonify({"error": "An unexpected error occurred: " + str(e)}), 500
+    Args:
+        event (str): Event name
+        payload (dict): Event data, sent as JSON
+    """
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
 
-    # Save conversation data to mongo
-    update_result = procstop.save_conver(db, user_message, response, features_dict)
-    return jsonify({"reply": response, "update_status": update_result.modified_count})
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    """
+    Streaming chatbot backend, sends the reply as server-sent events while it is generated.
+    The user's message is analysed alongside the stream, so the reply uses the context of the previous
+    messages and the new features are added to the context once the stream ends.
+    """
+    # Session chatbot
+    procstop = session_chatbot()
+    if procstop is None:
+        return jsonify({"error": "Session expired, please log in again."}), 401
+
+    # Input message form
+    user_message = request.json.get("message")
+    if not user_message:
+        return jsonify({"error": "No message provided"}), 400
+
+    # Input message processing alongside the response
+    features_future = stage_executor.submit(in_context(feature_extraction), user_message)
+
+    def generate():
+        tokens = []
+        with procstop.lock:
+            try:
+                for token in procstop.stream_response(user_message):
+                    tokens.append(token)
+                    yield sse_event('token', {'token': token})
+            except TimeoutError:
+                yield sse_event('error', {'error': "The chatbot service is temporarily unavailable. Please try again later."})
+                return
+            except Exception as e:
+                yield sse_event('error', {'error': "An unexpected error occurred: " + str(e)})
+                return
+            response = ''.join(tokens)
+
+            # Update conversation context. The reply is already on screen, so a failed analysis
+            # only loses the features of this message and the message is saved without them.
+            try:
+                features_dict = features_future.result()
+            except Exception:
+                logger.exception("Feature extraction failed, message saved without features",
+                                 extra={'conversation_id': str(procstop.conversation_id)})
+                features_dict = empty_features()
+                # The message still takes a seq, it must not be replayed into this chatbot later
+                procstop.applied_seq += 1
+            else:
+                with timed("context_update"):
+                    procstop.update_context(features_dict)
+
+        # Save conversation data to mongo
+        if PERSIST_ASYNC:
+            writer.submit(procstop.save_conver, db, user_message, response, features_dict, conversation_id=procstop.conversation_id, timestamp=datetime.now())
+        else:
+            procstop.save_conver(db, user_message, response, features_dict)
+        yield sse_event('done', {'reply': response})
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
 
 @app.route('/settings', methods=['GET', 'POST'])
 def settings():
@@ -264,7 +470,11 @@ def settings():
             update_data['password'] = hashed_password
 
         # User data update in mongo
-        db.users.update_one({'_id': ObjectId(user_id)}, {'$set': update_data})
+        try:
+            db.users.update_one({'_id': ObjectId(user_id)}, {'$set': update_data})
+        except DuplicateKeyError:
+            flash('El nombre de usuario ya está en uso. Elige otro.', 'danger')
+            return redirect(url_for('settings'))
 
         flash('Cambios actualizados con éxito.', 'success')
         return redirect(url_for('settings'))
@@ -286,8 +496,10 @@ def delete_user_data():
             flash('Usuario no encontrado en la sesión.', 'error')
             return redirect(url_for('settings'))
 
-        # Delete all convers related to user
-        result = db.conversations.delete_many({'user_id': user_id})
+        # Delete all convers related to user, with their messages
+        result = db.conversations.delete_many({'user_id': ObjectId(user_id)})
+        db.messages.delete_many({'user_id': ObjectId(user_id)})
+        db.analytics_rollups.delete_many({'user_id': ObjectId(user_id)})
 
         # Count deleted convers
         if result.deleted_count > 0:
@@ -314,11 +526,13 @@ def delete_user_account():
             flash('Usuario no encontrado en la sesión.', 'error')
             return redirect(url_for('settings'))
 
-        # Delete all conversations
-        db.conversations.delete_many({'user_id': user_id})
+        # Delete all conversations and messages
+        db.conversations.delete_many({'user_id': ObjectId(user_id)})
+        db.messages.delete_many({'user_id': ObjectId(user_id)})
+        db.analytics_rollups.delete_many({'user_id': ObjectId(user_id)})
 
         # Delete user
-        user_result = db.users.delete_one({'_id': user_id})
+        user_result = db.users.delete_one({'_id': ObjectId(user_id)})
 
         # Deletion verification
         if user_result.deleted_count == 1:
@@ -328,7 +542,7 @@ def delete_user_account():
             return redirect(url_for('settings'))
 
         session.clear()
-        return redirect(url_for('index'))
+        return redirect(url_for('welcome'))
 
     except Exception as e:
         flash(f'Ocurrió un error: {str(e)}', 'error')
@@ -345,153 +559,150 @@ def logout():
     return redirect(url_for('welcome'))
 
 ### Plot functions
-# Emotion Pie Chart
-@app.route('/analytics/emotion_pie.png')
-def emotion_pie_chart():
-    filename = analyzer.plot_emotion_pie_chart()
+def analytics_response(key, build):
+    """
+    Serve an analytics resource of the session user. Its ETag only changes with the user's data,
+    so browsers revalidate it instead of downloading it again.
 
-    full_path = os.path.abspath(os.path.join(analytics_dir, filename))
-    print(f"Full path: {full_path}")
+    Args:
+        key (str): Resource name, part of the ETag
+        build (callable): Builds the response from the analyzer and data version, None without data
 
-    if not filename or not os.path.exists(full_path):
-        print("File not found or not generated.")
-        return abort(404, description="File not found or not generated")
+    Return:
+        response (Response): Resource, 304 if the browser already has it
+    """
+    if 'user_id' not in session:
+        return abort(401)
+    analyzer = session_analyzer()
+    version = analyzer.data_version()
+    etag = chart_etag(session['user_id'], key, version)
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = build(analyzer, version)
+        if response is None:
+            logger.debug("Analytics not generated, no data", extra={'resource': key})
+            return abort(404, description="File not found or not generated")
+
+    response.set_etag(etag)
+    # Page links carry the data version, those urls never change content
+    if request.args.get('v') == version:
+        response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    else:
+        response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def chart_response(chart):
+    """
+    Serve a chart of the session user as PNG, rendered once per data version and kept in memory
 
-    try:
-        return send_from_directory(os.path.abspath(analytics_dir), filename)
-    except Exception as e:
-        print(f"Error serving file: {e}")
-        return abort(500, description="Error serving file")
+    Args:
+        chart (str): Key of CHARTS
+    """
+    def build(analyzer, version):
+        def render():
+            if not analyzer.get_history():
+                return None
+            return analyzer.plot(chart)
 
+        png = chart_cache.get_or_render((session['user_id'], chart, version), render)
+        return Response(png, mimetype='image/png') if png is not None else None
 
-# Emotion Evolution Plot
-@app.route('/analytics/emotion_evolution.png')
-def emotion_evolution():
-    filename = analyzer.plot_emotion_evolution_over_time()
+    return analytics_response(chart, build)
 
-    full_path = os.path.abspath(os.path.join(analytics_dir, filename))
-    print(f"Full path: {full_path}")
+@app.route('/api/analytics/<chart>')
+def analytics_api(chart):
+    """
+    Aggregated series of a chart of the session user, rendered by the browser
+    """
+    from app.analytics import CHARTS
 
-    if not filename or not os.path.exists(full_path):
-        print("File not found or not generated.")
-        return abort(404, description="File not found or not generated")
+    if chart not in CHARTS:
+        return abort(404, description="Unknown chart")
 
-    try:
-        return send_from_directory(os.path.abspath(analytics_dir), filename)
-    except Exception as e:
-        print(f"Error serving file: {e}")
-        return abort(500, description="Error serving file")
+    def build(analyzer, version):
+        if not analyzer.get_history():
+            return None
+        data = analyzer.chart_data(chart)
+        return jsonify({**data, 'version': version}) if data is not None else None
+
+    return analytics_response(f"{chart}.json", build)
 
+# Emotion Pie Chart
+@app.route('/analytics/emotion_pie.png')
+def emotion_pie_chart():
+    return chart_response('emotion_pie')
+
+# Emotion Evolution Plot
+@app.route('/analytics/emotion_evolution.png')
+def emotion_evolution():
+    return chart_response('emotion_evolution')
 
 # Sentiments Over Time Plot
 @app.route('/analytics/sentiments.png')
 def sentiments_plot():
-    filename = analyzer.plot_sentiments_over_time()
-
-    full_path = os.path.abspath(os.path.join(analytics_dir, filename))
-    print(f"Full path: {full_path}")
-
-    if not filename or not os.path.exists(full_path):
-        print("File not found or not generated.")
-        return abort(404, description="File not found or not generated")
-
-    try:
-        return send_from_directory(os.path.abspath(analytics_dir), filename)
-    except Exception as e:
-        print(f"Error serving file: {e}")
-        return abort(500, description="Error serving file")
-
+    return chart_response('sentiments')
 
 # Most Positive Entities Plot
 @app.route('/analytics/most_positive_entities.png')
 def most_positive_entities():
-    filename = analyzer.plot_most_positive_entities()
-
-    full_path = os.path.abspath(os.path.join(analytics_dir, filename))
-    print(f"Full path: {full_path}")
-
-    if not filename or not os.path.exists(full_path):
-        print("File not found or not generated.")
-        return abort(404, description="File not found or not generated")
-
-    try:
-        return send_from_directory(os.path.abspath(analytics_dir), filename)
-    except Exception as e:
-        print(f"Error serving file: {e}")
-        return abort(500, description="Error serving file")
-
+    return chart_response('most_positive_entities')
 
 # Least Positive Entities Plot
 @app.route('/analytics/least_positive_entities.png')
 def least_positive_entities():
-    filename = analyzer.plot_least_positive_entities()
-
-    full_path = os.path.abspath(os.path.join(analytics_dir, filename))
-    print(f"Full path: {full_path}")
-
-    if not filename or not os.path.exists(full_path):
-        print("File not found or not generated.")
-        return abort(404, description="File not found or not generated")
-
-    try:
-        return send_from_directory(os.path.abspath(analytics_dir), filename)
-    except Exception as e:
-        print(f"Error serving file: {e}")
-        return abort(500, description="Error serving file")
-
+    return chart_response('least_positive_entities')
 
 # Hate Speech Evolution Plot
 @app.route('/analytics/hate_evolution.png')
 def hate_speech_evolution():
-    filename = analyzer.plot_hate_speech_evolution()
-
-    full_path = os.path.abspath(os.path.join(analytics_dir, filename))
-    print(f"Full path: {full_path}")
-
-    if not filename or not os.path.exists(full_path):
-        print("File not found or not generated.")
-        return abort(404, description="File not found or not generated")
-
-    try:
-        return send_from_directory(os.path.abspath(analytics_dir), filename)
-    except Exception as e:
-        print(f"Error serving file: {e}")
-        return abort(500, description="Error serving file")
-
+    return chart_response('hate_evolution')
 
 # Irony Evolution Plot
 @app.route('/analytics/irony_evolution.png')
 def irony_evolution():
-    filename = analyzer.plot_irony_evolution()
-
-    full_path = os.path.abspath(os.path.join(analytics_dir, filename))
-    print(f"Full path: {full_path}")
+    return chart_response('irony_evolution')
 
-    if not filename or not os.path.exists(full_path):
-        print("File not found or not generated.")
-        return abort(404, description="File not found or not generated")
+@app.route('/healthz')
+def healthz():
+    """
+    Liveness probe, the process answers requests
+    """
+    return jsonify({'status': 'ok'})
 
-    try:
-        return send_from_directory(os.path.abspath(analytics_dir), filename)
-    except Exception as e:
-        print(f"Error serving file: {e}")
-        return abort(500, description="Error serving file")
+@app.route('/readyz')
+def readyz():
+    """
+    Readiness probe, ready once the models are resident and the first /chat won't stall loading them
+    """
+    ready = models_ready()
+    body = {'status': 'ready' if ready else 'starting', 'models': ready, 'warmup': warmup.status()}
+    return jsonify(body), 200 if ready else 503
 
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Request and stage latency histograms in the Prometheus text format
+    """
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
 
 @app.route('/analytics')
 def analytics_page():
-    analyzer.get_history()  # Cargar la historia del usuario antes de renderizar la página
-    # analyzer.save_all_dfs_to_excel(analytics_dir)
-    return render_template('analytics.html', analyzer=analyzer)
+    if 'user_id' not in session:
+        return redirect(url_for('login'))
+    # Charts are loaded by the page, it only needs the data version and time window for their urls
+    analyzer = session_analyzer()
+    range_args = {name: request.args[name] for name in ('from', 'to') if request.args.get(name)}
+    return render_template('analytics.html', version=analyzer.data_version(), range_args=range_args)
 
 if __name__ == '__main__':
     try:
         port = int(os.environ.get('PORT', 8000))
         host = os.environ.get('HOST', '0.0.0.0')
-        print(f"App running at http://{host}:{port}")
+        logger.info("App running", extra={'url': f"http://{host}:{port}"})
         app.run(debug=True,host=host, port=port)
     except OSError as e:
         if e.winerror == 10038:
-            print("Attempted operation on an invalid socket.")
+            logger.error("Attempted operation on an invalid socket.")
         else:
             raise e
\ No newline at end of file
@@ -0,0 +1,163 @@
+# Local imports
+import argparse
+import json
+import multiprocessing
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Spanish sample messages used when no corpus file is given
+SAMPLE_MESSAGES = [
+    "Hoy me siento muy bien, he ido a correr por el Retiro con Marta.",
+    "No sé qué hacer con mi vida, estoy agotado.",
+    "Mi jefe de Telefónica me ha vuelto a gritar delante de todos.",
+    "Qué maravilla, otra vez lloviendo en Santiago de Compostela...",
+    "Estoy nerviosa por el examen de mañana en la Universidad Complutense.",
+    "Me encanta pasar tiempo con mi abuela en Sevilla.",
+    "Odio tener que madrugar todos los lunes.",
+    "jaja sí claro, como si eso fuera a funcionar",
+    "bien",
+    "mal",
+    "no sé",
+    "Llevo tres días sin dormir bien y no consigo concentrarme.",
+    "He quedado con Pedro y Lucía para cenar en Barcelona el sábado.",
+    "La verdad es que el trabajo en Inditex me tiene bastante quemado.",
+    "Tengo miedo de no encontrar trabajo después de acabar el máster.",
+    "Estoy muy orgulloso de mi hermano, ha ganado el campeonato.",
+    "Otra vez he dejado todo para el último momento.",
+    "Me da asco cómo tratan a los animales en algunas granjas.",
+    "¡Qué sorpresa! No esperaba que me llamaras.",
+    "Siento que nadie me escucha en casa.",
+]
+
+def run_backend(backend, messages):
+    """
+    Run the feature extraction of every message with one backend. Meant to run in its own process,
+    so the memory measurements of different backends don't mix.
+
+    Args:
+        backend (str): Inference backend
+        messages (list): Messages to analyse
+
+    Returns:
+        result (dict): Features of each message, latencies and resident memory
+    """
+    import psutil
+    from app.model_registry import ModelRegistry
+    from app.feature_extraction import FeatureExtractor
+
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    start = time.perf_counter()
+    models = ModelRegistry(backend=backend)
+    models.load_all()
+    load_seconds = time.perf_counter() - start
+
+    extractor = FeatureExtractor(models=models, parallel=False)
+    extractor.extract(messages[0])
+
+    features, latencies = [], []
+    for message in messages:
+        start = time.perf_counter()
+        features.append(extractor.extract(message))
+        latencies.append(time.perf_counter() - start)
+
+    return {
+        'backend': backend,
+        'features': features,
+        'load_seconds': load_seconds,
+        'latencies': latencies,
+        'rss_mb': (process.memory_info().rss - rss_before) / 2**20
+    }
+
+def compare_features(reference, candidate):
+    """
+    Accuracy delta of a backend against the fp32 reference
+
+    Args:
+        reference (list): features_dicts of the reference backend
+        candidate (list): features_dicts of the compared backend
+
+    Returns:
+        delta (dict): Per head probability deltas and top label agreement, and entity agreement
+    """
+    delta = {}
+    for key in ('emotion', 'sentiment', 'hate', 'irony'):
+        diffs, agreements = [], []
+        for ref, cand in zip(reference, candidate):
+            diffs.extend(abs(ref[key][label] - cand[key].get(label, 0)) for label in ref[key])
+            agreements.append(max(ref[key], key=ref[key].get) == max(cand[key], key=cand[key].get))
+        delta[key] = {
+            'max_abs_diff': max(diffs),
+            'mean_abs_diff': statistics.fmean(diffs),
+            'top_label_agreement': sum(agreements) / len(agreements)
+        }
+    entity_matches = [ref['entities'] == cand['entities'] for ref, cand in zip(reference, candidate)]
+    delta['entities'] = {'exact_match_rate': sum(entity_matches) / len(entity_matches)}
+    return delta
+
+def build_report(backends, messages):
+    """
+    Run every backend and compare it with the fp32 'torch' backend
+
+    Args:
+        backends (list): Backends to compare
+        messages (list): Messages to analyse
+
+    Returns:
+        report (dict): Latency, memory and accuracy delta of each backend
+    """
+    results = {}
+    context = multiprocessing.get_context('spawn')
+    for backend in ['torch'] + [backend for backend in backends if backend != 'torch']:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            results[backend] = executor.submit(run_backend, backend, messages).result()
+
+    reference = results['torch']
+    report = {'messages': len(messages), 'backends': {}}
+    for backend, result in results.items():
+        latencies = sorted(result['latencies'])
+        report['backends'][backend] = {
+            'load_seconds': result['load_seconds'],
+            'latency_p50_ms': statistics.median(latencies) * 1000,
+            'latency_mean_ms': statistics.fmean(latencies) * 1000,
+            'speedup_vs_torch': statistics.fmean(reference['latencies']) / statistics.fmean(latencies),
+            'rss_mb': result['rss_mb'],
+            'accuracy_delta': compare_features(reference['features'], result['features'])
+        }
+    return report
+
+def print_report(report):
+    """
+    Print the report as a markdown table
+
+    Args:
+        report (dict): Output of build_report
+    """
+    print(f"Messages analysed: {report['messages']}\n")
+    print("| Backend | p50 (ms) | Speedup | RSS (MB) | Emotion agree | Sentiment agree | Hate max diff | Irony agree | Entities match |")
+    print("|---|---|---|---|---|---|---|---|---|")
+    for backend, row in report['backends'].items():
+        delta = row['accuracy_delta']
+        print(f"| {backend} | {row['latency_p50_ms']:.1f} | {row['speedup_vs_torch']:.2f}x | {row['rss_mb']:.0f} "
+              f"| {delta['emotion']['top_label_agreement']:.1%} | {delta['sentiment']['top_label_agreement']:.1%} "
+              f"| {delta['hate']['max_abs_diff']:.3f} | {delta['irony']['top_label_agreement']:.1%} "
+              f"| {delta['entities']['exact_match_rate']:.1%} |")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Accuracy and latency delta of the inference backends against fp32")
+    parser.add_argument('--backends', nargs='+', default=['int8', 'onnx'], help="Backends compared with 'torch'")
+    parser.add_argument('--messages', help="Text file with one message per line, a Spanish sample is used by default")
+    parser.add_argument('--output', help="Path of the JSON report")
+    args = parser.parse_args()
+
+    messages = SAMPLE_MESSAGES
+    if args.messages:
+        with open(args.messages, encoding='utf-8') as f:
+            messages = [line.strip() for line in f if line.strip()]
+
+    report = build_report(args.backends, messages)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
\ No newline at end of file
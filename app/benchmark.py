@@ -0,0 +1,395 @@
+# Local imports
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+
+# Project imports
+from app.backend_report import SAMPLE_MESSAGES
+
+# Benchmarks run by default, each one in its own process so their peak memory doesn't mix
+BENCHMARKS = ('feature_extraction', 'context', 'save_conver', 'analytics')
+
+# Labels of the synthetic features, the same ones the pysentimiento models return
+EMOTION_LABELS = ('others', 'joy', 'sadness', 'anger', 'surprise', 'disgust', 'fear')
+ENTITY_NAMES = {
+    'people': ('Marta', 'Pedro', 'Lucía', 'Ana', 'Javier', 'Carmen'),
+    'places': ('Madrid', 'Sevilla', 'Barcelona', 'Santiago de Compostela', 'Valencia'),
+    'orgs': ('Telefónica', 'Inditex', 'Universidad Complutense', 'Renfe'),
+    'others': ('Netflix', 'Champions')
+}
+
+def distribution(rng, labels):
+    """
+    Random probability distribution over some labels
+
+    Args:
+        rng (Random): Seeded random generator
+        labels (tuple): Label names
+    """
+    weights = [rng.random() for _ in labels]
+    total = sum(weights)
+    return {label: weight / total for label, weight in zip(labels, weights)}
+
+def synthetic_features(rng):
+    """
+    Random features_dict with the shape of feature_extraction's output
+
+    Args:
+        rng (Random): Seeded random generator
+    """
+    return {
+        'emotion': distribution(rng, EMOTION_LABELS),
+        'entities': {category: rng.sample(names, rng.randint(0, 2)) for category, names in ENTITY_NAMES.items()},
+        'sentiment': distribution(rng, ('POS', 'NEU', 'NEG')),
+        'hate': {'hateful': rng.random() * 0.2, 'targeted': rng.random() * 0.1, 'aggressive': rng.random() * 0.1},
+        'irony': distribution(rng, ('ironic', 'not ironic'))
+    }
+
+def latency_stats(latencies, wall_seconds=None):
+    """
+    Percentiles and throughput of a list of timings
+
+    Args:
+        latencies (list): Seconds of each operation
+        wall_seconds (float): Total time of the run, the sum of the latencies by default
+
+    Returns:
+        stats (dict): Count, p50/p95/p99 and mean in milliseconds, and operations per second
+    """
+    ordered = sorted(latencies)
+
+    def percentile(q):
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))] * 1000
+
+    wall_seconds = wall_seconds if wall_seconds is not None else sum(ordered)
+    return {
+        'n': len(ordered),
+        'p50_ms': percentile(0.50),
+        'p95_ms': percentile(0.95),
+        'p99_ms': percentile(0.99),
+        'mean_ms': sum(ordered) / len(ordered) * 1000,
+        'throughput_per_s': len(ordered) / wall_seconds if wall_seconds > 0 else None
+    }
+
+def measure(func, iterations, *args):
+    """
+    Time a function over several calls
+
+    Args:
+        func (callable): Function to time, called with the iteration number and args
+        iterations (int): Calls
+
+    Returns:
+        stats (dict): Output of latency_stats
+    """
+    latencies = []
+    start = time.perf_counter()
+    for i in range(iterations):
+        call_start = time.perf_counter()
+        func(i, *args)
+        latencies.append(time.perf_counter() - call_start)
+    return latency_stats(latencies, time.perf_counter() - start)
+
+def peak_rss_mb():
+    """
+    Peak resident memory of the current process, None where the resource module isn't available
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+def open_database(mongo_uri=None):
+    """
+    Benchmark database, in memory with mongomock unless a Mongo URI is given
+
+    Args:
+        mongo_uri (str): URI of a local mongod, its 'procstop_benchmark' database is dropped first
+
+    Returns:
+        db (Database): Empty database with the app indexes
+    """
+    from app.db_indexes import ensure_indexes
+
+    if mongo_uri:
+        from pymongo import MongoClient
+        client = MongoClient(mongo_uri)
+    else:
+        try:
+            import mongomock
+        except ImportError as e:
+            raise ImportError("Benchmarks without --mongo-uri need mongomock installed.") from e
+        client = mongomock.MongoClient()
+    client.drop_database('procstop_benchmark')
+    db = client['procstop_benchmark']
+    ensure_indexes(db)
+    return db
+
+def stub_chatbot(db):
+    """
+    Chatbot answered by the local LLM backend without latency, so only the app code is measured
+    """
+    from app.chatbot import Chatbot
+    from app.llm_backends import LocalBackend
+
+    return Chatbot(api_key=None, language='ES', db=db, backend=LocalBackend(latency=0, tokens_per_second=0))
+
+def seed_users(db, rng, n_users, history):
+    """
+    Create synthetic users with a message history spread over the last days
+
+    Args:
+        db (Database): Benchmark database
+        rng (Random): Seeded random generator
+        n_users (int): Users to create
+        history (int): Messages saved per user
+
+    Returns:
+        user_ids (list): Ids of the created users
+    """
+    user_ids = []
+    start = datetime(2024, 1, 1, 9)
+    for n in range(n_users):
+        user_id = db.users.insert_one({'username': f'bench_{n}', 'email': f'bench_{n}@example.com', 'gender': 'Other'}).inserted_id
+        chatbot = stub_chatbot(db)
+        chatbot.user_id = user_id
+        chatbot.start_conver()
+        chatbot.start_time = start
+        for i in range(history):
+            # About ten messages a day, a new conversation every twenty messages
+            if i and i % 20 == 0:
+                chatbot.start_conver()
+                chatbot.start_time = start + timedelta(hours=i * 2.4)
+            message = rng.choice(SAMPLE_MESSAGES)
+            timestamp = start + timedelta(hours=i * 2.4, minutes=rng.randint(0, 59))
+            chatbot.save_conver(db, message, f"Respuesta {i}", synthetic_features(rng), timestamp=timestamp)
+        user_ids.append(user_id)
+    return user_ids
+
+def bench_feature_extraction(params, rng):
+    """
+    Uncached feature extraction of single messages, with the models loaded before timing
+    """
+    from app.feature_cache import normalize_text
+    from app.feature_extraction import extract_features, extractor, inference_client
+
+    start = time.perf_counter()
+    if inference_client is None:
+        extractor.models.load_all()
+    load_seconds = time.perf_counter() - start
+
+    messages = [normalize_text(message) for message in SAMPLE_MESSAGES]
+    extract_features(messages[0])
+    stats = measure(lambda i: extract_features(messages[i % len(messages)]), params['iterations'])
+    return {'feature_extraction': stats, 'model_load_seconds': load_seconds}
+
+def bench_context(params, rng):
+    """
+    Context update and prompt build of a conversation, and a full reply with the stubbed LLM
+    """
+    chatbot = stub_chatbot(db=None)
+    features = [synthetic_features(rng) for _ in range(params['iterations'])]
+    messages = [rng.choice(SAMPLE_MESSAGES) for _ in range(params['iterations'])]
+    return {
+        'update_context': measure(lambda i: chatbot.update_context(features[i]), params['iterations']),
+        'get_system_role': measure(lambda i: chatbot.get_system_role(), params['iterations']),
+        'get_response': measure(lambda i: chatbot.get_response(messages[i]), params['iterations'])
+    }
+
+def bench_save_conver(params, rng):
+    """
+    Message writes of a conversation whose user already has a history, header, message and rollup included
+    """
+    db = open_database(params['mongo_uri'])
+    user_id = seed_users(db, rng, 1, params['history'])[0]
+    chatbot = stub_chatbot(db)
+    chatbot.user_id = user_id
+    chatbot.start_conver()
+    features = [synthetic_features(rng) for _ in range(params['iterations'])]
+    messages = [rng.choice(SAMPLE_MESSAGES) for _ in range(params['iterations'])]
+    return {'save_conver': measure(lambda i: chatbot.save_conver(db, messages[i], "Respuesta", features[i]), params['iterations'])}
+
+def bench_analytics(params, rng):
+    """
+    History load in every analytics mode and the render of every chart, over synthetic users
+    """
+    from bson import ObjectId
+    from app.analytics import CHARTS, DataAnalyzer
+
+    db = open_database(params['mongo_uri'])
+    user_ids = seed_users(db, rng, params['users'], params['history'])
+    iterations = params['plot_iterations']
+
+    def analyzer_for(i):
+        analyzer = DataAnalyzer(db=db, conversation_id=ObjectId())
+        analyzer.user_id = user_ids[i % len(user_ids)]
+        return analyzer
+
+    results = {}
+    for mode in ('rollup', 'pipeline', 'python'):
+        results[f'get_history.{mode}'] = measure(lambda i: analyzer_for(i).get_history(mode), iterations)
+    results['data_version'] = measure(lambda i: analyzer_for(i).data_version(), iterations)
+
+    analyzers = []
+    for i in range(len(user_ids)):
+        analyzer = analyzer_for(i)
+        analyzer.get_history()
+        analyzers.append(analyzer)
+    for chart, (method, _) in CHARTS.items():
+        results[method] = measure(lambda i: getattr(analyzers[i % len(analyzers)], method)(), iterations)
+    return results
+
+def run_benchmark(name, params):
+    """
+    Run a benchmark, meant to run in its own process
+
+    Args:
+        name (str): Name in BENCHMARKS
+        params (dict): Benchmark parameters
+
+    Returns:
+        result (dict): Stats of each measured operation and peak memory of the process
+    """
+    rng = random.Random(params['seed'])
+    start = time.perf_counter()
+    results = globals()[f'bench_{name}'](params, rng)
+    return {'results': results, 'seconds': time.perf_counter() - start, 'peak_rss_mb': peak_rss_mb()}
+
+def git_commit():
+    """
+    Commit of the benchmarked code, None outside a git checkout
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def build_report(names, params):
+    """
+    Run the benchmarks, each one in a fresh process
+
+    Args:
+        names (list): Benchmarks to run
+        params (dict): Benchmark parameters
+
+    Returns:
+        report (dict): Environment, parameters and results of each benchmark
+    """
+    report = {
+        'commit': git_commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        # The URI may carry credentials, only the kind of database is reported
+        'params': {**{key: value for key, value in params.items() if key != 'mongo_uri'},
+                   'mongo': 'mongod' if params.get('mongo_uri') else 'mongomock'},
+        'benchmarks': {}
+    }
+    context = multiprocessing.get_context('spawn')
+    for name in names:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            try:
+                report['benchmarks'][name] = executor.submit(run_benchmark, name, params).result()
+            except Exception as e:
+                # e.g. the models of feature_extraction aren't installed, the other benchmarks still run
+                report['benchmarks'][name] = {'error': f"{type(e).__name__}: {e}", 'results': {}}
+    return report
+
+def compare_reports(baseline, report, max_regression):
+    """
+    Compare the p50 and p95 of every operation with a previous report
+
+    Args:
+        baseline (dict): Report of the reference commit
+        report (dict): Current report
+        max_regression (float): Allowed relative slowdown, 0.2 for 20%
+
+    Returns:
+        rows (list): (operation, metric, baseline ms, current ms, ratio, regressed)
+    """
+    rows = []
+    for name, benchmark in report['benchmarks'].items():
+        reference = baseline.get('benchmarks', {}).get(name, {}).get('results', {})
+        for operation, stats in benchmark['results'].items():
+            if not isinstance(stats, dict) or operation not in reference:
+                continue
+            for metric in ('p50_ms', 'p95_ms'):
+                before, after = reference[operation][metric], stats[metric]
+                ratio = after / before if before else float('inf')
+                rows.append((operation, metric, before, after, ratio, ratio > 1 + max_regression))
+    return rows
+
+def print_report(report, comparison=None):
+    """
+    Print the report as a markdown table
+
+    Args:
+        report (dict): Output of build_report
+        comparison (list): Output of compare_reports
+    """
+    print(f"Commit {report['commit']}, {report['cpus']} CPUs, params {json.dumps(report['params'])}\n")
+    print("| Operation | n | p50 (ms) | p95 (ms) | p99 (ms) | ops/s | Peak RSS (MB) |")
+    print("|---|---|---|---|---|---|---|")
+    for name, benchmark in report['benchmarks'].items():
+        if 'error' in benchmark:
+            print(f"| {name} | failed: {benchmark['error']} | | | | | |")
+            continue
+        for operation, stats in benchmark['results'].items():
+            if not isinstance(stats, dict):
+                continue
+            print(f"| {operation} | {stats['n']} | {stats['p50_ms']:.2f} | {stats['p95_ms']:.2f} | {stats['p99_ms']:.2f} "
+                  f"| {stats['throughput_per_s']:.1f} | {benchmark['peak_rss_mb']:.0f} |")
+    if comparison:
+        print("\n| Operation | Metric | Baseline (ms) | Current (ms) | Ratio |")
+        print("|---|---|---|---|---|")
+        for operation, metric, before, after, ratio, regressed in comparison:
+            flag = " REGRESSION" if regressed else ""
+            print(f"| {operation} | {metric} | {before:.2f} | {after:.2f} | {ratio:.2f}x{flag} |")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Latency, throughput and memory benchmarks of the chat and analytics pipeline")
+    parser.add_argument('--benchmarks', nargs='+', default=list(BENCHMARKS), choices=BENCHMARKS, help="Benchmarks to run")
+    parser.add_argument('--iterations', type=int, default=200, help="Timed calls of each chat operation")
+    parser.add_argument('--plot-iterations', type=int, default=20, help="Timed calls of each analytics operation")
+    parser.add_argument('--users', type=int, default=5, help="Synthetic users of the analytics benchmark")
+    parser.add_argument('--history', type=int, default=200, help="Messages saved per synthetic user")
+    parser.add_argument('--mongo-uri', help="Local mongod to use instead of mongomock, its procstop_benchmark database is dropped")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic data")
+    parser.add_argument('--output', help="Path of the JSON report")
+    parser.add_argument('--compare', help="JSON report of a previous run to compare with")
+    parser.add_argument('--max-regression', type=float, default=0.2, help="Relative slowdown that fails the comparison")
+    args = parser.parse_args()
+
+    params = {
+        'iterations': args.iterations,
+        'plot_iterations': args.plot_iterations,
+        'users': args.users,
+        'history': args.history,
+        'mongo_uri': args.mongo_uri,
+        'seed': args.seed
+    }
+    report = build_report(args.benchmarks, params)
+
+    comparison = None
+    if args.compare:
+        with open(args.compare) as f:
+            comparison = compare_reports(json.load(f), report, args.max_regression)
+    print_report(report, comparison)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if comparison and any(row[-1] for row in comparison):
+        raise SystemExit(1)
@@ -0,0 +1,114 @@
+# Local imports
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+# Bytes of rendered charts kept in memory per worker, 0 disables the cache
+CHART_CACHE_BYTES = int(os.getenv("CHART_CACHE_BYTES", str(64 * 1024 * 1024)))
+
+def chart_etag(user_id, chart, version):
+    """
+    Entity tag of a chart, it only changes when the user's data does
+
+    Args:
+        user_id (str): User id
+        chart (str): Chart name
+        version (str): Data version hash of the user
+    """
+    return hashlib.sha1(f"{user_id}\0{chart}\0{version}".encode('utf-8')).hexdigest()
+
+class ChartCache:
+    """
+    LRU cache of rendered PNG charts keyed by (user_id, chart, data version), bounded by the total size of the images.
+    A new message changes the data version, so stale charts are never served and just age out.
+    """
+    def __init__(self, maxbytes=CHART_CACHE_BYTES):
+        """
+        Initialize chart cache
+
+        Args:
+            maxbytes (int): Total size of the images kept in memory
+        """
+        self.maxbytes = maxbytes
+        self.size = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.render_locks = {}
+        self.counters = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        """
+        Get a cached chart
+
+        Args:
+            key (tuple): (user_id, chart, version)
+
+        Returns:
+            png (bytes): Rendered chart, None on a miss
+        """
+        with self.lock:
+            png = self.entries.get(key)
+            if png is None:
+                self.counters['misses'] += 1
+                return None
+            self.entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return png
+
+    def set(self, key, png):
+        """
+        Cache a chart, evicting the least recently used ones while the cache is over its size
+
+        Args:
+            key (tuple): (user_id, chart, version)
+            png (bytes): Rendered chart
+        """
+        if len(png) > self.maxbytes:
+            return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous)
+            self.entries[key] = png
+            self.size += len(png)
+            while self.size > self.maxbytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+                self.counters['evictions'] += 1
+
+    def get_or_render(self, key, render):
+        """
+        Get a cached chart or render and cache it. Concurrent requests for the same chart render it once.
+
+        Args:
+            key (tuple): (user_id, chart, version)
+            render (callable): Renders the chart, returns the PNG bytes or None when there is no data
+
+        Returns:
+            png (bytes): Rendered chart, None when there is no data
+        """
+        png = self.get(key)
+        if png is not None:
+            return png
+
+        with self.lock:
+            render_lock = self.render_locks.setdefault(key, threading.Lock())
+        with render_lock:
+            # Another request may have rendered it meanwhile
+            with self.lock:
+                png = self.entries.get(key)
+            if png is None:
+                png = render()
+                if png is not None:
+                    self.set(key, png)
+        with self.lock:
+            self.render_locks.pop(key, None)
+        return png
+
+    def stats(self):
+        """
+        Cache counters and current size
+        """
+        with self.lock:
+            return {**self.counters, 'entries': len(self.entries), 'bytes': self.size}
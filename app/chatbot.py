@@ -1,15 +1,44 @@
 # Local imports
+import os
+import threading
 from datetime import datetime
 
 # Third party imports
-from openai import OpenAI
 from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+
+# Project imports
+from app.llm_backends import get_backend
+from app.rollups import update_rollup
+from app.telemetry import get_logger, timed, timed_iter
+
+logger = get_logger(__name__)
+
+# Context aggregation, the weight the running emotion average keeps on each new message,
+# the number of entities per type kept in the prompt and the weight their mentions keep on each new message
+EMOTION_DECAY = float(os.getenv("CONTEXT_EMOTION_DECAY", "0.7"))
+ENTITY_TOP_K = int(os.getenv("CONTEXT_ENTITY_TOP_K", "10"))
+ENTITY_DECAY = float(os.getenv("CONTEXT_ENTITY_DECAY", "0.9"))
+ENTITY_TYPES = ('people', 'places', 'orgs')
+
+def format_sentiment(sentiment):
+    """
+    Format the dominant label of a sentiment distribution
+
+    Args:
+        sentiment (dict): Sentiment label -> probability
+
+    Returns:
+        text (str): Dominant label and its probability, as 'Pos: 0.80'
+    """
+    dominant_sentiment = max(sentiment, key=sentiment.get)
+    return f"{dominant_sentiment.capitalize()}: {sentiment[dominant_sentiment]:.2f}"
 
 class Chatbot:
     """
     Chatbot logic including bot response and db management
     """
-    def __init__(self, api_key, language="ES", model="gpt-4", db=None, gender='Other'):
+    def __init__(self, api_key, language="ES", model="gpt-4", db=None, gender='Other', backend=None):
         """
         Chatbot object initialization
 
@@ -18,10 +47,11 @@ class Chatbot:
             language (str): User's language
             model (str): Selected OpenAI model
             mongo (Object): Mongo DB initialized
+            backend (LLMBackend): Chat completion backend, the one set in LLM_BACKEND by default
 
         """
         self.conversation_id = ObjectId()
-        self.client = OpenAI(api_key = api_key)
+        self.backend = backend or get_backend(api_key)
         self.model = model
         self.user_id = None
         self.username = None
@@ -29,11 +59,20 @@ class Chatbot:
         self.language = language
         self.start_time = datetime.now()
         self.gender = gender
+        self.lock = threading.Lock()
+        # Sequence number of the last message applied to the context, messages saved by other workers are replayed from it
+        self.applied_seq = 0
+        # Running aggregates of the conversation, their size doesn't grow with the number of messages
         self.context = {
-            "emotions": [],
-            "people": [],
-            "places": [],
-            "orgs": [],
+            "emotions": {},
+            "people": {},
+            "places": {},
+            "orgs": {},
+            "mentions": {entity_type: 0 for entity_type in ENTITY_TYPES},
+            "messages": 0,
+            "sentiment": None,
+            "hate": None,
+            "irony": None,
             "emotion_trigger": None
         }
 
@@ -44,22 +83,14 @@ class Chatbot:
         # Check user
         if not hasattr(self, 'user_id') or not self.user_id:
             raise ValueError("user_id is not set. Please ensure user_id is defined before starting a conversation.")
+        self.start_time = datetime.now()
 
-        # Document structure definition
+        # Document structure definition, messages are stored in their own collection
         conversation = {
             "user_id": self.user_id,
-            "messages": [],
-            "entities": {
-                "people": [],
-                "places": [],
-                "orgs": [],
-                "others": []
-            },
-            "emotions": [],
-            "hate": [],
-            "irony": [],
-            "start_time": datetime.now(),
+            "start_time": self.start_time,
             "duration": 0,
+            "message_count": 0,
             "last_update": None
         }
             
@@ -67,7 +98,7 @@ class Chatbot:
         result = self.db.conversations.insert_one(conversation)
         self.conversation_id = result.inserted_id
 
-        print(f"Conversation started with ID: {self.conversation_id}")
+        logger.info("Conversation started", extra={'conversation_id': str(self.conversation_id), 'user_id': str(self.user_id)})
 
     def is_ready_for_recommendation(self):
         """
@@ -76,53 +107,101 @@ class Chatbot:
         Return:
             result (bool): True if there is enough data to make a recommendation
         """
-        emotions_list = self.context['emotions']
-
-        # Drop 'neutral' emotion if it exists
-        if 'neutral' in emotions_list:
-            emotions_list = emotions_list[emotions_list != 'neutral']
-
         # Check if there are at least 3 distinct emotions excluding 'neutral'
-        enough_emotion_info = len(set(emotions_list)) >= 3
+        emotions = [emotion for emotion in self.context['emotions'] if emotion != 'neutral']
+        enough_emotion_info = len(emotions) >= 3
 
-        # Check if there are more than 2 entities in any of the 'people', 'places', or 'orgs'
-        enough_entity_info = any(len(self.context[entity]) > 2 for entity in ['people', 'places', 'orgs'])
+        # Check if there are more than 2 entities mentioned in any of the 'people', 'places', or 'orgs'
+        enough_entity_info = any(self.context['mentions'][entity] > 2 for entity in ENTITY_TYPES)
 
         # Return True if both conditions are satisfied
         result = enough_emotion_info and enough_entity_info
         return result
 
+    def entity_score(self, entry):
+        """
+        Relevance of an entity: its mentions, each one decayed by the messages sent since
+
+        Args:
+            entry (dict): Entity entry of the context
+        """
+        return entry['score'] * ENTITY_DECAY ** (self.context['messages'] - entry['last_message'])
+
+    def update_entity(self, entity_type, entity, sentiment):
+        """
+        Add a mention of an entity to the context, keeping the mean sentiment of its mentions.
+        Only the ENTITY_TOP_K most relevant entities of each type are kept.
+
+        Args:
+            entity_type (str): 'people', 'places' or 'orgs'
+            entity (str): Mentioned entity
+            sentiment (dict): Sentiment of the message that mentions it
+        """
+        entities = self.context[entity_type]
+        entry = entities.pop(entity, None) or {'mentions': 0, 'score': 0.0, 'last_message': self.context['messages'], 'sentiment': {}}
+        entry['score'] = self.entity_score(entry) + 1
+        entry['last_message'] = self.context['messages']
+        entry['mentions'] += 1
+        for label, prob in sentiment.items():
+            mean = entry['sentiment'].get(label, 0)
+            entry['sentiment'][label] = mean + (prob - mean) / entry['mentions']
+        # Reinserted at the end, so ties are evicted starting by the least recently mentioned
+        entities[entity] = entry
+
+        # The entity just mentioned is never evicted, a new entity would otherwise lose against
+        # entities mentioned a few times more, even long ago
+        if len(entities) > ENTITY_TOP_K:
+            evicted = min((name for name in entities if name != entity), key=lambda name: self.entity_score(entities[name]))
+            del entities[evicted]
+
     def update_context(self, features_dict):
         """
         Update conversation context to get a better bot response.
+        Every update costs the same regardless of the conversation length.
 
         Args:
             features_dict (dict): Detected features from user's input message.
         """
-        # Format emotion data
-        emotions_with_probs = [f"{emotion}: {prob:.2f}" for emotion, prob in features_dict['emotion'].items()]
+        self.applied_seq += 1
+        self.context['messages'] += 1
 
-        # Get the dominant emotion
-        sentiment_dict = features_dict['sentiment'] 
-        dominant_sentiment = max(sentiment_dict, key=sentiment_dict.get)
-        dominant_prob = sentiment_dict[dominant_sentiment]
+        # Decayed average of each emotion probability
+        emotions = self.context['emotions']
+        for emotion, prob in features_dict['emotion'].items():
+            if emotion in emotions:
+                emotions[emotion] = EMOTION_DECAY * emotions[emotion] + (1 - EMOTION_DECAY) * prob
+            else:
+                emotions[emotion] = prob
 
-        # Update emotions, sentiment and entities in the context
-        self.context['emotions'].extend(emotions_with_probs)
-        self.context['sentiment'] = f"{dominant_sentiment.capitalize()}: {dominant_prob:.2f}"
-        self.context['places'].extend([f"{place} ({dominant_sentiment.capitalize()}: {dominant_prob:.2f})" for place in features_dict['entities']['places']])
-        self.context['people'].extend([f"{person} ({dominant_sentiment.capitalize()}: {dominant_prob:.2f})" for person in features_dict['entities']['people']])
-        self.context['orgs'].extend([f"{org} ({dominant_sentiment.capitalize()}: {dominant_prob:.2f})" for org in features_dict['entities']['orgs']])
+        # Update sentiment and entities in the context
+        sentiment_dict = features_dict['sentiment']
+        self.context['sentiment'] = format_sentiment(sentiment_dict)
+        for entity_type in ENTITY_TYPES:
+            mentioned = features_dict['entities'].get(entity_type, [])
+            self.context['mentions'][entity_type] += len(mentioned)
+            for entity in mentioned:
+                self.update_entity(entity_type, entity, sentiment_dict)
 
         # Add hate speech and irony to features_dict
         if features_dict.get('hate'):
-            hate_score = features_dict['hate'].get('hate_speech', 0)
+            hate_score = features_dict['hate'].get('hateful', 0)
             self.context['hate'] = f"Hate speech score: {hate_score:.2f}"
 
         if features_dict.get('irony'):
-            irony_score = features_dict['irony'].get('irony', 0)
+            irony_score = features_dict['irony'].get('ironic', 0)
             self.context['irony'] = f"Irony score: {irony_score:.2f}"
-       
+
+    def format_entities(self, entity_type):
+        """
+        Format the entities of a type for the system role, most relevant first
+
+        Args:
+            entity_type (str): 'people', 'places' or 'orgs'
+        """
+        entities = self.context[entity_type]
+        ranked = sorted(entities, key=lambda name: self.entity_score(entities[name]), reverse=True)
+        return ', '.join(f"{name} ({format_sentiment(entities[name]['sentiment'])})" for name in ranked)
+
     def get_system_role(self):
         """
         Context formatting as system role for the chatbot input
@@ -130,15 +209,16 @@ class Chatbot:
         Returns:
             system_role (str): Customized system role for OpenAI API
         """
+        emotions = sorted(self.context['emotions'].items(), key=lambda item: item[1], reverse=True)
         context_description = "\n".join([
         f"- Género del usuario: {self.gender}",
-        f"- Emociones detectadas en el chat: {', '.join(self.context['emotions']) if self.context['emotions'] else 'No detectadas'}",
-        f"- Sentimiento (positividad): {self.context['sentiment']}",
-        f"- Personas mencionadas previamente: {', '.join(self.context['people']) if self.context['people'] else 'No mencionadas'}",
-        f"- Lugares mencionados previamente: {', '.join(self.context['places']) if self.context['places'] else 'No mencionados'}",
-        f"- Empresas mencionadas previamente: {', '.join(self.context['orgs']) if self.context['orgs'] else 'No mencionadas'}",
-        f"- Hate speech detectado: {self.context['hate']}",
-        f"- Ironía detectada: {self.context['irony']}"
+        f"- Emociones detectadas en el chat: {', '.join(f'{emotion}: {prob:.2f}' for emotion, prob in emotions) if emotions else 'No detectadas'}",
+        f"- Sentimiento (positividad): {self.context['sentiment'] or 'No detectado'}",
+        f"- Personas mencionadas previamente: {self.format_entities('people') or 'No mencionadas'}",
+        f"- Lugares mencionados previamente: {self.format_entities('places') or 'No mencionados'}",
+        f"- Empresas mencionadas previamente: {self.format_entities('orgs') or 'No mencionadas'}",
+        f"- Hate speech detectado: {self.context['hate'] or 'No detectado'}",
+        f"- Ironía detectada: {self.context['irony'] or 'No detectada'}"
     ])
 
         if self.is_ready_for_recommendation():
@@ -148,56 +228,105 @@ class Chatbot:
         
         return system_role
 
-    def save_conver(self, db, user_input, response, features_dict):
+    @timed("mongo_write")
+    def save_conver(self, db, user_input, response, features_dict, conversation_id=None, timestamp=None):
         """
-        Save message to conversations with user message, bot response, and additional features.
+        Save message with user message, bot response, and additional features.
+        Each message is a document of the messages collection keyed by (conversation_id, seq),
+        the conversation document only keeps a compact header.
         
         Args:
             user_input (str): User input message
             response (str): Bot response
             features_dict (dict): Detected features on user's input message
+            conversation_id (ObjectId): Conversation to update, the current one by default. Deferred writes pass
+                the conversation that was active when the message was sent.
+            timestamp (datetime): Time the message was sent, now by default
 
         Return:
-            update_result (dict): Information about saving in mongo process
+            message_id (ObjectId): Saved message id, None if the conversation doesn't exist
         """
-        print('>>> Saving conversation...')
-        
-        # Preprocess entities
-        entities_update = {}
-        sentiment = features_dict['sentiment']
-        for entity_type, entities in features_dict['entities'].items():
-            if entities: 
-                sentimental_entities = [(entity, sentiment) for entity in entities]
-                entities_update[f"entities.{entity_type}"] = {"$each": sentimental_entities}
+        if conversation_id is None:
+            conversation_id = self.conversation_id
+        if timestamp is None:
+            timestamp = datetime.now()
 
         # Calculate time lapse
-        duration = datetime.now() - self.start_time
+        duration = timestamp - self.start_time
         duration_sec = duration.total_seconds()
         duration_min = int(duration_sec / 60)
 
-        # Update conversation data to mongo
-        update_result = db.conversations.update_one(
-            {"_id": self.conversation_id},
+        # Update conversation header, its message counter gives the sequence number of the message
+        conversation = db.conversations.find_one_and_update(
+            {"_id": conversation_id},
             {
-                "$push": {
-                    "messages": {
-                        "user_message": user_input,
-                        "bot_message": response,
-                        "emotions": features_dict['emotion'], 
-                        "sentiment": sentiment,                
-                        "hate": features_dict['hate'],         
-                        "irony": features_dict['irony']        
-                    },
-                    **entities_update
-                },
+                "$inc": {"message_count": 1},
                 "$set": {
-                    "last_update": datetime.now(),
+                    "last_update": timestamp,
                     "duration": duration_min
                 }
-            }
+            },
+            projection={"user_id": 1, "message_count": 1},
+            return_document=ReturnDocument.AFTER
         )
-        print('<<< Conversation already saved.')
-        return update_result
+        if conversation is None:
+            logger.warning("Conversation not found, message not saved", extra={'conversation_id': str(conversation_id)})
+            return None
+
+        # Save message to mongo
+        insert_result = db.messages.insert_one({
+            "conversation_id": conversation_id,
+            "seq": conversation['message_count'],
+            "user_id": conversation['user_id'],
+            "timestamp": timestamp,
+            "user_message": user_input,
+            "bot_message": response,
+            "emotions": features_dict['emotion'],
+            "sentiment": features_dict['sentiment'],
+            "hate": features_dict['hate'],
+            "irony": features_dict['irony'],
+            "entities": features_dict['entities']
+        })
+
+        # Add the message to the analytics rollup of its day
+        update_rollup(db, conversation['user_id'], timestamp, features_dict)
+        logger.debug("Message saved", extra={'conversation_id': str(conversation_id), 'seq': conversation['message_count']})
+        return insert_result.inserted_id
+
+    @timed("prompt_build")
+    def get_completion_params(self, user_input):
+        """
+        Build the chat completion request for a user message taking into account the user's context
+
+        Args:
+            user_input (str): User input message
+        Return:
+            params (dict): Arguments for chat.completions.create
+        """
+        # Redact system role with context
+        system_prompt = self.get_system_role()
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_input}
+        ]
+
+        if self.is_ready_for_recommendation():
+            return {
+                "model": self.model,
+                "messages": messages,
+                "max_tokens": 200,
+                "stop": ["Adiós","Hasta luego", "Bye", 'Ciao'],
+                "temperature": 0.9,
+                "top_p": 0.9
+            }
+        return {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": 150,
+            "stop": ["Usuario:", "Bot:", "Adiós", "Bye"],
+            "temperature": 0.7,
+            "top_p": 0.9
+        }
 
     def get_response(self, user_input):
         """
@@ -207,41 +336,24 @@ class Chatbot:
             user_input (str): User input message
         Return:
             message (str): Chatbot response to user's input
+        Raises:
+            LLMUnavailableError: The chatbot service timed out, kept failing or is paused by the circuit breaker
         """
-        try: 
-            # Redact system role with context
-            system_prompt = self.get_system_role()
-
-            # Query the chatbot for a response
-            if self.is_ready_for_recommendation:
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_input}
-                    ],
-                    max_tokens=200,
-                    stop=["Adiós","Hasta luego", "Bye", 'Ciao'],
-                    temperature=0.9,
-                    top_p = 0.9
-                )
-            else:
-                    response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_input}
-                    ],
-                    max_tokens=150,
-                    stop=["Usuario:", "Bot:", "Adiós", "Bye"],
-                    temperature = 0.7,
-                    top_p = 0.9
-                )
-                
-            message = response.choices[0].message.content
-
-            return message
-        
-        except Exception as e:
-            return f"An error occurred: {str(e)}"
+        # Query the chatbot for a response
+        params = self.get_completion_params(user_input)
+        with timed("llm"):
+            message = self.backend.complete(**params)
 
+        return message
+
+    def stream_response(self, user_input):
+        """
+        Send user input to chatbot model and yield the response as it is generated
+
+        Args:
+            user_input (str): User input message
+        Yield:
+            token (str): Next piece of the chatbot response
+        """
+        params = self.get_completion_params(user_input)
+        yield from timed_iter("llm", self.backend.stream(**params), first_stage="llm_first_token")
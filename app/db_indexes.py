@@ -0,0 +1,178 @@
+# Local imports
+import argparse
+import os
+from datetime import datetime
+
+# Third party imports
+import pymongo
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import MongoClient
+from pymongo.errors import OperationFailure
+
+# Project imports
+from app.telemetry import get_logger
+
+logger = get_logger(__name__)
+
+# Indexes of the hot queries: collection -> list of (keys, options)
+INDEXES = {
+    'users': [
+        ([('username', pymongo.ASCENDING)], {'name': 'username_unique', 'unique': True}),
+        ([('email', pymongo.ASCENDING)], {'name': 'email_unique', 'unique': True}),
+    ],
+    'conversations': [
+        ([('user_id', pymongo.ASCENDING), ('start_time', pymongo.ASCENDING)], {'name': 'user_id_start_time'}),
+    ],
+    'messages': [
+        ([('conversation_id', pymongo.ASCENDING), ('seq', pymongo.ASCENDING)], {'name': 'conversation_id_seq', 'unique': True}),
+        ([('user_id', pymongo.ASCENDING), ('timestamp', pymongo.ASCENDING)], {'name': 'user_id_timestamp'}),
+    ],
+    'analytics_rollups': [
+        ([('user_id', pymongo.ASCENDING), ('day', pymongo.ASCENDING)], {'name': 'user_id_day', 'unique': True}),
+    ],
+}
+
+def ensure_indexes(db, indexes=INDEXES):
+    """
+    Create the indexes of the hot queries. Existing indexes are left as they are, and an index that
+    can't be built (e.g. duplicated usernames for a unique index) is reported instead of stopping the app.
+
+    Args:
+        db (Database): Mongo database
+        indexes (dict): Collection -> list of (keys, options)
+
+    Returns:
+        failed (list): Names of the indexes that couldn't be created
+    """
+    failed = []
+    for collection, specs in indexes.items():
+        for keys, options in specs:
+            try:
+                db[collection].create_index(keys, **options)
+            except OperationFailure as e:
+                logger.error("Index could not be created", extra={'index': f"{collection}.{options['name']}", 'error': str(e)})
+                failed.append(f"{collection}.{options['name']}")
+    return failed
+
+def verify_indexes(db, indexes=INDEXES):
+    """
+    Check that every index exists with the expected keys and uniqueness
+
+    Args:
+        db (Database): Mongo database
+        indexes (dict): Collection -> list of (keys, options)
+
+    Returns:
+        missing (list): Indexes that are missing or differ from the expected ones
+    """
+    missing = []
+    for collection, specs in indexes.items():
+        existing = {tuple((field, direction) for field, direction in info['key']): info.get('unique', False)
+                    for info in db[collection].index_information().values()}
+        for keys, options in specs:
+            key = tuple(keys)
+            if key not in existing or existing[key] != options.get('unique', False):
+                missing.append(f"{collection}.{options['name']}")
+    return missing
+
+def bootstrap_indexes(db):
+    """
+    Create and verify the indexes when the app starts
+
+    Args:
+        db (Database): Mongo database
+
+    Returns:
+        ok (bool): All the indexes are in place
+    """
+    ensure_indexes(db)
+    missing = verify_indexes(db)
+    if missing:
+        logger.warning("Missing indexes", extra={'indexes': missing})
+        return False
+    logger.info("Database indexes verified")
+    return True
+
+def hot_queries(db, user_id=None):
+    """
+    Queries of the login, signup, analytics and delete endpoints
+
+    Args:
+        db (Database): Mongo database
+        user_id (ObjectId): User used in the per-user queries, a dummy one by default
+
+    Returns:
+        queries (dict): Name -> (collection, filter, sort)
+    """
+    user_id = user_id or ObjectId()
+    return {
+        'login': ('users', {'username': 'explain_check'}, None),
+        'signup_email': ('users', {'email': 'explain_check@example.com'}, None),
+        'signup_username': ('users', {'username': 'explain_check'}, None),
+        'user_conversations': ('conversations', {'user_id': user_id}, [('start_time', pymongo.ASCENDING)]),
+        'user_messages': ('messages', {'user_id': user_id}, None),
+        'user_messages_range': ('messages', {'user_id': user_id, 'timestamp': {'$gte': datetime(2024, 1, 1), '$lte': datetime(2024, 1, 31)}}, None),
+        'conversation_messages': ('messages', {'conversation_id': ObjectId()}, [('seq', pymongo.ASCENDING)]),
+        'user_rollups': ('analytics_rollups', {'user_id': user_id}, [('day', pymongo.ASCENDING)]),
+        'user_rollups_range': ('analytics_rollups', {'user_id': user_id, 'day': {'$gte': datetime(2024, 1, 1), '$lte': datetime(2024, 1, 31)}},
+                               [('day', pymongo.ASCENDING)]),
+    }
+
+def plan_stages(plan):
+    """
+    Stage names of a query plan, from the root to the leaves
+
+    Args:
+        plan (dict): winningPlan of an explain output
+    """
+    stages = [plan.get('stage')]
+    if 'inputStage' in plan:
+        stages += plan_stages(plan['inputStage'])
+    for child in plan.get('inputStages', []):
+        stages += plan_stages(child)
+    # Slot based engine wraps the classic plan
+    if 'queryPlan' in plan:
+        stages += plan_stages(plan['queryPlan'])
+    return [stage for stage in stages if stage]
+
+def explain_queries(db, user_id=None):
+    """
+    Explain the hot queries and flag the ones answered with a collection scan
+
+    Args:
+        db (Database): Mongo database
+        user_id (ObjectId): User used in the per-user queries
+
+    Returns:
+        report (dict): Name -> {'collection', 'stages', 'collscan'}
+    """
+    report = {}
+    for name, (collection, query, sort) in hot_queries(db, user_id).items():
+        cursor = db[collection].find(query)
+        if sort:
+            cursor = cursor.sort(sort)
+        stages = plan_stages(cursor.explain()['queryPlanner']['winningPlan'])
+        report[name] = {'collection': collection, 'stages': stages, 'collscan': 'COLLSCAN' in stages}
+    return report
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Create, verify and explain the indexes of the hot queries")
+    parser.add_argument('--create', action='store_true', help="Create the missing indexes before checking")
+    parser.add_argument('--user-id', help="User id for the per-user queries")
+    args = parser.parse_args()
+
+    load_dotenv()
+    db = MongoClient(os.getenv("MONGO_URI"))['procstop']
+    if args.create:
+        ensure_indexes(db)
+    missing = verify_indexes(db)
+    for index in missing:
+        print(f"MISSING   {index}")
+
+    report = explain_queries(db, ObjectId(args.user_id) if args.user_id else None)
+    for name, row in report.items():
+        flag = "COLLSCAN" if row['collscan'] else "ok"
+        print(f"{flag:<9} {name:<20} {row['collection']:<18} {' <- '.join(row['stages'])}")
+    if missing or any(row['collscan'] for row in report.values()):
+        raise SystemExit(1)
@@ -0,0 +1,158 @@
+# Local imports
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class FakeOpenAIHandler(BaseHTTPRequestHandler):
+    """
+    Minimal OpenAI compatible chat completions endpoint, plain and streamed.
+    Behaviour is read from the server: latency, token delay and injected failures.
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            return self.send_json(404, {'error': {'message': f"Unknown path {self.path}", 'type': 'invalid_request_error'}})
+
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            fail_first = server.requests <= server.fail_first
+        time.sleep(server.latency)
+
+        # Injected failures
+        if fail_first or random.random() < server.fail_rate:
+            headers = {'Retry-After': '1'} if server.fail_status == 429 else None
+            return self.send_json(server.fail_status, {'error': {'message': 'Injected failure', 'type': 'server_error'}}, headers)
+
+        reply = server.reply(request)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+        model = request.get('model', 'gpt-4')
+        created = int(time.time())
+
+        if not request.get('stream'):
+            return self.send_json(200, {
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': created,
+                'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': reply}, 'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': 0, 'completion_tokens': len(reply.split()), 'total_tokens': len(reply.split())}
+            })
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        tokens = [f"{word} " for word in reply.split(' ')]
+        tokens[-1] = tokens[-1].rstrip()
+        for index, token in enumerate(tokens + [None]):
+            chunk = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'delta': {'content': token} if token is not None else {},
+                    'finish_reason': None if token is not None else 'stop'
+                }]
+            }
+            if index == 0:
+                chunk['choices'][0]['delta']['role'] = 'assistant'
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+            time.sleep(server.token_delay)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+        self.close_connection = True
+
+class FakeOpenAIServer(ThreadingHTTPServer):
+    """
+    Local stand-in for the OpenAI API, point OPENAI_BASE_URL at it to test the LLM client offline
+    """
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, token_delay=0.0, fail_rate=0.0, fail_status=500, fail_first=0, quiet=True):
+        """
+        Initialize fake server
+
+        Args:
+            host (str): Listening host
+            port (int): Listening port, 0 picks a free one
+            latency (float): Seconds before answering each request
+            token_delay (float): Seconds between streamed tokens
+            fail_rate (float): Share of requests answered with fail_status
+            fail_status (int): HTTP status of injected failures, 429, 5xx or a 4xx client error
+            fail_first (int): Requests answered with fail_status before the server starts answering normally
+            quiet (bool): Don't log every request
+        """
+        super().__init__((host, port), FakeOpenAIHandler)
+        self.latency = latency
+        self.token_delay = token_delay
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.fail_first = fail_first
+        self.quiet = quiet
+        self.requests = 0
+        self.lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def reply(self, request):
+        """
+        Deterministic reply built from the last user message
+        """
+        user_messages = [message['content'] for message in request.get('messages', []) if message.get('role') == 'user']
+        last_message = user_messages[-1] if user_messages else ''
+        return f"Entiendo lo que me cuentas sobre \"{last_message}\". ¿Cómo te hace sentir eso?"
+
+    def start(self):
+        """
+        Serve from a background thread
+
+        Returns:
+            base_url (str): Value for OPENAI_BASE_URL
+        """
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self.base_url
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local fake OpenAI chat completions server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds before answering each request")
+    parser.add_argument('--token-delay', type=float, default=0.0, help="Seconds between streamed tokens")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="Share of requests that fail")
+    parser.add_argument('--fail-status', type=int, default=500, help="HTTP status of failed requests")
+    parser.add_argument('--fail-first', type=int, default=0, help="Requests that fail before answering normally")
+    args = parser.parse_args()
+
+    server = FakeOpenAIServer(args.host, args.port, args.latency, args.token_delay, args.fail_rate, args.fail_status,
+                              args.fail_first, quiet=False)
+    print(f"Fake OpenAI server at {server.base_url}")
+    server.serve_forever()
\ No newline at end of file
@@ -0,0 +1,201 @@
+# Local imports
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+# Cache configuration, a size of 0 disables the cache
+FEATURE_CACHE_SIZE = int(os.getenv("FEATURE_CACHE_SIZE", "2048"))
+FEATURE_CACHE_TTL = float(os.getenv("FEATURE_CACHE_TTL", "86400"))
+FEATURE_CACHE_DB = os.getenv("FEATURE_CACHE_DB")
+FEATURE_CACHE_DB_SIZE = int(os.getenv("FEATURE_CACHE_DB_SIZE", "100000"))
+
+def normalize_text(text):
+    """
+    Normalize a message before analysis and cache lookup. Messages are always analysed
+    in this form, so a cached result is exactly what the models return for the message.
+
+    Args:
+        text (str): User's input message
+
+    Returns:
+        text (str): NFC normalized message without surrounding whitespace
+    """
+    return unicodedata.normalize('NFC', text).strip()
+
+class DiskTier:
+    """
+    SQLite store shared by every worker of the node
+    """
+    def __init__(self, path, ttl, maxsize):
+        """
+        Initialize disk tier
+
+        Args:
+            path (str): SQLite database path
+            ttl (float): Seconds an entry stays valid
+            maxsize (int): Entries kept after pruning
+        """
+        self.path = path
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.local = threading.local()
+        self.writes = 0
+        # The schema is created with its own connection, so a gunicorn master never hands one to its forked workers
+        conn = sqlite3.connect(self.path, timeout=5)
+        try:
+            with conn:
+                conn.execute("CREATE TABLE IF NOT EXISTS features (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)")
+                conn.execute("CREATE INDEX IF NOT EXISTS features_created ON features (created)")
+        finally:
+            conn.close()
+
+    def connection(self):
+        """
+        SQLite connection of the current thread
+        """
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self.local.conn = conn
+        return conn
+
+    def get(self, key):
+        """
+        Get a serialized entry, None when missing or expired
+        """
+        row = self.connection().execute("SELECT value, created FROM features WHERE key = ?", (key,)).fetchone()
+        if row is None or time.time() - row[1] > self.ttl:
+            return None
+        return row[0]
+
+    def set(self, key, value):
+        """
+        Store a serialized entry, pruning the oldest entries every so often
+        """
+        with self.connection() as conn:
+            conn.execute("INSERT OR REPLACE INTO features (key, value, created) VALUES (?, ?, ?)", (key, value, time.time()))
+            self.writes += 1
+            if self.writes % 1000 == 0:
+                conn.execute("DELETE FROM features WHERE created < ?", (time.time() - self.ttl,))
+                conn.execute("DELETE FROM features WHERE key NOT IN (SELECT key FROM features ORDER BY created DESC LIMIT ?)", (self.maxsize,))
+
+class FeatureCache:
+    """
+    LRU cache with expiration for feature extraction results, keyed on the hash of the
+    normalized message and the model version tag. An optional disk tier shares results between workers.
+    """
+    def __init__(self, maxsize=FEATURE_CACHE_SIZE, ttl=FEATURE_CACHE_TTL, version='', disk_path=FEATURE_CACHE_DB, disk_maxsize=FEATURE_CACHE_DB_SIZE):
+        """
+        Initialize feature cache
+
+        Args:
+            maxsize (int): Entries kept in memory
+            ttl (float): Seconds an entry stays valid
+            version (str): Model version tag, results of other versions are never returned. A callable is called
+                on each lookup, for a version that can change while the process runs.
+            disk_path (str): SQLite path of the shared tier, None to keep the cache in memory only
+            disk_maxsize (int): Entries kept in the shared tier
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = version
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.disk = DiskTier(disk_path, ttl, disk_maxsize) if disk_path else None
+        self.counters = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0}
+
+    def key(self, text):
+        """
+        Cache key of a normalized message
+        """
+        version = self.version() if callable(self.version) else self.version
+        return hashlib.sha256(f"{version}\0{text}".encode('utf-8')).hexdigest()
+
+    def get(self, text):
+        """
+        Get the cached features of a normalized message
+
+        Args:
+            text (str): Normalized message
+
+        Returns:
+            features_dict (dict): A fresh copy of the cached features, None on a miss
+        """
+        key = self.key(text)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, created = entry
+                if time.monotonic() - created <= self.ttl:
+                    self.entries.move_to_end(key)
+                    self.counters['hits'] += 1
+                    return json.loads(value)
+                del self.entries[key]
+                self.counters['expirations'] += 1
+
+        if self.disk is not None:
+            value = self.disk.get(key)
+            if value is not None:
+                self.remember(key, value)
+                with self.lock:
+                    self.counters['disk_hits'] += 1
+                return json.loads(value)
+
+        with self.lock:
+            self.counters['misses'] += 1
+        return None
+
+    def set(self, text, features_dict):
+        """
+        Cache the features of a normalized message
+
+        Args:
+            text (str): Normalized message
+            features_dict (dict): Extracted features
+        """
+        key = self.key(text)
+        value = json.dumps(features_dict)
+        self.remember(key, value)
+        if self.disk is not None:
+            self.disk.set(key, value)
+
+    def remember(self, key, value):
+        """
+        Store a serialized entry in memory, evicting the least recently used ones
+        """
+        with self.lock:
+            self.entries[key] = (value, time.monotonic())
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.counters['evictions'] += 1
+
+    def get_or_compute(self, text, compute):
+        """
+        Get the cached features of a normalized message or compute and cache them
+
+        Args:
+            text (str): Normalized message
+            compute (callable): Feature extraction of the message
+
+        Returns:
+            features_dict (dict): Extracted features
+        """
+        features_dict = self.get(text)
+        if features_dict is None:
+            features_dict = compute(text)
+            self.set(text, features_dict)
+        return features_dict
+
+    def stats(self):
+        """
+        Cache counters and current size
+        """
+        with self.lock:
+            return {**self.counters, 'size': len(self.entries)}
\ No newline at end of file
@@ -1,48 +1,143 @@
-# Third party imports
-from transformers import pipeline
-from pysentimiento import create_analyzer
+# Local imports
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Project imports
+from app.model_registry import registry
+from app.inference_server import INFERENCE_SOCKET, InferenceClient
+from app.feature_cache import FEATURE_CACHE_SIZE, FeatureCache, normalize_text
+from app.telemetry import get_logger, in_context, record_stage, timed
+
+logger = get_logger(__name__)
+
+# Messages sent together through each model in batch mode
+BATCH_SIZE = int(os.getenv("FEATURE_BATCH_SIZE", "32"))
+
+# 'separate' runs each pysentimiento analyzer on its own, 'shared' tokenizes once and runs the four heads together
+FEATURE_MODE = os.getenv("FEATURE_MODE", "separate")
+
+# Manual tag to invalidate cached features after upgrading a model under the same name
+FEATURE_MODEL_VERSION = os.getenv("FEATURE_MODEL_VERSION", "1")
+
+# Run NER and the classifiers of a message concurrently
+FEATURE_PARALLEL = os.getenv("FEATURE_PARALLEL", "1") == "1"
+
+# Keys of features_dict, in output order
+FEATURE_KEYS = ('emotion', 'entities', 'sentiment', 'hate', 'irony')
+
+# pysentimiento analyzers that share the RoBERTuito tokenizer, and their key in features_dict
+SENTIMENT_HEADS = {
+    'emotion': 'emotion',
+    'sentiment': 'sentiment',
+    'hate_speech': 'hate',
+    'irony': 'irony'
+}
+
+def chunks(items, size):
+    """
+    Split a list in consecutive chunks
+
+    Args:
+        items (list): Items to split
+        size (int): Maximum chunk size
+    """
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def log_head_timings(timings, n_messages):
+    """
+    Report the time spent in each stage of the shared head analysis
+
+    Args:
+        timings (dict): Stage -> seconds
+        n_messages (int): Messages in the analysed batch
+    """
+    logger.debug("Head timings", extra={'messages': n_messages,
+                                        'timings_ms': {stage: round(seconds * 1000, 1) for stage, seconds in timings.items()}})
 
 class FeatureExtractor:
     """
     Feature extraction from user's messages, including entities, emotion and sentiment.
+    Models are shared through the model registry, so one extractor can serve every message.
     """
-    def __init__(self, text):
+    def __init__(self, models=registry, mode=FEATURE_MODE, parallel=FEATURE_PARALLEL):
         """
         Initialize feature extractor
+
+        Args:
+            models (ModelRegistry): Registry holding the loaded models
+            mode (str): 'separate' or 'shared' analysis of the pysentimiento heads, always 'shared' with
+                the onnx backend
+            parallel (bool): Run the independent extractors of a message concurrently
         """
-        self.text = text
+        self.models = models
+        # ONNX analyzers have no trainer to predict lists, so their heads always run through the shared path
+        self.mode = mode if models.backend != 'onnx' else 'shared'
+        self.parallel = parallel
+        self.head_groups = None
+        self.head_executor = ThreadPoolExecutor(max_workers=len(SENTIMENT_HEADS), thread_name_prefix='feature-head')
+        self.stage_executor = ThreadPoolExecutor(max_workers=len(SENTIMENT_HEADS) + 1, thread_name_prefix='feature-stage')
 
-        self.entity_extractor = pipeline("token-classification", model="PlanTL-GOB-ES/roberta-base-bne-capitel-ner-plus")
-        self.emotion_extractor = create_analyzer(task="emotion", lang="es") #pipeline("text-classification", model="finiteautomata/beto-emotion-analysis")
-        self.sentiment_extractor = create_analyzer(task="sentiment", lang="es")
-        self.hate_extractor = create_analyzer(task="hate_speech", lang="es")
-        self.irony_extractor = create_analyzer(task="irony", lang="es")
+    def version_tag(self):
+        """
+        Tag identifying the models and settings that produce the features
 
-        self.emotion = None
-        self.sentiment = None
-        self.hate = None
-        self.irony = None
-        self.entities = {
-            'people': [],
-            'places': [],
-            'orgs': [],
-            'others': []
-        }
-        
-    def get_entities(self):
+        Returns:
+            tag (str): Backend, mode and hash of the model specifications
+        """
+        specs = json.dumps(self.models.specs, sort_keys=True)
+        digest = hashlib.sha1(f"{specs}{FEATURE_MODEL_VERSION}".encode('utf-8')).hexdigest()[:12]
+        return f"{self.models.backend}:{self.mode}:{digest}"
+
+    @property
+    def entity_extractor(self):
+        return self.models.get('entities')
+
+    @property
+    def emotion_extractor(self):
+        return self.models.get('emotion')
+
+    @property
+    def sentiment_extractor(self):
+        return self.models.get('sentiment')
+
+    @property
+    def hate_extractor(self):
+        return self.models.get('hate_speech')
+
+    @property
+    def irony_extractor(self):
+        return self.models.get('irony')
+
+    def get_entities(self, text):
         """
         Extract entities from the text and format it as a dictionary
+
+        Args:
+            text (str): User's input message
         """
-        raw_entities = self.entity_extractor(self.text)
-        self.clean_entities(raw_entities)
-        return self.entities
+        raw_entities = self.entity_extractor(text)
+        return self.clean_entities(text, raw_entities)
 
-    def clean_entities(self, raw_entities):
+    def clean_entities(self, text, raw_entities):
         """
         Process and clean the raw extracted entities
         Args:
+            text (str): User's input message
             raw_entities (dict): Extracted entities
+
+        Returns:
+            entities (dict): Entities grouped by type
         """
+        entities = {
+            'people': [],
+            'places': [],
+            'orgs': [],
+            'others': []
+        }
         current_entity = []
         master_entities = {
             'PER': 'people',
@@ -54,7 +149,7 @@ class FeatureExtractor:
         # Iteration over raw entities to extract them
         new_word = True
         for entity in raw_entities:
-            word = self.text[entity['start']:entity['end']]
+            word = text[entity['start']:entity['end']]
             if len(word) <=2:
                 continue
             entity_prefix = entity['entity'][0]
@@ -63,7 +158,7 @@ class FeatureExtractor:
             if new_word:
                 # Singular entities
                 if entity_prefix == 'S':
-                    self.entities[current_type].append(word) 
+                    entities[current_type].append(word)
                 # Beggining of multiple entities
                 elif entity_prefix == 'B':
                     current_entity.append(word)
@@ -74,50 +169,300 @@ class FeatureExtractor:
                 current_entity.append(word)
                 # End of multiple entities
                 if entity_prefix == 'E':
-                    self.entities[current_type].append(" ".join(current_entity))
+                    entities[current_type].append(" ".join(current_entity))
                     current_entity = []
                     new_word = True
+        return entities
 
-    def get_emotions(self):
+    def get_emotions(self, text):
         """
-        Extract emotion from user's input message.
+        Extract emotion probabilities from user's input message.
+
+        Args:
+            text (str): User's input message
         """
         #  Analysing emotions in text using the emotion extractor (Robertuito)
-        result = self.emotion_extractor.predict(self.text)
-
-        # Store the probabilities of each emotion in the attribute self.emotions
-        self.emotions = result.probas
-        return result.output
+        return self.emotion_extractor.predict(text).probas
 
-    def get_sentiment(self):
+    def get_sentiment(self, text):
         """
-        Extract sentiment from the user's input message and return the dominant sentiment.
-        """
-        # Extract sentiment from text
-        sentiments = self.sentiment_extractor.predict(self.text)
-        self.sentiment = sentiments.probas
+        Extract sentiment probabilities from the user's input message.
 
-        # Get dominant sentiment
-        dominant_sentiment = max(self.sentiment, key=self.sentiment.get)
-        dominant_prob = self.sentiment[dominant_sentiment]
-        return [dominant_sentiment, dominant_prob]
+        Args:
+            text (str): User's input message
+        """
+        return self.sentiment_extractor.predict(text).probas
 
-    def get_hate_speech(self):
+    def get_hate_speech(self, text):
         """
         Detect hate speech in user's input message
+
+        Args:
+            text (str): User's input message
         """
-        # Extract hate speech from text
-        hate = self.hate_extractor.predict(self.text)
-        self.hate = hate.probas
+        return self.hate_extractor.predict(text).probas
 
-    def get_irony(self):
+    def get_irony(self, text):
         """
         Detect irony in user's input message
-        """ 
-        # Extract irony from text
-        irony = self.irony_extractor.predict(self.text)
-        self.irony = irony.probas
 
+        Args:
+            text (str): User's input message
+        """
+        return self.irony_extractor.predict(text).probas
+
+    def get_entities_batch(self, texts, batch_size=BATCH_SIZE):
+        """
+        Extract entities from several messages, padding them together in each forward pass
+
+        Args:
+            texts (list): User's input messages
+            batch_size (int): Messages per forward pass
+
+        Returns:
+            entities (list): Entities grouped by type for each message
+        """
+        raw_entities = self.entity_extractor(texts, batch_size=batch_size)
+        return [self.clean_entities(text, raw) for text, raw in zip(texts, raw_entities)]
+
+    def get_probas_batch(self, analyzer, texts, batch_size=BATCH_SIZE):
+        """
+        Run a pysentimiento analyzer over several messages. Each chunk is predicted
+        as a list, which pysentimiento pads into a single tensor batch.
+
+        Args:
+            analyzer (ModelHandle): Shared pysentimiento analyzer
+            texts (list): User's input messages
+            batch_size (int): Messages per forward pass
+
+        Returns:
+            probas (list): Label probabilities for each message
+        """
+        probas = []
+        for chunk in chunks(texts, batch_size):
+            probas.extend(result.probas for result in analyzer.predict(chunk))
+        return probas
+
+    def group_heads(self):
+        """
+        Group the pysentimiento heads that share tokenizer and preprocessing, so each group is tokenized once.
+        The heads are independently fine-tuned models, so the forward passes themselves can't be shared.
+
+        Returns:
+            head_groups (list): Lists of head names with identical tokenization
+        """
+        if self.head_groups is None:
+            groups = []
+            for head in SENTIMENT_HEADS:
+                analyzer = self.models.get(head).model
+                for group in groups:
+                    reference = self.models.get(group[0]).model
+                    if (reference.tokenizer.get_vocab() == analyzer.tokenizer.get_vocab()
+                            and getattr(reference, 'preprocessing_args', {}) == getattr(analyzer, 'preprocessing_args', {})):
+                        group.append(head)
+                        break
+                else:
+                    groups.append([head])
+            self.head_groups = groups
+        return self.head_groups
+
+    def run_head(self, head, inputs):
+        """
+        Forward pass of one pysentimiento head over already tokenized messages
+
+        Args:
+            head (str): Head name in the registry
+            inputs (BatchEncoding): Padded tensor batch
+
+        Returns:
+            probas (list): Label probabilities for each message
+            elapsed (float): Forward pass time in seconds
+        """
+        import torch
+
+        handle = self.models.get(head)
+        model = handle.model.model
+        start = time.perf_counter()
+        with handle.lock, torch.no_grad():
+            logits = model(**inputs).logits
+        if model.config.problem_type == 'multi_label_classification':
+            scores = torch.sigmoid(logits)
+        else:
+            scores = torch.softmax(logits, dim=-1)
+        id2label = model.config.id2label
+        probas = [{id2label[i]: score for i, score in enumerate(row)} for row in scores.tolist()]
+        return probas, time.perf_counter() - start
+
+    def get_heads_batch(self, texts):
+        """
+        Shared analysis of the emotion, sentiment, hate speech and irony heads.
+        Messages are preprocessed and tokenized once per tokenizer group, then the heads run concurrently.
+
+        Args:
+            texts (list): User's input messages
+
+        Returns:
+            probas (dict): features_dict key -> label probabilities for each message
+            timings (dict): Seconds spent tokenizing and in each head
+        """
+        from pysentimiento.preprocessing import preprocess_tweet
+
+        probas = {}
+        timings = {}
+        futures = {}
+        for group in self.group_heads():
+            analyzer = self.models.get(group[0]).model
+            start = time.perf_counter()
+            preprocessed = [preprocess_tweet(text, lang='es', **getattr(analyzer, 'preprocessing_args', {})) for text in texts]
+            with self.models.get(group[0]).lock:
+                inputs = analyzer.tokenizer(preprocessed, padding=True, truncation=True, return_tensors='pt')
+            timings[f"tokenize_{group[0]}"] = time.perf_counter() - start
+            for head in group:
+                futures[head] = self.head_executor.submit(self.run_head, head, inputs)
+
+        for head, future in futures.items():
+            probas[SENTIMENT_HEADS[head]], timings[head] = future.result()
+        return probas, timings
+
+    def extract_batch(self, texts, batch_size=BATCH_SIZE):
+        """
+        Run every extractor over several messages
+
+        Args:
+            texts (list): User's input messages
+            batch_size (int): Messages per forward pass
+
+        Returns:
+            features_dicts (list): One features dictionary per message, in input order
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+
+        entities = self.get_entities_batch(texts, batch_size)
+        if self.mode == 'shared':
+            emotions, sentiments, hates, ironies = [], [], [], []
+            for chunk in chunks(texts, batch_size):
+                probas, timings = self.get_heads_batch(chunk)
+                emotions.extend(probas['emotion'])
+                sentiments.extend(probas['sentiment'])
+                hates.extend(probas['hate'])
+                ironies.extend(probas['irony'])
+                log_head_timings(timings, len(chunk))
+        else:
+            emotions = self.get_probas_batch(self.emotion_extractor, texts, batch_size)
+            sentiments = self.get_probas_batch(self.sentiment_extractor, texts, batch_size)
+            hates = self.get_probas_batch(self.hate_extractor, texts, batch_size)
+            ironies = self.get_probas_batch(self.irony_extractor, texts, batch_size)
+
+        return [
+            {
+                'emotion': emotion,
+                'entities': entity,
+                'sentiment': sentiment,
+                'hate': hate,
+                'irony': irony
+            }
+            for emotion, entity, sentiment, hate, irony in zip(emotions, entities, sentiments, hates, ironies)
+        ]
+
+    def get_shared_heads(self, text):
+        """
+        Shared analysis of the four pysentimiento heads over a single message
+
+        Args:
+            text (str): User's input message
+
+        Returns:
+            probas (dict): features_dict key -> label probabilities
+        """
+        probas, timings = self.get_heads_batch([text])
+        log_head_timings(timings, 1)
+        # Each head is reported as its extractor, tokenization as a stage of its own
+        for stage, seconds in timings.items():
+            if stage in SENTIMENT_HEADS:
+                record_stage(f"extract.{SENTIMENT_HEADS[stage]}", seconds)
+            else:
+                record_stage("extract.tokenize", seconds)
+        return {key: values[0] for key, values in probas.items()}
+
+    def run_stage(self, key, stage, text):
+        """
+        Run an extractor and record its time
+
+        Args:
+            key (str): Extractor name, the stage is reported as 'extract.<key>'
+            stage (callable): Extractor
+            text (str): User's input message
+        """
+        with timed(f"extract.{key}"):
+            return stage(text)
+
+    def extract(self, text):
+        """
+        Run every extractor over a message. The extractors don't depend on each other,
+        so with parallel mode on they run concurrently and the total time is close to the slowest one.
+
+        Args:
+            text (str): User's input message
+
+        Returns:
+            features_dict (dict): A dictionary with extracted features.
+        """
+        stages = {'entities': self.get_entities}
+        if self.mode == 'shared':
+            stages['heads'] = self.get_shared_heads
+        else:
+            stages.update({
+                'emotion': self.get_emotions,
+                'sentiment': self.get_sentiment,
+                'hate': self.get_hate_speech,
+                'irony': self.get_irony
+            })
+
+        if self.parallel:
+            futures = {key: self.stage_executor.submit(in_context(self.run_stage), key, stage, text) for key, stage in stages.items()}
+            results = {key: future.result() for key, future in futures.items()}
+        else:
+            results = {key: self.run_stage(key, stage, text) for key, stage in stages.items()}
+        results.update(results.pop('heads', {}))
+
+        return {key: results[key] for key in FEATURE_KEYS}
+
+# Shared extractor, models are loaded once per process on first use
+extractor = FeatureExtractor()
+
+# With an inference server configured, workers don't load any model themselves
+inference_client = InferenceClient() if INFERENCE_SOCKET else None
+
+# Results of repeated messages are served from the cache, tagged with the version of whoever extracts them
+if FEATURE_CACHE_SIZE > 0:
+    feature_cache = FeatureCache(version=inference_client.version if inference_client is not None else extractor.version_tag())
+else:
+    feature_cache = None
+
+def empty_features():
+    """
+    features_dict of a message that couldn't be analysed, analytics and rollups skip its empty features
+
+    Returns:
+        features_dict (dict): Every feature key with no values
+    """
+    return {key: {} for key in FEATURE_KEYS}
+
+def extract_features(text):
+    """
+    Extract the features of a normalized message, locally or on the inference server
+
+    Args:
+        text (str): Normalized message
+    """
+    if inference_client is not None:
+        with timed("extract.remote"):
+            return inference_client.extract(text)
+    return extractor.extract(text)
+
+@timed("features")
 def feature_extraction(user_input):
     """
     Extract emotions, entities, and sentiment from the user's input.
@@ -128,19 +473,28 @@ def feature_extraction(user_input):
     Returns:
         features_dict (dict): A dictionary with extracted features.
     """
-    featurer = FeatureExtractor(text = user_input)
-    featurer.get_entities()
-    featurer.get_emotions()
-    featurer.get_sentiment()
-    featurer.get_hate_speech()
-    featurer.get_irony()
-
-    features_dict = {
-        'emotion': featurer.emotions,
-        'entities': featurer.entities,
-        'sentiment': featurer.sentiment,
-        'hate': featurer.hate,
-        'irony': featurer.irony
-    }
-
-    return features_dict
\ No newline at end of file
+    text = normalize_text(user_input)
+    if feature_cache is None:
+        return extract_features(text)
+    return feature_cache.get_or_compute(text, extract_features)
+
+def feature_extraction_batch(texts, batch_size=BATCH_SIZE):
+    """
+    Extract features from a list of messages with batched forward passes, locally or on the inference server.
+    Meant for backfills and re-scoring stored messages, so results aren't cached and a backfill doesn't evict
+    the messages of the live chat.
+
+    Args:
+        texts (list): The text messages to process.
+        batch_size (int): Messages per forward pass, or per request to the inference server
+
+    Returns:
+        features_dicts (list): One features dictionary per message, same shape as feature_extraction.
+    """
+    texts = [normalize_text(text) for text in texts]
+    if inference_client is None:
+        return extractor.extract_batch(texts, batch_size=batch_size)
+    features_dicts = []
+    for chunk in chunks(texts, batch_size):
+        features_dicts.extend(inference_client.extract_batch(chunk))
+    return features_dicts
@@ -0,0 +1,336 @@
+# Local imports
+import math
+import os
+import queue
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+# Project imports
+from app.telemetry import get_logger
+
+logger = get_logger(__name__)
+
+# Inference service configuration
+INFERENCE_SOCKET = os.getenv("INFERENCE_SOCKET")
+# Only authentication of the socket, which exchanges pickles: there is no default key
+INFERENCE_AUTHKEY = (os.getenv("INFERENCE_AUTHKEY") or os.getenv("SECRET_KEY") or '').encode('utf-8')
+MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH", "16"))
+MAX_WAIT_MS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "10"))
+CLIENT_TIMEOUT = float(os.getenv("INFERENCE_TIMEOUT", "30"))
+PING_TIMEOUT = float(os.getenv("INFERENCE_PING_TIMEOUT", "2"))
+# Seconds a client trusts the version tag of the server before asking again
+VERSION_TTL = float(os.getenv("INFERENCE_VERSION_TTL", "10"))
+
+# Control message asking the server for its status instead of the features of a message
+PING = ('ping',)
+# Tag of a message carrying a list of texts, answered with the features of each one
+BATCH = 'batch'
+
+def require_authkey(authkey):
+    """
+    Refuse to serve or connect without a shared key
+
+    Args:
+        authkey (bytes): Shared key of the inference server
+    """
+    if not authkey:
+        raise ValueError("INFERENCE_AUTHKEY or SECRET_KEY must be set to use the inference server.")
+
+class InferenceRequest:
+    """
+    Message waiting in the micro-batching queue
+    """
+    def __init__(self, text):
+        self.text = text
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+class InferenceServer:
+    """
+    Local service that owns the feature extraction models and serves every web worker
+    through a Unix socket, merging concurrent messages into micro-batches.
+    """
+    def __init__(self, address=INFERENCE_SOCKET, authkey=INFERENCE_AUTHKEY, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS, extractor=None):
+        """
+        Initialize inference server
+
+        Args:
+            address (str): Unix socket path
+            authkey (bytes): Shared key clients must present
+            max_batch_size (int): Maximum messages per micro-batch
+            max_wait_ms (float): Maximum time a message waits for others to join its batch
+            extractor (FeatureExtractor): Extractor running the batches
+        """
+        require_authkey(authkey)
+        if extractor is None:
+            from app.feature_extraction import extractor
+        self.address = address
+        self.authkey = authkey
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.extractor = extractor
+        self.requests = queue.Queue()
+        self.ready = threading.Event()
+        self.load_error = None
+        # Enqueueing and the drain after a failed load are exclusive, so no message is left waiting in the queue
+        self.queue_lock = threading.Lock()
+
+    def next_batch(self):
+        """
+        Block until a message arrives, then gather more until the batch is full or the wait window closes
+
+        Returns:
+            batch (list): Pending inference requests
+        """
+        batch = [self.requests.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requests.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def run_batches(self):
+        """
+        Batching loop, runs the models over each micro-batch and wakes up the waiting connections
+        """
+        while True:
+            batch = self.next_batch()
+            try:
+                results = self.extractor.extract_batch([request.text for request in batch], batch_size=len(batch))
+                for request, result in zip(batch, results):
+                    request.result = result
+            except Exception as e:
+                for request in batch:
+                    request.error = str(e)
+            for request in batch:
+                request.done.set()
+
+    def status(self):
+        """
+        Status sent in reply to a ping
+
+        Returns:
+            status (dict): Whether the models are loaded and serving, the load error if any, and the version tag
+                of the features the server produces
+        """
+        return {
+            'ready': self.ready.is_set(),
+            'error': self.load_error,
+            'version': self.extractor.version_tag()
+        }
+
+    def load_models(self):
+        """
+        Load the models, then start the batching loop. Messages received meanwhile wait in the queue,
+        and get the load error if the models can't be loaded.
+        """
+        try:
+            self.extractor.models.load_all()
+        except Exception as e:
+            logger.exception("Inference models failed to load")
+            with self.queue_lock:
+                self.load_error = str(e)
+                while not self.requests.empty():
+                    request = self.requests.get()
+                    request.error = f"Models failed to load: {self.load_error}"
+                    request.done.set()
+            return
+        threading.Thread(target=self.run_batches, daemon=True).start()
+        self.ready.set()
+        logger.info("Inference server ready")
+
+    def handle_connection(self, conn):
+        """
+        Serve one client connection until it is closed
+
+        Args:
+            conn (Connection): Accepted client connection
+        """
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except (EOFError, OSError):
+                    return
+                if message == PING:
+                    try:
+                        conn.send(('ok', self.status()))
+                    except OSError:
+                        return
+                    continue
+
+                # A list of texts is queued message by message, so it joins the micro-batches of the other clients
+                batched = isinstance(message, tuple) and message[0] == BATCH
+                requests = [InferenceRequest(text) for text in (message[1] if batched else [message])]
+                with self.queue_lock:
+                    for request in requests:
+                        if self.load_error is None:
+                            self.requests.put(request)
+                        else:
+                            request.error = f"Models failed to load: {self.load_error}"
+                            request.done.set()
+                for request in requests:
+                    request.done.wait()
+
+                errors = [request.error for request in requests if request.error is not None]
+                results = [request.result for request in requests]
+                try:
+                    if errors:
+                        conn.send(('error', errors[0]))
+                    else:
+                        conn.send(('ok', results if batched else results[0]))
+                except OSError:
+                    # Client gave up waiting and closed the connection
+                    return
+
+    def serve_forever(self):
+        """
+        Accept client connections while the models load, pings report when they are ready
+        """
+        if os.path.exists(self.address):
+            os.remove(self.address)
+
+        threading.Thread(target=self.load_models, daemon=True).start()
+        with Listener(self.address, family='AF_UNIX', authkey=self.authkey) as listener:
+            logger.info("Inference server listening", extra={'address': self.address})
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    logger.warning("Rejected inference connection", extra={'error': str(e)})
+                    continue
+                threading.Thread(target=self.handle_connection, args=(conn,), daemon=True).start()
+
+class InferenceClient:
+    """
+    Thin client used by the web workers, keeps one connection per thread
+    """
+    def __init__(self, address=INFERENCE_SOCKET, authkey=INFERENCE_AUTHKEY, timeout=CLIENT_TIMEOUT):
+        """
+        Initialize inference client
+
+        Args:
+            address (str): Unix socket path of the inference server
+            authkey (bytes): Shared key of the inference server
+            timeout (float): Seconds to wait for a result
+        """
+        require_authkey(authkey)
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+        self.local = threading.local()
+        self.version_tag = None
+        self.version_checked = 0.0
+
+    def connection(self):
+        """
+        Get the connection of the current thread, opening it if needed
+        """
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = Client(self.address, family='AF_UNIX', authkey=self.authkey)
+            self.local.conn = conn
+        return conn
+
+    def close(self):
+        """
+        Drop the connection of the current thread
+        """
+        conn = getattr(self.local, 'conn', None)
+        if conn is not None:
+            self.local.conn = None
+            conn.close()
+        # The server may have restarted with other models, check its version on the next lookup
+        self.version_checked = 0.0
+
+    def request(self, message, timeout):
+        """
+        Send a message to the inference server and wait for its reply
+
+        Args:
+            message (Object): Message text or control message
+            timeout (float): Seconds to wait for the reply
+
+        Returns:
+            payload (Object): Reply of the server
+        """
+        for attempt in range(2):
+            try:
+                conn = self.connection()
+                conn.send(message)
+                break
+            except (EOFError, OSError):
+                # Stale connection after a server restart, retry once with a new one
+                self.close()
+                if attempt:
+                    raise
+
+        if not conn.poll(timeout):
+            self.close()
+            raise TimeoutError("The inference service did not answer in time.")
+        status, payload = conn.recv()
+        if status == 'error':
+            raise RuntimeError(f"Inference service error: {payload}")
+        return payload
+
+    def extract(self, text):
+        """
+        Extract the features of a message on the inference server
+
+        Args:
+            text (str): User's input message
+
+        Returns:
+            features_dict (dict): A dictionary with extracted features.
+        """
+        return self.request(text, self.timeout)
+
+    def extract_batch(self, texts):
+        """
+        Extract the features of several messages on the inference server, they're batched with the
+        messages of the other clients
+
+        Args:
+            texts (list): User's input messages
+
+        Returns:
+            features_dicts (list): One features dictionary per message, in input order
+        """
+        return self.request((BATCH, list(texts)), self.timeout * max(1, math.ceil(len(texts) / MAX_BATCH_SIZE)))
+
+    def ping(self, timeout=PING_TIMEOUT):
+        """
+        Status of the inference server
+
+        Args:
+            timeout (float): Seconds to wait for the reply
+
+        Returns:
+            status (dict): 'ready', 'error' and 'version' of the server
+        """
+        return self.request(PING, timeout)
+
+    def version(self):
+        """
+        Version tag of the features produced by the server, for the feature cache. It's asked again every
+        VERSION_TTL seconds and after a dropped connection, so a restart with another backend or models is noticed.
+
+        Returns:
+            tag (str): Version tag of the server's extractor
+        """
+        if self.version_tag is None or time.monotonic() - self.version_checked > VERSION_TTL:
+            self.version_tag = self.ping()['version']
+            self.version_checked = time.monotonic()
+        return self.version_tag
+
+if __name__ == '__main__':
+    if not INFERENCE_SOCKET:
+        raise SystemExit("INFERENCE_SOCKET must be set to run the inference server.")
+    InferenceServer().serve_forever()
\ No newline at end of file
@@ -0,0 +1,132 @@
+# Local imports
+import os
+import time
+import zlib
+
+# Chat completion backend: 'openai' or 'local' for offline benchmarks and load tests
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai")
+LOCAL_LLM_LATENCY = float(os.getenv("LOCAL_LLM_LATENCY", "0.5"))
+LOCAL_LLM_TOKEN_RATE = float(os.getenv("LOCAL_LLM_TOKEN_RATE", "30"))
+
+# Replies of the local backend, '{message}' is replaced by the user's message
+LOCAL_RESPONSES = [
+    "Entiendo lo que me cuentas sobre \"{message}\". ¿Cómo te hace sentir eso?",
+    "Gracias por compartirlo. ¿Desde cuándo te sientes así con \"{message}\"?",
+    "Parece que \"{message}\" es importante para ti. ¿Quieres contarme un poco más?",
+    "Te escucho. ¿Qué crees que podría ayudarte ahora mismo con \"{message}\"?",
+    "Es normal sentirse así a veces. ¿Hay alguien con quien puedas hablar de \"{message}\"?",
+]
+
+class LLMBackend:
+    """
+    Interface of the chat completion backends used by the chatbot
+    """
+    def complete(self, **params):
+        """
+        Chat completion
+
+        Args:
+            params (dict): Arguments in chat.completions.create format
+
+        Returns:
+            message (str): Chatbot response
+        """
+        raise NotImplementedError
+
+    def stream(self, **params):
+        """
+        Streamed chat completion
+
+        Args:
+            params (dict): Arguments in chat.completions.create format
+
+        Yield:
+            token (str): Next piece of the chatbot response
+        """
+        raise NotImplementedError
+
+class OpenAIBackend(LLMBackend):
+    """
+    OpenAI chat completions through the shared LLM client
+    """
+    def __init__(self, client):
+        """
+        Initialize OpenAI backend
+
+        Args:
+            client (LLMClient): Shared pooled client
+        """
+        self.client = client
+
+    def complete(self, **params):
+        response = self.client.create(**params)
+        return response.choices[0].message.content
+
+    def stream(self, **params):
+        for chunk in self.client.stream(**params):
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+class LocalBackend(LLMBackend):
+    """
+    Deterministic stand-in that answers template replies with a configurable latency and token rate,
+    to benchmark and load test the chat pipeline without spending API budget
+    """
+    def __init__(self, latency=LOCAL_LLM_LATENCY, tokens_per_second=LOCAL_LLM_TOKEN_RATE, responses=LOCAL_RESPONSES):
+        """
+        Initialize local backend
+
+        Args:
+            latency (float): Seconds before the first token
+            tokens_per_second (float): Generation speed, 0 for instant replies
+            responses (list): Reply templates
+        """
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.responses = responses
+
+    def tokens(self, params):
+        """
+        Reply tokens for a request, always the same for the same user message
+
+        Args:
+            params (dict): Arguments in chat.completions.create format
+        """
+        user_messages = [message['content'] for message in params.get('messages', []) if message['role'] == 'user']
+        message = user_messages[-1] if user_messages else ''
+        template = self.responses[zlib.crc32(message.encode('utf-8')) % len(self.responses)]
+        words = template.format(message=message).split(' ')
+        words = words[:params.get('max_tokens') or len(words)]
+        return [word if index == 0 else f" {word}" for index, word in enumerate(words)]
+
+    def token_delay(self):
+        return 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0
+
+    def complete(self, **params):
+        tokens = self.tokens(params)
+        time.sleep(self.latency + len(tokens) * self.token_delay())
+        return ''.join(tokens)
+
+    def stream(self, **params):
+        time.sleep(self.latency)
+        for token in self.tokens(params):
+            yield token
+            time.sleep(self.token_delay())
+
+def get_backend(api_key, name=LLM_BACKEND):
+    """
+    Build the configured chat completion backend
+
+    Args:
+        api_key (str): Key for OpenAI API
+        name (str): 'openai' or 'local'
+
+    Returns:
+        backend (LLMBackend): Chat completion backend
+    """
+    if name == 'local':
+        return LocalBackend()
+    if name == 'openai':
+        from app.llm_client import get_llm_client
+        return OpenAIBackend(get_llm_client(api_key))
+    raise ValueError(f"Unknown LLM backend '{name}', expected 'openai' or 'local'")
\ No newline at end of file
@@ -0,0 +1,229 @@
+# Local imports
+import os
+import random
+import threading
+import time
+
+# Third party imports
+import httpx
+import openai
+from openai import OpenAI
+
+# LLM client configuration
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "20"))
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_BACKOFF = float(os.getenv("LLM_BACKOFF", "0.5"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+
+class LLMUnavailableError(TimeoutError):
+    """
+    The LLM didn't answer within the deadline, kept failing, or the circuit breaker is open.
+    It is a TimeoutError so the routes answer it as a temporary unavailability.
+    """
+
+def is_retryable(error):
+    """
+    Check if an OpenAI error is worth retrying: rate limits, server errors and connection problems
+
+    Args:
+        error (Exception): Raised error
+    """
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+class CircuitBreaker:
+    """
+    Fails fast after repeated upstream failures, and lets a single trial call through once the reset time has passed
+    """
+    def __init__(self, threshold=LLM_BREAKER_THRESHOLD, reset_after=LLM_BREAKER_RESET):
+        """
+        Initialize circuit breaker
+
+        Args:
+            threshold (int): Consecutive failures that open the circuit
+            reset_after (float): Seconds the circuit stays open before a trial call
+        """
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    @property
+    def state(self):
+        """
+        'closed', 'open' or 'half_open'
+        """
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            return 'half_open'
+        return 'open'
+
+    def allow(self):
+        """
+        Check if a call can go upstream
+        """
+        with self.lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half_open' and not self.trial_running:
+                self.trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def release_trial(self):
+        """
+        End a call that says nothing about upstream health, e.g. a client error. The failure count
+        and the open state are kept, only a half-open trial slot is freed.
+        """
+        with self.lock:
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+class LLMClient:
+    """
+    Pooled OpenAI client shared by every chatbot of the process, with per-request deadlines,
+    jittered retries on rate limits and server errors, a concurrency limit and a circuit breaker.
+    """
+    def __init__(self, api_key, base_url=OPENAI_BASE_URL, timeout=LLM_TIMEOUT, deadline=LLM_DEADLINE, max_retries=LLM_MAX_RETRIES,
+                 backoff=LLM_BACKOFF, max_concurrency=LLM_MAX_CONCURRENCY, breaker=None):
+        """
+        Initialize LLM client
+
+        Args:
+            api_key (str): Key for OpenAI API
+            base_url (str): API base url, None for OpenAI
+            timeout (float): Seconds allowed to each attempt
+            deadline (float): Seconds allowed to a request including retries and waiting for a slot
+            max_retries (int): Retries after the first attempt
+            backoff (float): Base seconds of the exponential backoff
+            max_concurrency (int): Requests in flight at the same time
+            breaker (CircuitBreaker): Circuit breaker, a new one by default
+        """
+        limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+        self.client = OpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0,
+                             http_client=httpx.Client(limits=limits, timeout=timeout))
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.breaker = breaker or CircuitBreaker()
+
+    def acquire(self, deadline):
+        """
+        Wait for a free request slot until the deadline
+        """
+        if not self.slots.acquire(timeout=max(0, deadline - time.monotonic())):
+            raise LLMUnavailableError("Too many requests waiting for the chatbot service.")
+
+    def open(self, params, deadline):
+        """
+        Send a chat completion request, retrying with jittered exponential backoff
+
+        Args:
+            params (dict): Arguments for chat.completions.create
+            deadline (float): time.monotonic() limit of the request
+
+        Returns:
+            response (Object): Chat completion, or the stream when params ask for one
+        """
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                raise LLMUnavailableError("The chatbot service is failing, requests are paused for a while.")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise LLMUnavailableError("The chatbot service did not answer in time.")
+
+            try:
+                response = self.client.with_options(timeout=min(self.timeout, remaining)).chat.completions.create(**params)
+            except Exception as e:
+                if not is_retryable(e):
+                    # Client errors say nothing about upstream health
+                    self.breaker.release_trial()
+                    raise
+                self.breaker.record_failure()
+                if attempt == self.max_retries:
+                    raise LLMUnavailableError(f"The chatbot service is unavailable: {e}") from e
+                pause = random.uniform(0, self.backoff * 2 ** attempt)
+                time.sleep(max(0, min(pause, deadline - time.monotonic())))
+            else:
+                self.breaker.record_success()
+                return response
+
+    def create(self, **params):
+        """
+        Chat completion within the request deadline
+
+        Returns:
+            response (ChatCompletion): Chat completion
+        """
+        deadline = time.monotonic() + self.deadline
+        self.acquire(deadline)
+        try:
+            return self.open(params, deadline)
+        finally:
+            self.slots.release()
+
+    def stream(self, **params):
+        """
+        Streamed chat completion. Retries only happen before the first chunk, once tokens
+        have been sent to the user a failure ends the stream.
+
+        Yield:
+            chunk (ChatCompletionChunk): Next chunk of the completion
+        """
+        deadline = time.monotonic() + self.deadline
+        self.acquire(deadline)
+        try:
+            stream = self.open({**params, 'stream': True}, deadline)
+            try:
+                for chunk in stream:
+                    yield chunk
+            except Exception as e:
+                self.breaker.record_failure()
+                raise LLMUnavailableError(f"The chatbot service stopped answering: {e}") from e
+            finally:
+                stream.response.close()
+        finally:
+            self.slots.release()
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_llm_client(api_key):
+    """
+    Get the shared LLM client of this process. Clients are created on first use, so forked
+    workers never share the connection pool of their parent.
+
+    Args:
+        api_key (str): Key for OpenAI API
+
+    Returns:
+        client (LLMClient): Shared client
+    """
+    key = (os.getpid(), api_key)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = LLMClient(api_key)
+        return _clients[key]
\ No newline at end of file
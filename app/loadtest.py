@@ -0,0 +1,359 @@
+# Local imports
+import argparse
+import json
+import os
+import random
+import secrets
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+# Third party imports
+import requests
+
+# Project imports
+from app.backend_report import SAMPLE_MESSAGES
+from app.benchmark import git_commit, latency_stats
+
+# PNG charts requested after loading the analytics page, same names as analytics.CHARTS
+CHART_ROUTES = ('emotion_pie', 'emotion_evolution', 'sentiments', 'most_positive_entities',
+                'least_positive_entities', 'hate_evolution', 'irony_evolution')
+
+# Operations of the scenario, reported apart
+OPERATIONS = ('signup', 'login', 'chat', 'analytics', 'chart')
+
+class VirtualUser:
+    """
+    Synthetic user with its own cookie session, runs the chat and analytics scenario against the app
+    """
+    def __init__(self, base_url, username, password, rng, timeout):
+        """
+        Initialize virtual user
+
+        Args:
+            base_url (str): App url, e.g. http://127.0.0.1:8000
+            username (str): Username, also used in the email
+            password (str): Password
+            rng (Random): Seeded random generator of the messages
+            timeout (float): Seconds before a request counts as failed
+        """
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.rng = rng
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.turn = 0
+
+    def request(self, samples, operation, method, path, expected, **kwargs):
+        """
+        Send a request and record its latency and result
+
+        Args:
+            samples (list): (operation, seconds, ok) tuples of the run
+            operation (str): Name in OPERATIONS
+            method (str): HTTP method
+            path (str): Route of the app
+            expected (tuple): Status codes that count as a success
+
+        Returns:
+            response (Response): App response, None on a connection error or timeout
+        """
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, f"{self.base_url}{path}", timeout=self.timeout, allow_redirects=False, **kwargs)
+            # The body is part of the latency, the streamed PNGs included
+            response.content
+        except requests.RequestException:
+            samples.append((operation, time.perf_counter() - start, False))
+            return None
+        samples.append((operation, time.perf_counter() - start, response.status_code in expected))
+        return response
+
+    def signup(self, samples):
+        form = {
+            'fullname': f"Load {self.username}",
+            'email': f"{self.username}@loadtest.invalid",
+            'username': self.username,
+            'password': self.password,
+            'confirm_password': self.password,
+            'age': '30',
+            'gender': self.rng.choice(['Male', 'Female', 'Other']),
+            'country': 'España',
+            'language': 'Español'
+        }
+        return self.request(samples, 'signup', 'POST', '/signup', (302,), data=form)
+
+    def login(self, samples):
+        """
+        Log in, which starts a new conversation
+        """
+        response = self.request(samples, 'login', 'POST', '/login', (302,), data={'username': self.username, 'password': self.password})
+        return response is not None and response.status_code == 302
+
+    def chat(self, samples, unique_messages=True):
+        """
+        Send one message of the conversation
+        """
+        self.turn += 1
+        message = self.rng.choice(SAMPLE_MESSAGES)
+        if unique_messages:
+            # Keeps the feature cache from answering repeated messages
+            message = f"{message} ({self.username} {self.turn})"
+        self.request(samples, 'chat', 'POST', '/chat', (200,), json={'message': message})
+
+    def analytics(self, samples):
+        """
+        Load the analytics page and its seven PNG charts. Charts without data answer 404, which is not an error.
+        """
+        self.request(samples, 'analytics', 'GET', '/analytics', (200,))
+        for chart in CHART_ROUTES:
+            self.request(samples, 'chart', 'GET', f'/analytics/{chart}.png', (200, 304, 404))
+
+    def delete_account(self):
+        """
+        Remove the user and its data through the app
+        """
+        try:
+            if self.login([]):
+                self.session.post(f"{self.base_url}/delete_user_account", timeout=self.timeout, allow_redirects=False)
+        except requests.RequestException:
+            pass
+
+    def run_session(self, samples, turns, unique_messages=True):
+        """
+        One visit: log in, chat for some turns and open the analytics
+        """
+        if not self.login(samples):
+            return
+        for _ in range(turns):
+            self.chat(samples, unique_messages)
+        self.analytics(samples)
+
+def run_level(users, concurrency, duration, turns, unique_messages=True):
+    """
+    Closed loop run, each of the concurrent users repeats its session until the time is over
+
+    Args:
+        users (list): Signed up virtual users, at least concurrency of them
+        concurrency (int): Users running at the same time
+        duration (float): Seconds of the run
+        turns (int): Chat messages per session
+
+    Returns:
+        result (dict): Throughput, error rate and latency of each operation
+    """
+    samples_by_user = [[] for _ in range(concurrency)]
+    deadline = time.perf_counter() + duration
+
+    def loop(user, samples):
+        while time.perf_counter() < deadline:
+            user.run_session(samples, turns, unique_messages)
+
+    threads = [threading.Thread(target=loop, args=(users[i], samples_by_user[i]), daemon=True) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    samples = [sample for user_samples in samples_by_user for sample in user_samples]
+    result = {
+        'concurrency': concurrency,
+        'seconds': elapsed,
+        'requests': len(samples),
+        'throughput_rps': len(samples) / elapsed,
+        # A level without a single answer counts as failed
+        'error_rate': sum(1 for _, _, ok in samples if not ok) / len(samples) if samples else 1.0,
+        'operations': {}
+    }
+    for operation in OPERATIONS:
+        latencies = [seconds for name, seconds, _ in samples if name == operation]
+        if not latencies:
+            continue
+        errors = sum(1 for name, _, ok in samples if name == operation and not ok)
+        result['operations'][operation] = {**latency_stats(latencies, elapsed), 'error_rate': errors / len(latencies)}
+    return result
+
+def capacity(levels, slo_ms, max_error_rate):
+    """
+    Highest concurrency whose chat p95 and error rate stay within the objectives
+
+    Args:
+        levels (list): Outputs of run_level, in increasing concurrency
+        slo_ms (float): Objective of the chat p95 latency
+        max_error_rate (float): Objective of the error rate
+
+    Returns:
+        capacity (dict): Concurrent users and throughput sustained, None if not even the first level met them
+    """
+    best = None
+    for level in levels:
+        chat = level['operations'].get('chat')
+        if chat is None or chat['p95_ms'] > slo_ms or level['error_rate'] > max_error_rate:
+            break
+        best = {'concurrent_users': level['concurrency'], 'throughput_rps': level['throughput_rps'], 'chat_p95_ms': chat['p95_ms']}
+    return best
+
+def start_server(workers, worker_class, threads, port, env):
+    """
+    Start the app with gunicorn and wait until it is ready
+
+    Args:
+        workers (int): Worker processes
+        worker_class (str): gunicorn worker class, e.g. 'sync' or 'gthread'
+        threads (int): Threads per worker of the gthread class
+        port (int): Local port
+        env (dict): Environment of the server
+
+    Returns:
+        server (Popen): gunicorn master process
+    """
+    command = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+               '--worker-class', worker_class, '--threads', str(threads), '--timeout', '120', 'app.app:app']
+    server = subprocess.Popen(command, env=env)
+    deadline = time.monotonic() + 300
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with code {server.returncode}")
+        try:
+            if requests.get(f'http://127.0.0.1:{port}/readyz', timeout=2).status_code == 200:
+                return server
+        except requests.RequestException:
+            pass
+        time.sleep(0.5)
+    stop_server(server)
+    raise RuntimeError("gunicorn didn't answer in 300 seconds")
+
+def stop_server(server):
+    server.terminate()
+    try:
+        server.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+        server.wait()
+
+def run_scenario(base_url, args, rng):
+    """
+    Sign up the users, run every concurrency level against a running app and delete the users
+
+    Args:
+        base_url (str): App url
+        args (Namespace): Command line arguments
+        rng (Random): Seeded random generator
+
+    Returns:
+        result (dict): Signup stats, levels and capacity
+    """
+    run_id = secrets.token_hex(3)
+    password = secrets.token_urlsafe(12)
+    users = [VirtualUser(base_url, f"load_{run_id}_{n}", password, random.Random(rng.random()), args.timeout)
+             for n in range(max(args.concurrency))]
+
+    signup_samples = []
+    for user in users:
+        user.signup(signup_samples)
+    signup = latency_stats([seconds for _, seconds, _ in signup_samples])
+    signup['error_rate'] = sum(1 for _, _, ok in signup_samples if not ok) / len(signup_samples)
+
+    levels = []
+    try:
+        for concurrency in sorted(args.concurrency):
+            level = run_level(users, concurrency, args.duration, args.turns, not args.repeat_messages)
+            print(f"  {concurrency} users: {level['throughput_rps']:.1f} req/s, errors {level['error_rate']:.1%}", file=sys.stderr)
+            levels.append(level)
+    finally:
+        if not args.keep_users:
+            for user in users:
+                user.delete_account()
+    return {'signup': signup, 'levels': levels, 'capacity': capacity(levels, args.slo_ms, args.max_error_rate)}
+
+def print_report(report):
+    """
+    Print the capacity report as markdown tables
+
+    Args:
+        report (dict): Load test report
+    """
+    print(f"Commit {report['commit']}, LLM latency {report['params']['llm_latency']}s, "
+          f"chat p95 objective {report['params']['slo_ms']:.0f}ms\n")
+    print("| Server | Users | req/s | Errors | Chat p50 (ms) | Chat p95 (ms) | Chat p99 (ms) | Analytics p95 (ms) | Chart p95 (ms) |")
+    print("|---|---|---|---|---|---|---|---|---|")
+    for name, server in report['servers'].items():
+        for level in server.get('levels', []):
+            operations = level['operations']
+            chat = operations.get('chat', {})
+            print(f"| {name} | {level['concurrency']} | {level['throughput_rps']:.1f} | {level['error_rate']:.1%} "
+                  f"| {chat.get('p50_ms', 0):.0f} | {chat.get('p95_ms', 0):.0f} | {chat.get('p99_ms', 0):.0f} "
+                  f"| {operations.get('analytics', {}).get('p95_ms', 0):.0f} | {operations.get('chart', {}).get('p95_ms', 0):.0f} |")
+
+    print("\n| Server | Capacity (users) | req/s at capacity |")
+    print("|---|---|---|")
+    for name, server in report['servers'].items():
+        best = server.get('capacity')
+        if 'error' in server:
+            print(f"| {name} | failed: {server['error']} | |")
+        elif best is None:
+            print(f"| {name} | below the lowest level | |")
+        else:
+            print(f"| {name} | {best['concurrent_users']} | {best['throughput_rps']:.1f} |")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="HTTP load test of the chat and analytics routes and capacity report per gunicorn configuration")
+    parser.add_argument('--url', help="Test an already running app instead of starting gunicorn")
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help="gunicorn worker counts")
+    parser.add_argument('--worker-classes', nargs='+', default=['sync', 'gthread'], help="gunicorn worker classes")
+    parser.add_argument('--threads', type=int, default=4, help="Threads per worker of the gthread class")
+    parser.add_argument('--port', type=int, default=8800, help="Port of the started servers")
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32], help="Concurrent users of each level")
+    parser.add_argument('--duration', type=float, default=60, help="Seconds of each level")
+    parser.add_argument('--turns', type=int, default=5, help="Chat messages per session before opening the analytics")
+    parser.add_argument('--mongo-uri', default='mongodb://127.0.0.1:27017', help="Mongo of the started servers, use a throwaway local mongod")
+    parser.add_argument('--llm-latency', type=float, default=0.5, help="Seconds the stubbed LLM takes before answering")
+    parser.add_argument('--timeout', type=float, default=60, help="Seconds before a request counts as failed")
+    parser.add_argument('--slo-ms', type=float, default=2000, help="Chat p95 latency objective of the capacity")
+    parser.add_argument('--max-error-rate', type=float, default=0.01, help="Error rate objective of the capacity")
+    parser.add_argument('--repeat-messages', action='store_true', help="Send the sample messages as they are, so the feature cache answers them")
+    parser.add_argument('--keep-users', action='store_true', help="Don't delete the synthetic users at the end")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic messages")
+    parser.add_argument('--output', help="Path of the JSON report")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    report = {
+        'commit': git_commit(),
+        'date': datetime.now().isoformat(timespec='seconds'),
+        'cpus': os.cpu_count(),
+        'params': {key: value for key, value in vars(args).items() if key not in ('output', 'url', 'mongo_uri')},
+        'servers': {}
+    }
+
+    if args.url:
+        print(f"Load testing {args.url}", file=sys.stderr)
+        report['servers']['external'] = run_scenario(args.url, args, rng)
+    else:
+        # Local Mongo and the stubbed LLM, the app code is the only thing measured
+        env = {**os.environ, 'LLM_BACKEND': 'local', 'LOCAL_LLM_LATENCY': str(args.llm_latency), 'PRELOAD_MODELS': '1',
+               'MONGO_URI': args.mongo_uri}
+        env.setdefault('SECRET_KEY', secrets.token_hex(16))
+        for worker_class in args.worker_classes:
+            for workers in args.workers:
+                name = f"{worker_class} x{workers}"
+                print(f"Load testing gunicorn {name}", file=sys.stderr)
+                try:
+                    server = start_server(workers, worker_class, args.threads, args.port, env)
+                except RuntimeError as e:
+                    report['servers'][name] = {'error': str(e)}
+                    continue
+                try:
+                    report['servers'][name] = run_scenario(f'http://127.0.0.1:{args.port}', args, rng)
+                finally:
+                    stop_server(server)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
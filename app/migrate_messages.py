@@ -0,0 +1,176 @@
+# Local imports
+import argparse
+import os
+
+# Third party imports
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+
+# Project imports
+from app.db_indexes import INDEXES, ensure_indexes
+from app.telemetry import get_logger
+
+logger = get_logger(__name__)
+
+# Header fields of the old schema, kept after the migration until they're dropped with --drop-legacy
+LEGACY_FIELDS = ('messages', 'entities', 'emotions', 'hate', 'irony')
+
+def mentions(message, entity):
+    """
+    Check whether a message's text contains every word of an entity
+    """
+    text = message.get('user_message') or ''
+    return all(word in text for word in entity.split())
+
+def entities_by_message(messages, entities):
+    """
+    Split the entities stored in an old conversation header between its messages. Each entity was saved
+    in message order together with the sentiment of the message it came from. The entity goes to the next
+    message with that sentiment whose text contains it, or to the next one with that sentiment if none does.
+    It's still ambiguous when more of those messages contain the entity than times it was saved, or when none
+    contains it and several share the sentiment. These entities are counted.
+
+    Args:
+        messages (list): Conversation messages
+        entities (dict): Entity type -> list of (entity, sentiment) pairs
+
+    Returns:
+        message_entities (list): Entities grouped by type for each message
+        ambiguous (int): Entities that more than one message could have mentioned
+    """
+    message_entities = [{'people': [], 'places': [], 'orgs': [], 'others': []} for _ in messages]
+    ambiguous = 0
+    for entity_type, entity_list in entities.items():
+        position = 0
+        for index, entity_info in enumerate(entity_list):
+            if len(entity_info) != 2:
+                continue
+            entity, sentiment = entity_info
+            candidates = [i for i in range(position, len(messages)) if messages[i].get('sentiment') == sentiment]
+            if not candidates:
+                break
+            containing = [i for i in candidates if mentions(messages[i], entity)]
+            saved = sum(1 for other in entity_list[index:] if list(other) == list(entity_info))
+            if len(containing) > saved or (not containing and len(candidates) > 1):
+                ambiguous += 1
+            position = containing[0] if containing else candidates[0]
+            message_entities[position].setdefault(entity_type, []).append(entity)
+    return message_entities, ambiguous
+
+def message_documents(conversation):
+    """
+    Documents of the messages collection for a conversation with an embedded messages array
+
+    Args:
+        conversation (dict): Old conversation document
+
+    Returns:
+        documents (list): One document per message, keyed by (conversation_id, seq)
+        ambiguous (int): Entities whose message is ambiguous
+    """
+    messages = conversation.get('messages', [])
+    message_entities, ambiguous = entities_by_message(messages, conversation.get('entities', {}))
+    documents = []
+    for i, message in enumerate(messages):
+        documents.append({
+            'conversation_id': conversation['_id'],
+            'seq': i + 1,
+            'user_id': conversation.get('user_id'),
+            # Old messages had no timestamp of their own
+            'timestamp': message.get('timestamp', conversation.get('start_time')),
+            'user_message': message.get('user_message'),
+            'bot_message': message.get('bot_message'),
+            'emotions': message.get('emotions', {}),
+            'sentiment': message.get('sentiment', {}),
+            'hate': message.get('hate', {}),
+            'irony': message.get('irony', {}),
+            'entities': message_entities[i]
+        })
+    return documents, ambiguous
+
+def migrate(db, batch_size=500, dry_run=False):
+    """
+    Move the messages embedded in conversation documents to the messages collection.
+    Messages are upserted by (conversation_id, seq), so the migration can be run again after a failure.
+    Migrated headers are marked and keep their old fields, to check the result or migrate them again
+    with a fix, until drop_legacy removes them.
+
+    Args:
+        db (Database): Mongo database
+        batch_size (int): Conversations migrated per bulk write
+        dry_run (bool): Only count what would be migrated
+
+    Returns:
+        stats (dict): Migrated conversations and messages, and entities assigned with ambiguity
+    """
+    if not dry_run:
+        ensure_indexes(db, {'messages': INDEXES['messages']})
+
+    stats = {'conversations': 0, 'messages': 0, 'ambiguous_entities': 0}
+    pending = []
+
+    def flush():
+        if not pending:
+            return
+        conversation_ids = [conversation_id for conversation_id, _ in pending]
+        operations = [UpdateOne({'conversation_id': document['conversation_id'], 'seq': document['seq']},
+                                {'$set': document}, upsert=True)
+                      for _, documents in pending for document in documents]
+        if operations:
+            db.messages.bulk_write(operations, ordered=False)
+        # Headers are only marked once their messages are stored, new messages then continue the seq
+        db.conversations.bulk_write([
+            UpdateOne({'_id': conversation_id}, {'$set': {'message_count': len(documents), 'messages_migrated': True}})
+            for conversation_id, documents in pending
+        ], ordered=False)
+        logger.info("Migrated conversations batch", extra={'conversations': len(conversation_ids)})
+        pending.clear()
+
+    for conversation in db.conversations.find({'messages': {'$exists': True}, 'messages_migrated': {'$ne': True}}):
+        documents, ambiguous = message_documents(conversation)
+        stats['conversations'] += 1
+        stats['messages'] += len(documents)
+        stats['ambiguous_entities'] += ambiguous
+        if ambiguous:
+            logger.warning("Ambiguous entities in conversation", extra={'conversation_id': str(conversation['_id']),
+                                                                        'entities': ambiguous})
+        if dry_run:
+            continue
+        pending.append((conversation['_id'], documents))
+        if len(pending) >= batch_size:
+            flush()
+    if not dry_run:
+        flush()
+    return stats
+
+def drop_legacy(db):
+    """
+    Remove the old fields of the migrated conversation headers, once the migrated messages have been checked
+
+    Args:
+        db (Database): Mongo database
+
+    Returns:
+        n_conversations (int): Compacted headers
+    """
+    result = db.conversations.update_many({'messages_migrated': True, 'messages': {'$exists': True}},
+                                          {'$unset': {field: '' for field in LEGACY_FIELDS}})
+    return result.modified_count
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Move embedded conversation messages to the messages collection")
+    parser.add_argument('--batch-size', type=int, default=500, help="Conversations migrated per bulk write")
+    parser.add_argument('--dry-run', action='store_true', help="Only count the conversations and messages to migrate")
+    parser.add_argument('--drop-legacy', action='store_true',
+                        help="Remove the old fields of the migrated headers, run it once the migration has been checked")
+    args = parser.parse_args()
+
+    load_dotenv()
+    client = MongoClient(os.getenv("MONGO_URI"))
+    if args.drop_legacy:
+        print(f"Removed the old fields of {drop_legacy(client['procstop'])} conversations")
+    else:
+        stats = migrate(client['procstop'], args.batch_size, args.dry_run)
+        action = "Would migrate" if args.dry_run else "Migrated"
+        print(f"{action} {stats['messages']} messages from {stats['conversations']} conversations, "
+              f"{stats['ambiguous_entities']} entities with an ambiguous message")
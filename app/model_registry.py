@@ -0,0 +1,204 @@
+# Local imports
+import gc
+import os
+import threading
+import time
+
+# Project imports
+from app.telemetry import get_logger, record_stage
+
+logger = get_logger(__name__)
+
+# 'torch' (fp32), 'int8' (dynamic quantization of the linear layers) or 'onnx' (ONNX Runtime)
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+INFERENCE_BACKENDS = ('torch', 'int8', 'onnx')
+ONNX_CACHE_DIR = os.getenv("ONNX_CACHE_DIR", os.path.join(os.getcwd(), 'onnx_models'))
+
+# Models used by the feature extractor, loaded at most once per process
+MODEL_SPECS = {
+    'entities': {'kind': 'pipeline', 'task': 'token-classification', 'model': 'PlanTL-GOB-ES/roberta-base-bne-capitel-ner-plus'},
+    'emotion': {'kind': 'pysentimiento', 'task': 'emotion', 'lang': 'es'},
+    'sentiment': {'kind': 'pysentimiento', 'task': 'sentiment', 'lang': 'es'},
+    'hate_speech': {'kind': 'pysentimiento', 'task': 'hate_speech', 'lang': 'es'},
+    'irony': {'kind': 'pysentimiento', 'task': 'irony', 'lang': 'es'},
+}
+
+class ModelHandle:
+    """
+    Shared handle to a loaded model. Calls are serialized with a lock because
+    the fast tokenizers behind the models are not safe to use from several threads at once.
+    """
+    def __init__(self, name, model):
+        """
+        Initialize model handle
+
+        Args:
+            name (str): Model name in the registry
+            model (Object): Loaded pipeline or pysentimiento analyzer
+        """
+        self.name = name
+        self.model = model
+        self.lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        """
+        Run a transformers pipeline
+        """
+        with self.lock:
+            return self.model(*args, **kwargs)
+
+    def predict(self, *args, **kwargs):
+        """
+        Run a pysentimiento analyzer
+        """
+        with self.lock:
+            return self.model.predict(*args, **kwargs)
+
+class ModelRegistry:
+    """
+    Process-wide registry that loads each model once and hands out shared handles.
+    """
+    def __init__(self, specs=MODEL_SPECS, backend=INFERENCE_BACKEND):
+        """
+        Initialize model registry
+
+        Args:
+            specs (dict): Model name -> loading specification
+            backend (str): Inference backend of the loaded models
+        """
+        if backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"Unknown inference backend '{backend}', expected one of {INFERENCE_BACKENDS}")
+        self.specs = specs
+        self.backend = backend
+        self._handles = {}
+        self._load_locks = {name: threading.Lock() for name in specs}
+
+    def get(self, name):
+        """
+        Get the shared handle of a model, loading it on first use
+
+        Args:
+            name (str): Model name in the registry
+
+        Returns:
+            handle (ModelHandle): Shared model handle
+        """
+        handle = self._handles.get(name)
+        if handle is None:
+            with self._load_locks[name]:
+                handle = self._handles.get(name)
+                if handle is None:
+                    logger.info("Loading model", extra={'model': name, 'backend': self.backend})
+                    start = time.perf_counter()
+                    handle = ModelHandle(name, self.read_only(self._load(self.specs[name])))
+                    seconds = time.perf_counter() - start
+                    record_stage(f"model_load.{name}", seconds)
+                    self._handles[name] = handle
+                    logger.info("Model loaded", extra={'model': name, 'load_ms': round(seconds * 1000, 1)})
+        return handle
+
+    def _load(self, spec):
+        """
+        Build a model from its specification
+
+        Args:
+            spec (dict): Loading specification
+        """
+        if spec['kind'] == 'pipeline':
+            from transformers import pipeline
+            model = pipeline(spec['task'], model=spec['model'])
+            if self.backend != 'torch':
+                model = pipeline(spec['task'], model=self.convert(model.model, spec['task']), tokenizer=model.tokenizer)
+            return model
+        from pysentimiento import create_analyzer
+        analyzer = create_analyzer(task=spec['task'], lang=spec['lang'])
+        if self.backend != 'torch':
+            analyzer.model = self.convert(analyzer.model, 'text-classification')
+            self.release_trainer(analyzer)
+            gc.collect()
+        return analyzer
+
+    def release_trainer(self, analyzer):
+        """
+        The trainer pysentimiento uses to predict lists of messages keeps its own reference to the fp32 model.
+        It's pointed at the converted model when this is a torch module, otherwise it's dropped (ONNX Runtime
+        models can't run under a Trainer), so the fp32 weights are freed.
+
+        Args:
+            analyzer (Object): pysentimiento analyzer with its converted model
+        """
+        trainer = getattr(analyzer, 'eval_trainer', None)
+        if trainer is None:
+            return
+        if hasattr(analyzer.model, 'requires_grad_'):
+            trainer.model = trainer.model_wrapped = analyzer.model
+        else:
+            analyzer.eval_trainer = None
+
+    def read_only(self, model):
+        """
+        Put the torch module of a loaded model in inference mode with its parameters read-only.
+        Models are never trained, and untouched tensors stay shared between forked workers.
+
+        Args:
+            model (Object): Loaded pipeline or pysentimiento analyzer
+
+        Returns:
+            model (Object): Same model
+        """
+        module = getattr(model, 'model', None)
+        if hasattr(module, 'requires_grad_'):
+            module.eval()
+            module.requires_grad_(False)
+        return model
+
+    def convert(self, model, task):
+        """
+        Convert a fp32 transformers model to the configured backend
+
+        Args:
+            model (PreTrainedModel): Loaded fp32 model
+            task (str): 'token-classification' or 'text-classification'
+
+        Returns:
+            model (Object): Quantized torch module or ONNX Runtime model, same call interface
+        """
+        if self.backend == 'int8':
+            import torch
+            # In place, so no fp32 copy of the linear layers outlives the conversion
+            return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+        try:
+            from optimum.onnxruntime import ORTModelForSequenceClassification, ORTModelForTokenClassification
+        except ImportError as e:
+            raise ImportError("The 'onnx' inference backend needs optimum[onnxruntime] installed.") from e
+        ort_class = ORTModelForTokenClassification if task == 'token-classification' else ORTModelForSequenceClassification
+
+        # Export once and reuse the exported graph on later starts
+        name = model.config._name_or_path
+        export_dir = os.path.join(ONNX_CACHE_DIR, name.replace('/', '--'))
+        if os.path.exists(os.path.join(export_dir, 'model.onnx')):
+            return ort_class.from_pretrained(export_dir)
+        ort_model = ort_class.from_pretrained(name, export=True)
+        ort_model.save_pretrained(export_dir)
+        return ort_model
+
+    def load_all(self):
+        """
+        Eagerly load every registered model
+        """
+        for name in self.specs:
+            self.get(name)
+
+    def is_loaded(self, name=None):
+        """
+        Check whether one model (or all of them) is already resident
+
+        Args:
+            name (str): Model name, None to check every model
+        """
+        if name is not None:
+            return name in self._handles
+        return all(name in self._handles for name in self.specs)
+
+registry = ModelRegistry()
\ No newline at end of file
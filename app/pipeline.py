@@ -0,0 +1,77 @@
+# Local imports
+import atexit
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Project imports
+from app.telemetry import get_logger
+
+logger = get_logger(__name__)
+
+# Defer Mongo writes of /chat to a background writer instead of blocking the reply
+PERSIST_ASYNC = os.getenv("PERSIST_ASYNC", "1") == "1"
+WRITER_QUEUE_SIZE = int(os.getenv("WRITER_QUEUE_SIZE", "1000"))
+PIPELINE_THREADS = int(os.getenv("PIPELINE_THREADS", "8"))
+
+class BackgroundWriter:
+    """
+    Single background thread that runs persistence jobs in submission order,
+    so messages of a conversation are still written in the order they were sent.
+    """
+    def __init__(self, maxsize=WRITER_QUEUE_SIZE):
+        """
+        Initialize background writer
+
+        Args:
+            maxsize (int): Pending jobs before submit blocks the caller
+        """
+        self.jobs = queue.Queue(maxsize=maxsize)
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        """
+        Start the writer thread if it is not running in this process
+        """
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='background-writer', daemon=True)
+                self.thread.start()
+
+    def run(self):
+        """
+        Writer loop
+        """
+        while True:
+            func, args, kwargs = self.jobs.get()
+            try:
+                func(*args, **kwargs)
+            except Exception:
+                logger.exception("Background write failed", extra={'job': getattr(func, '__qualname__', repr(func))})
+            finally:
+                self.jobs.task_done()
+
+    def submit(self, func, *args, **kwargs):
+        """
+        Queue a persistence job
+
+        Args:
+            func (callable): Job to run in the writer thread
+        """
+        self.start()
+        self.jobs.put((func, args, kwargs))
+
+    def flush(self):
+        """
+        Wait until every queued job has been written
+        """
+        if self.thread is not None and self.thread.is_alive():
+            self.jobs.join()
+
+writer = BackgroundWriter()
+atexit.register(writer.flush)
+
+# Request stages that run alongside another one, like feature extraction during a streamed reply
+stage_executor = ThreadPoolExecutor(max_workers=PIPELINE_THREADS, thread_name_prefix='chat-stage')
\ No newline at end of file
@@ -0,0 +1,132 @@
+# Local imports
+import argparse
+import hashlib
+import os
+from datetime import datetime
+
+# Third party imports
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+
+# Messages applied per bulk write when rebuilding
+ROLLUP_BATCH_SIZE = int(os.getenv("ROLLUP_BATCH_SIZE", "1000"))
+
+def rollup_day(timestamp):
+    """
+    Day of a rollup document, as a datetime at midnight so Mongo can store and index it
+    """
+    return datetime(timestamp.year, timestamp.month, timestamp.day)
+
+def entity_key(entity):
+    """
+    Field name of an entity, entity names may contain '.' or start with '$'
+    """
+    return hashlib.sha1(entity.encode('utf-8')).hexdigest()[:16]
+
+def rollup_update(timestamp, emotions, sentiment, hate, irony, entities):
+    """
+    Update that adds a message's features to the rollup of its day. Every counter is increased with $inc,
+    so concurrent writers never lose messages.
+
+    Args:
+        timestamp (datetime): Time the message was sent
+        emotions (dict): Emotion -> probability
+        sentiment (dict): Sentiment label -> probability
+        hate (dict): Hate speech label -> probability
+        irony (dict): Irony label -> probability
+        entities (dict): Entity type -> list of entities
+
+    Returns:
+        update (dict): Mongo update document
+    """
+    inc = {'messages': 1}
+    set_fields = {}
+    for field, probas in (('emotions', emotions), ('sentiment', sentiment), ('hate', hate), ('irony', irony)):
+        if not probas:
+            continue
+        inc[f'{field}_count'] = 1
+        for label, probability in probas.items():
+            inc[f'{field}.{label}'] = float(probability)
+
+    # Entities accumulate the sentiment of the messages that mention them
+    if sentiment:
+        for category, entity_list in (entities or {}).items():
+            for entity in entity_list:
+                prefix = f'entities.{category}.{entity_key(entity)}'
+                set_fields[f'{prefix}.name'] = entity
+                inc[f'{prefix}.mentions'] = 1
+                for label in ('NEG', 'NEU', 'POS'):
+                    inc[f'{prefix}.{label}'] = float(sentiment.get(label, 0))
+
+    # Last message time, part of the data version of the charts
+    update = {'$inc': inc, '$max': {'last_message': timestamp}}
+    if set_fields:
+        update['$set'] = set_fields
+    return update
+
+def rollup_operation(user_id, timestamp, emotions, sentiment, hate, irony, entities):
+    """
+    Upsert of the rollup of a user's day with a message's features
+
+    Returns:
+        operation (UpdateOne): Operation for bulk_write
+    """
+    update = rollup_update(timestamp, emotions, sentiment, hate, irony, entities)
+    return UpdateOne({'user_id': user_id, 'day': rollup_day(timestamp)}, update, upsert=True)
+
+def update_rollup(db, user_id, timestamp, features_dict):
+    """
+    Add a saved message to the rollup of its user and day
+
+    Args:
+        db (Database): Mongo database
+        user_id (ObjectId): Message user
+        timestamp (datetime): Time the message was sent
+        features_dict (dict): Detected features on the message
+    """
+    update = rollup_update(timestamp, features_dict['emotion'], features_dict['sentiment'], features_dict['hate'],
+                           features_dict['irony'], features_dict['entities'])
+    db.analytics_rollups.update_one({'user_id': user_id, 'day': rollup_day(timestamp)}, update, upsert=True)
+
+def rebuild_rollups(db, user_id=None, batch_size=ROLLUP_BATCH_SIZE):
+    """
+    Rebuild the rollups from the messages collection, to backfill old messages or repair counters.
+    Messages saved while the rebuild runs may be counted twice, run it with the app stopped.
+
+    Args:
+        db (Database): Mongo database
+        user_id (ObjectId): Only rebuild this user, every user by default
+        batch_size (int): Messages applied per bulk write
+
+    Returns:
+        n_messages (int): Messages added to the rollups
+    """
+    query = {} if user_id is None else {'user_id': user_id}
+    db.analytics_rollups.delete_many(query)
+
+    projection = {'user_id': 1, 'timestamp': 1, 'emotions': 1, 'sentiment': 1, 'hate': 1, 'irony': 1, 'entities': 1}
+    operations = []
+    n_messages = 0
+    for message in db.messages.find({**query, 'timestamp': {'$ne': None}}, projection, batch_size=batch_size):
+        operations.append(rollup_operation(message['user_id'], message['timestamp'], message.get('emotions'),
+                                           message.get('sentiment'), message.get('hate'), message.get('irony'),
+                                           message.get('entities')))
+        n_messages += 1
+        if len(operations) >= batch_size:
+            db.analytics_rollups.bulk_write(operations, ordered=False)
+            operations = []
+    if operations:
+        db.analytics_rollups.bulk_write(operations, ordered=False)
+    return n_messages
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rebuild the per user and day analytics rollups from the saved messages")
+    parser.add_argument('--user-id', help="Only rebuild this user")
+    parser.add_argument('--batch-size', type=int, default=ROLLUP_BATCH_SIZE, help="Messages applied per bulk write")
+    args = parser.parse_args()
+
+    load_dotenv()
+    db = MongoClient(os.getenv("MONGO_URI"))['procstop']
+    n_messages = rebuild_rollups(db, ObjectId(args.user_id) if args.user_id else None, args.batch_size)
+    print(f"Rollups rebuilt from {n_messages} messages")
@@ -0,0 +1,163 @@
+# Local imports
+import os
+import threading
+from collections import OrderedDict
+
+# Third party imports
+from bson import ObjectId
+
+# Project imports
+from app.telemetry import get_logger, timed
+
+logger = get_logger(__name__)
+
+# Conversations kept in memory per worker, the rest are rehydrated from Mongo
+SESSION_STORE_SIZE = int(os.getenv("SESSION_STORE_SIZE", "1000"))
+
+class ConversationStore:
+    """
+    Session scoped chatbots. Each logged in session gets its own Chatbot, with its own context and
+    conversation_id, kept in an LRU and rebuilt from Mongo when a worker doesn't have it.
+    Sessions aren't sticky, so a cached chatbot catches up with the messages other workers saved before it's used.
+    """
+    def __init__(self, db, chatbot_factory, maxsize=SESSION_STORE_SIZE):
+        """
+        Initialize conversation store
+
+        Args:
+            db (Database): Mongo database
+            chatbot_factory (callable): Builds an empty Chatbot
+            maxsize (int): Chatbots kept in memory
+        """
+        self.db = db
+        self.chatbot_factory = chatbot_factory
+        self.maxsize = maxsize
+        self.chatbots = OrderedDict()
+        self.lock = threading.Lock()
+
+    def put(self, chatbot):
+        """
+        Keep a chatbot in memory, evicting the least recently used ones
+        """
+        key = (str(chatbot.user_id), str(chatbot.conversation_id))
+        with self.lock:
+            self.chatbots[key] = chatbot
+            self.chatbots.move_to_end(key)
+            while len(self.chatbots) > self.maxsize:
+                self.chatbots.popitem(last=False)
+
+    def start(self, user):
+        """
+        Start a new conversation for a user that just logged in
+
+        Args:
+            user (dict): User document
+
+        Returns:
+            chatbot (Chatbot): Chatbot of the new conversation
+        """
+        chatbot = self.chatbot_factory()
+        chatbot.user_id = ObjectId(user['_id'])
+        chatbot.username = user['username']
+        chatbot.gender = str(user.get('gender', 'Other'))
+        chatbot.start_conver()
+        self.put(chatbot)
+        return chatbot
+
+    def get(self, user_id, conversation_id):
+        """
+        Get the chatbot of a session, rehydrating it from Mongo on a miss and catching up with the
+        messages saved by other workers on a hit
+
+        Args:
+            user_id (str): session['user_id']
+            conversation_id (str): session['conversation_id']
+
+        Returns:
+            chatbot (Chatbot): Chatbot of the conversation, None if it doesn't exist
+        """
+        key = (str(user_id), str(conversation_id))
+        with self.lock:
+            chatbot = self.chatbots.get(key)
+            if chatbot is not None:
+                self.chatbots.move_to_end(key)
+        if chatbot is not None:
+            self.catch_up(chatbot)
+            return chatbot
+
+        chatbot = self.rehydrate(user_id, conversation_id)
+        if chatbot is not None:
+            self.put(chatbot)
+        return chatbot
+
+    @timed("session_rehydrate")
+    def rehydrate(self, user_id, conversation_id):
+        """
+        Rebuild a chatbot from the stored user and conversation, replaying the saved features into its context
+
+        Args:
+            user_id (str): User id
+            conversation_id (str): Conversation id
+
+        Returns:
+            chatbot (Chatbot): Rebuilt chatbot, None if the conversation doesn't belong to the user
+        """
+        user = self.db.users.find_one({'_id': ObjectId(user_id)}, {'username': 1, 'gender': 1})
+        conversation = self.db.conversations.find_one({'_id': ObjectId(conversation_id), 'user_id': ObjectId(user_id)},
+                                                      {'start_time': 1})
+        if user is None or conversation is None:
+            return None
+
+        chatbot = self.chatbot_factory()
+        chatbot.user_id = ObjectId(user_id)
+        chatbot.username = user.get('username')
+        chatbot.gender = str(user.get('gender', 'Other'))
+        chatbot.conversation_id = conversation['_id']
+        chatbot.start_time = conversation.get('start_time', chatbot.start_time)
+
+        n_messages = self.replay(chatbot)
+        logger.info("Conversation rehydrated", extra={'conversation_id': str(conversation_id), 'messages': n_messages})
+        return chatbot
+
+    def catch_up(self, chatbot):
+        """
+        Apply to a cached chatbot the messages saved since the last one in its context, by other workers or
+        by a deferred write that hadn't landed when it was rehydrated
+
+        Args:
+            chatbot (Chatbot): Cached chatbot
+        """
+        conversation = self.db.conversations.find_one({'_id': chatbot.conversation_id}, {'message_count': 1})
+        if conversation is None or conversation.get('message_count', 0) <= chatbot.applied_seq:
+            return
+        with chatbot.lock:
+            n_messages = self.replay(chatbot)
+        logger.debug("Conversation caught up", extra={'conversation_id': str(chatbot.conversation_id), 'messages': n_messages})
+
+    def replay(self, chatbot):
+        """
+        Replay the saved features of the messages after the chatbot's applied seq into its context
+
+        Args:
+            chatbot (Chatbot): Chatbot to update
+
+        Returns:
+            n_messages (int): Messages replayed
+        """
+        # Only the features are needed to rebuild the context
+        projection = {'seq': 1, 'emotions': 1, 'sentiment': 1, 'hate': 1, 'irony': 1, 'entities': 1}
+        query = {'conversation_id': chatbot.conversation_id, 'seq': {'$gt': chatbot.applied_seq}}
+        n_messages = 0
+        for message in self.db.messages.find(query, projection).sort('seq', 1):
+            n_messages += 1
+            # Messages saved without features only move the applied seq
+            if message.get('emotions') and message.get('sentiment'):
+                chatbot.update_context({
+                    'emotion': message['emotions'],
+                    'entities': message.get('entities', {}),
+                    'sentiment': message['sentiment'],
+                    'hate': message.get('hate'),
+                    'irony': message.get('irony')
+                })
+            chatbot.applied_seq = message['seq']
+        return n_messages
\ No newline at end of file
@@ -0,0 +1,134 @@
+// Gráficas de analíticas dibujadas en el navegador a partir de /api/analytics/<chart>
+var SERIES_COLORS = {
+    'Positive': 'green',
+    'Negative': 'orange',
+    'Neutral': 'purple',
+    'hateful': 'blue',
+    'targeted': 'green',
+    'aggressive': 'red',
+    'ironic': 'green',
+    'not_ironic': 'orange'
+};
+
+var SERIES_LABELS = {
+    'hateful': 'Hateful',
+    'targeted': 'Targeted',
+    'aggressive': 'Aggressive',
+    'ironic': 'Ironic',
+    'not_ironic': 'Not Ironic'
+};
+
+// Misma paleta que las gráficas de matplotlib (Paired)
+var PALETTE = ['#a6cee3', '#1f78b4', '#b2df8a', '#33a02c', '#fb9a99', '#e31a1c',
+               '#fdbf6f', '#ff7f00', '#cab2d6', '#6a3d9a', '#ffff99', '#b15928'];
+
+var renderedCharts = {};
+
+function chartDatasets(data, options) {
+    return Object.keys(data.series).map((name, index) => {
+        var color = SERIES_COLORS[name] || PALETTE[index % PALETTE.length];
+        return Object.assign({
+            label: SERIES_LABELS[name] || name,
+            data: data.series[name],
+            backgroundColor: color,
+            borderColor: color
+        }, options || {});
+    });
+}
+
+function chartConfig(data) {
+    switch (data.chart) {
+        case 'emotion_pie':
+            return {
+                type: 'pie',
+                data: {
+                    labels: data.labels,
+                    datasets: [{ data: data.series.probability, backgroundColor: PALETTE }]
+                },
+                options: { plugins: { legend: { position: 'right', title: { display: true, text: 'Emociones' } } } }
+            };
+        case 'emotion_evolution':
+            return {
+                type: 'line',
+                data: { labels: data.labels, datasets: chartDatasets(data, { fill: false }) },
+                options: { scales: { x: { title: { display: true, text: 'Date' } }, y: { title: { display: true, text: 'Average Probability' } } } }
+            };
+        case 'sentiments':
+            return {
+                type: 'bar',
+                data: { labels: data.labels, datasets: chartDatasets(data) },
+                options: { scales: { x: { title: { display: true, text: 'Date' } }, y: { title: { display: true, text: 'Average Probability' } } } }
+            };
+        case 'most_positive_entities':
+        case 'least_positive_entities':
+            var color = data.chart === 'most_positive_entities' ? 'green' : 'red';
+            return {
+                type: 'bar',
+                data: { labels: data.labels, datasets: [{ label: 'Positivity Score', data: data.series.sentiment_pos, backgroundColor: color }] },
+                options: { indexAxis: 'y', plugins: { legend: { display: false } }, scales: { x: { title: { display: true, text: 'Positivity Score' } } } }
+            };
+        case 'hate_evolution':
+            return {
+                type: 'line',
+                data: { labels: data.labels, datasets: chartDatasets(data, { pointRadius: 4 }) },
+                options: { scales: { x: { title: { display: true, text: 'Time' } }, y: { title: { display: true, text: 'Probability' } } } }
+            };
+        case 'irony_evolution':
+            return {
+                type: 'bar',
+                data: { labels: data.labels, datasets: chartDatasets(data) },
+                options: { scales: { x: { title: { display: true, text: 'Conversation' } }, y: { title: { display: true, text: 'Probability' } } } }
+            };
+    }
+    return null;
+}
+
+// Sin Chart.js o sin respuesta de la API se muestra la imagen generada en el servidor
+function showFallbackImage(canvas) {
+    var img = document.createElement('img');
+    img.src = canvas.dataset.fallback;
+    img.alt = canvas.getAttribute('aria-label');
+    canvas.replaceWith(img);
+}
+
+function showNoData(canvas) {
+    var paragraph = document.createElement('p');
+    paragraph.textContent = 'Todavía no hay datos suficientes para esta gráfica.';
+    canvas.replaceWith(paragraph);
+}
+
+function renderChart(container) {
+    var canvas = container.querySelector('canvas[data-chart]');
+    if (!canvas || renderedCharts[canvas.dataset.chart]) {
+        return;
+    }
+    renderedCharts[canvas.dataset.chart] = true;
+
+    if (!window.Chart) {
+        showFallbackImage(canvas);
+        return;
+    }
+
+    fetch(canvas.dataset.src, { credentials: 'same-origin' })
+    .then(response => {
+        if (response.status === 404) {
+            return null;
+        }
+        if (!response.ok) {
+            throw new Error('HTTP ' + response.status);
+        }
+        return response.json();
+    })
+    .then(data => {
+        var config = data && chartConfig(data);
+        if (!config) {
+            showNoData(canvas);
+            return;
+        }
+        new Chart(canvas, config);
+    })
+    .catch(error => {
+        console.log("Error: " + error);
+        showFallbackImage(canvas);
+    });
+}
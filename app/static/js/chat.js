@@ -1,18 +1,117 @@
 function sendMessage() {
     var userInput = document.getElementById('userInput').value;
-    
+
     if (!userInput.trim()) {
         alert("Por favor, ingresa un mensaje antes de enviar.");
         return;
     }
-    
+
     document.getElementById('userInput').value = "";  // Limpia el campo de entrada inmediatamente después de enviar
     document.getElementById('userInput').disabled = true;  // Deshabilita el campo de entrada temporalmente
-    
+
     document.getElementById('chatbox').innerHTML += '<p class="userText"><span>' + userInput + '</span></p>';
     scrollToBottom();  // Asegura que el chat se desplace hacia abajo
 
-    fetch('/chat', {
+    streamMessage(userInput)
+    .catch(error => {
+        console.log("Error: " + error);
+    })
+    .finally(() => {
+        document.getElementById('userInput').disabled = false;  // Habilita nuevamente el campo de entrada
+        scrollToBottom();
+    });
+}
+
+// Muestra la respuesta del bot a medida que llega desde /chat/stream (server-sent events)
+function streamMessage(userInput) {
+    return fetch('/chat/stream', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({ message: userInput })
+    })
+    .then(response => {
+        // Sin soporte de streaming en el navegador o error en el servidor: respuesta completa por /chat
+        if (!response.ok || !response.body || !window.TextDecoder) {
+            return sendMessageWithoutStream(userInput);
+        }
+
+        var botText = createBotMessage();
+        var reader = response.body.getReader();
+        var decoder = new TextDecoder();
+        var buffer = '';
+        var finished = false;  // Se ha recibido 'done' o 'error'
+
+        function read() {
+            return reader.read().then(({ done, value }) => {
+                if (done) {
+                    return;
+                }
+                buffer += decoder.decode(value, { stream: true });
+
+                // Cada evento termina con una línea en blanco
+                var events = buffer.split('\n\n');
+                buffer = events.pop();
+                events.forEach(event => {
+                    var name = handleStreamEvent(event, botText);
+                    finished = finished || name === 'done' || name === 'error';
+                });
+                return read();
+            });
+        }
+        // Un stream que se corta sin 'done' deja la respuesta a medias: se marca como fallida
+        return read()
+        .catch(error => {
+            console.log("Error: " + error);
+        })
+        .then(() => {
+            if (!finished) {
+                botText.textContent = "La respuesta se ha interrumpido. Por favor, inténtalo de nuevo.";
+                scrollToBottom();
+                throw new Error("Stream ended without a 'done' event");
+            }
+        });
+    });
+}
+
+function handleStreamEvent(event, botText) {
+    var name = 'message';
+    var data = '';
+    event.split('\n').forEach(line => {
+        if (line.startsWith('event: ')) {
+            name = line.slice(7);
+        } else if (line.startsWith('data: ')) {
+            data += line.slice(6);
+        }
+    });
+    if (!data) {
+        return null;
+    }
+
+    var payload = JSON.parse(data);
+    if (name === 'token') {
+        botText.textContent += payload.token;
+    } else if (name === 'done') {
+        botText.textContent = payload.reply;
+    } else if (name === 'error') {
+        botText.textContent = payload.error;
+    }
+    scrollToBottom();
+    return name;
+}
+
+function createBotMessage() {
+    var paragraph = document.createElement('p');
+    paragraph.className = 'botText';
+    var span = document.createElement('span');
+    paragraph.appendChild(span);
+    document.getElementById('chatbox').appendChild(paragraph);
+    return span;
+}
+
+function sendMessageWithoutStream(userInput) {
+    return fetch('/chat', {
         method: 'POST',
         headers: {
             'Content-Type': 'application/json'
@@ -21,14 +120,8 @@ function sendMessage() {
     })
     .then(response => response.json())
     .then(data => {
-        document.getElementById('chatbox').innerHTML += '<p class="botText"><span>' + data.reply + '</span></p>';
+        createBotMessage().textContent = data.reply || data.error;
         scrollToBottom();  // Asegura que el chat se desplace hacia abajo después de recibir la respuesta
-        document.getElementById('userInput').disabled = false;  // Habilita nuevamente el campo de entrada
-    })
-    .catch(error => {
-        console.log("Error: " + error);
-        document.getElementById('userInput').disabled = false;  // Habilita en caso de error también
-        scrollToBottom();
     });
 }
 
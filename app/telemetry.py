@@ -0,0 +1,378 @@
+# Local imports
+import contextvars
+import glob
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# Log level and format of the app logs, 'json' writes one object per line, 'text' is meant for local runs
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+
+# Directory shared by the workers of a server, each one dumps its metrics there so /metrics adds them up.
+# Without it /metrics only shows the worker that answered the scrape.
+METRICS_DIR = os.getenv("METRICS_DIR", "")
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", "5"))
+
+# Histogram buckets in seconds, from a cached chart to a slow LLM reply
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Attributes of every log record, anything else was passed in extra= and goes to the JSON line
+RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per log line with the message, level, logger and the fields passed in extra=
+    """
+    def format(self, record):
+        """
+        Format a log record
+
+        Args:
+            record (LogRecord): Record to format
+
+        Returns:
+            line (str): JSON object
+        """
+        entry = {
+            'time': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname.lower(),
+            'logger': record.name,
+            'message': record.getMessage(),
+            'pid': record.process
+        }
+        for key, value in vars(record).items():
+            if key not in RESERVED_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+def configure_logging(level=LOG_LEVEL, log_format=LOG_FORMAT):
+    """
+    Set up the handler of the 'app' logger, every module logs through a child of it
+
+    Args:
+        level (str): Minimum level written
+        log_format (str): 'json' or 'text'
+    """
+    logger = logging.getLogger('app')
+    if logger.handlers:
+        return logger
+    handler = logging.StreamHandler(sys.stderr)
+    if log_format == 'json':
+        handler.setFormatter(JsonFormatter())
+    else:
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s %(name)s: %(message)s'))
+    logger.addHandler(handler)
+    logger.setLevel(level.upper())
+    logger.propagate = False
+    return logger
+
+def get_logger(name):
+    """
+    Logger of a module
+
+    Args:
+        name (str): Module name, __name__
+    """
+    configure_logging()
+    return logging.getLogger(name if name.startswith('app.') else f'app.{name}')
+
+def escape_label(value):
+    """
+    Escape a label value for the Prometheus text format
+    """
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+class Histogram:
+    """
+    Prometheus histogram with labels. Only cumulative bucket counts, sum and count are kept,
+    so its memory doesn't grow with the observations.
+    """
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        """
+        Initialize histogram
+
+        Args:
+            name (str): Metric name
+            documentation (str): HELP text
+            labelnames (tuple): Label names, values are given on each observation
+            buckets (tuple): Upper bounds of the buckets, +Inf is added
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        """
+        Add an observation
+
+        Args:
+            value (float): Observed value, seconds for the latency histograms
+            labels (dict): Label name -> value
+        """
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = {'buckets': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+                    break
+            else:
+                series['buckets'][-1] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def snapshot(self):
+        """
+        Copy of the series, to dump or render them without holding the lock
+
+        Returns:
+            series (dict): Label values -> {'buckets', 'sum', 'count'}
+        """
+        with self.lock:
+            return {key: {'buckets': list(series['buckets']), 'sum': series['sum'], 'count': series['count']}
+                    for key, series in self.series.items()}
+
+    def render(self, series):
+        """
+        Prometheus text format of the histogram
+
+        Args:
+            series (dict): Label values -> {'buckets', 'sum', 'count'}
+
+        Returns:
+            lines (list): Exposition lines
+        """
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key in sorted(series):
+            values = series[key]
+            labels = ','.join(f'{name}="{escape_label(value)}"' for name, value in zip(self.labelnames, key))
+            prefix = f"{labels}," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values['buckets']):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            suffix = f"{{{labels}}}" if labels else ""
+            lines.append(f"{self.name}_sum{suffix} {values['sum']}")
+            lines.append(f"{self.name}_count{suffix} {values['count']}")
+        return lines
+
+class MetricsRegistry:
+    """
+    Histograms of a worker process, exposed in the Prometheus text format.
+    With a shared directory each worker dumps its series there and the exposition adds up every worker.
+    """
+    def __init__(self, directory=METRICS_DIR, flush_interval=METRICS_FLUSH_INTERVAL):
+        """
+        Initialize metrics registry
+
+        Args:
+            directory (str): Directory shared by the workers, empty to only expose this process
+            flush_interval (float): Minimum seconds between dumps of this worker
+        """
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self.histograms = {}
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.last_flush = 0.0
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        """
+        Get or create a histogram
+
+        Returns:
+            histogram (Histogram): Registered histogram
+        """
+        with self.lock:
+            if name not in self.histograms:
+                self.histograms[name] = Histogram(name, documentation, labelnames, buckets)
+            return self.histograms[name]
+
+    def reset(self):
+        """
+        Drop every series, e.g. the ones a forked worker inherits from the gunicorn master
+        """
+        for histogram in self.histograms.values():
+            with histogram.lock:
+                histogram.series = {}
+
+    def dump_path(self):
+        return os.path.join(self.directory, f"{os.getpid()}.json")
+
+    def flush(self, force=False):
+        """
+        Dump the series of this worker to the shared directory, at most once per flush interval
+
+        Args:
+            force (bool): Dump even if the last dump is recent
+        """
+        if not self.directory:
+            return
+        with self.flush_lock:
+            now = time.monotonic()
+            if not force and now - self.last_flush < self.flush_interval:
+                return
+            self.last_flush = now
+            dump = {name: [[list(key), series] for key, series in histogram.snapshot().items()]
+                    for name, histogram in self.histograms.items()}
+            os.makedirs(self.directory, exist_ok=True)
+            path = self.dump_path()
+            with open(f"{path}.tmp", 'w') as f:
+                json.dump(dump, f)
+            os.replace(f"{path}.tmp", path)
+
+    def collect(self):
+        """
+        Series of every histogram, added up over the workers that dumped to the shared directory.
+        Dumps of exited workers are kept, so the totals never go back.
+
+        Returns:
+            collected (dict): Histogram name -> label values -> {'buckets', 'sum', 'count'}
+        """
+        if not self.directory:
+            return {name: histogram.snapshot() for name, histogram in self.histograms.items()}
+
+        self.flush(force=True)
+        collected = {name: {} for name in self.histograms}
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                with open(path) as f:
+                    dump = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for name, rows in dump.items():
+                merged = collected.setdefault(name, {})
+                for key, series in rows:
+                    total = merged.setdefault(tuple(key), {'buckets': [0] * len(series['buckets']), 'sum': 0.0, 'count': 0})
+                    total['buckets'] = [a + b for a, b in zip(total['buckets'], series['buckets'])]
+                    total['sum'] += series['sum']
+                    total['count'] += series['count']
+        return collected
+
+    def render(self):
+        """
+        Prometheus text exposition of every histogram
+
+        Returns:
+            text (str): Exposition body
+        """
+        lines = []
+        for name, series in self.collect().items():
+            histogram = self.histograms.get(name)
+            if histogram is not None:
+                lines.extend(histogram.render(series))
+        return '\n'.join(lines) + '\n'
+
+metrics = MetricsRegistry()
+
+REQUEST_SECONDS = metrics.histogram('procstop_request_seconds', "Time to answer a request, until its body is sent",
+                                    ('route', 'method', 'status'))
+STAGE_SECONDS = metrics.histogram('procstop_stage_seconds', "Time spent in each stage of the chat and analytics requests",
+                                  ('stage',))
+
+# Trace of the request being served, stages add their time to it
+current_trace = contextvars.ContextVar('current_trace', default=None)
+
+class Trace:
+    """
+    Stage timings of a single request, written to its log line
+    """
+    def __init__(self, route):
+        """
+        Initialize request trace
+
+        Args:
+            route (str): Route rule of the request
+        """
+        self.route = route
+        self.start = time.perf_counter()
+        self.stages = {}
+        self.lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        """
+        Add time to a stage, stages run more than once in a request are added up
+        """
+        with self.lock:
+            self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    def timings_ms(self):
+        """
+        Stage timings in milliseconds, for the log line
+        """
+        with self.lock:
+            return {stage: round(seconds * 1000, 2) for stage, seconds in self.stages.items()}
+
+def record_stage(stage, seconds):
+    """
+    Record the time of a stage in its histogram and in the current request trace
+
+    Args:
+        stage (str): Stage name, e.g. 'extract.emotion'
+        seconds (float): Time spent
+    """
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+@contextmanager
+def timed(stage):
+    """
+    Time a block as a request stage, also usable as a function decorator
+
+    Args:
+        stage (str): Stage name
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+def timed_iter(stage, iterable, first_stage=None):
+    """
+    Time a generator until it is exhausted, e.g. a streamed LLM reply
+
+    Args:
+        stage (str): Stage name of the whole iteration
+        iterable (iterable): Items to yield
+        first_stage (str): Stage name of the time to the first item, not recorded if None
+    """
+    start = time.perf_counter()
+    first = True
+    try:
+        for item in iterable:
+            if first and first_stage is not None:
+                record_stage(first_stage, time.perf_counter() - start)
+            first = False
+            yield item
+    finally:
+        record_stage(stage, time.perf_counter() - start)
+
+def in_context(func):
+    """
+    Bind a function to the current context, so the stages it runs in an executor thread are added to the trace
+    of the request that submitted it. Each call runs in its own copy, so a wrapped function can run concurrently.
+
+    Args:
+        func (callable): Function to run in another thread
+    """
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(func, *args, **kwargs)
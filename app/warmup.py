@@ -0,0 +1,65 @@
+# Local imports
+import os
+import threading
+import time
+
+# Project imports
+from app.telemetry import get_logger
+
+logger = get_logger(__name__)
+
+# Load the models and the analytics stack in a background thread when the app starts,
+# so static routes are served at once and the first /chat doesn't wait for them
+WARMUP_MODELS = os.getenv("WARMUP_MODELS", "1") == "1"
+
+class Warmup:
+    """
+    Background warm-up of a process: runs its tasks once, in order, and keeps their state for the readiness probe
+    """
+    def __init__(self):
+        """
+        Initialize warm-up
+        """
+        self.thread = None
+        self.lock = threading.Lock()
+        self.tasks = {}
+
+    def start(self, tasks):
+        """
+        Start the warm-up thread if it isn't running in this process
+
+        Args:
+            tasks (list): (name, callable) pairs run in order, a failed task doesn't stop the next ones
+        """
+        with self.lock:
+            if self.thread is not None and self.thread.is_alive():
+                return
+            for name, _ in tasks:
+                self.tasks[name] = {'state': 'pending'}
+            self.thread = threading.Thread(target=self.run, args=(tasks,), name='warmup', daemon=True)
+            self.thread.start()
+
+    def run(self, tasks):
+        """
+        Run the tasks and record their time or error
+        """
+        for name, task in tasks:
+            start = time.perf_counter()
+            self.tasks[name] = {'state': 'running'}
+            try:
+                task()
+            except Exception as e:
+                self.tasks[name] = {'state': 'failed', 'error': str(e)}
+                logger.exception("Warm-up task failed", extra={'task': name})
+                continue
+            seconds = time.perf_counter() - start
+            self.tasks[name] = {'state': 'done', 'seconds': round(seconds, 3)}
+            logger.info("Warm-up task done", extra={'task': name, 'duration_ms': round(seconds * 1000, 1)})
+
+    def status(self):
+        """
+        Copy of the task states, for the readiness probe
+        """
+        return {name: dict(task) for name, task in self.tasks.items()}
+
+warmup = Warmup()
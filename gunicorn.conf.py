@@ -0,0 +1,56 @@
+# gunicorn configuration: the app and its models are loaded once in the master and the forked workers
+# share them copy-on-write, so extra workers don't pay the model memory again.
+import gc
+import os
+import sys
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("GUNICORN_WORKERS", "4"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "sync")
+threads = int(os.getenv("GUNICORN_THREADS", "1"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+
+# torch intra-op threads of each worker, the cores are split between the workers instead of each one using all of them
+TORCH_THREADS = int(os.getenv("TORCH_THREADS", str(max(1, (os.cpu_count() or 1) // workers))))
+
+# Set before torch and the tokenizers are imported by the app, they size their thread pools on first use
+os.environ.setdefault("OMP_NUM_THREADS", str(TORCH_THREADS))
+os.environ.setdefault("MKL_NUM_THREADS", str(TORCH_THREADS))
+os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+
+# The hooks below run the warm-up, not the import of the app
+os.environ["WARMUP_ON_IMPORT"] = "0"
+
+def when_ready(server):
+    """
+    Load the models in the master once the app is imported, before the first worker is forked.
+    Objects alive at this point are moved out of the garbage collector, so collections in the workers
+    don't write to the pages they share with the master.
+    """
+    if not preload_app:
+        return
+    from app.app import warmup, warmup_tasks
+
+    warmup.run(warmup_tasks(before_fork=True))
+    gc.collect()
+    gc.freeze()
+    states = ', '.join(f"{name} {task['state']}" for name, task in warmup.status().items())
+    server.log.info("Master warm-up: %s; %s objects frozen before fork", states, gc.get_freeze_count())
+
+def post_fork(server, worker):
+    """
+    Per worker setup: torch threads, metrics of its own, and the warm-up of what can't be shared
+    (Mongo indexes, first inference, and the models themselves without preload or with the ONNX backend)
+    """
+    torch = sys.modules.get('torch')
+    if torch is not None:
+        torch.set_num_threads(TORCH_THREADS)
+
+    from app.app import warmup, warmup_tasks
+    from app.telemetry import metrics
+    from app.warmup import WARMUP_MODELS
+
+    metrics.reset()
+    warmup.start(warmup_tasks(models=WARMUP_MODELS or preload_app))
+    server.log.info("Worker %s started with %s torch threads", worker.pid, TORCH_THREADS)
@@ -0,0 +1,53 @@
+# Project imports
+from app.chatbot import ENTITY_TOP_K, Chatbot
+
+SENTIMENT = {'POS': 0.6, 'NEU': 0.3, 'NEG': 0.1}
+
+def features(people=()):
+    """
+    features_dict of a message mentioning some people
+    """
+    return {
+        'emotion': {'joy': 0.5, 'sadness': 0.2},
+        'entities': {'people': list(people), 'places': [], 'orgs': [], 'others': []},
+        'sentiment': SENTIMENT,
+        'hate': {'hateful': 0.1},
+        'irony': {'ironic': 0.2}
+    }
+
+def test_new_entity_enters_a_full_context():
+    chatbot = Chatbot(api_key=None, backend=object())
+    # Every slot holds an entity mentioned twice
+    known = [f"Persona {i}" for i in range(ENTITY_TOP_K)]
+    for _ in range(2):
+        chatbot.update_context(features(known))
+
+    chatbot.update_context(features(["Marta"]))
+
+    people = chatbot.context['people']
+    assert len(people) == ENTITY_TOP_K
+    assert "Marta" in people
+    assert "Marta" in chatbot.get_system_role()
+
+def test_old_entities_fade_before_recent_ones():
+    chatbot = Chatbot(api_key=None, backend=object())
+    # Entity mentioned often at the start of the conversation, then others mentioned once each
+    for _ in range(3):
+        chatbot.update_context(features(["Pedro"]))
+    for i in range(30):
+        chatbot.update_context(features([f"Persona {i}"]))
+
+    people = chatbot.context['people']
+    assert len(people) == ENTITY_TOP_K
+    assert "Pedro" not in people
+    assert "Persona 29" in people
+
+def test_repeated_mentions_keep_an_entity():
+    chatbot = Chatbot(api_key=None, backend=object())
+    for i in range(3 * ENTITY_TOP_K):
+        chatbot.update_context(features(["Lucía", f"Persona {i}"]))
+
+    people = chatbot.context['people']
+    assert "Lucía" in people
+    assert people["Lucía"]['mentions'] == 3 * ENTITY_TOP_K
+    assert chatbot.format_entities('people').startswith("Lucía")
@@ -0,0 +1,88 @@
+# Local imports
+import threading
+import time
+
+# Third party imports
+import pytest
+
+# Project imports
+from app.inference_server import InferenceClient, InferenceServer
+
+AUTHKEY = b'test'
+
+class FakeModels:
+    """
+    Model registry that takes a while to load, or fails
+    """
+    def __init__(self, error=None, delay=0.2):
+        self.error = error
+        self.delay = delay
+
+    def load_all(self):
+        time.sleep(self.delay)
+        if self.error is not None:
+            raise RuntimeError(self.error)
+
+class FakeExtractor:
+    """
+    Extractor returning the message length as its only feature
+    """
+    def __init__(self, models):
+        self.models = models
+
+    def version_tag(self):
+        return 'fake:shared:0'
+
+    def extract_batch(self, texts, batch_size):
+        return [{'length': len(text)} for text in texts]
+
+@pytest.fixture
+def serve(tmp_path):
+    """
+    Start an inference server with the given models on a socket of the test directory
+    """
+    def start(models):
+        address = str(tmp_path / 'inference.sock')
+        server = InferenceServer(address=address, authkey=AUTHKEY, extractor=FakeExtractor(models))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        client = InferenceClient(address=address, authkey=AUTHKEY, timeout=3)
+        for _ in range(50):
+            try:
+                client.ping()
+                break
+            except OSError:
+                time.sleep(0.02)
+        return server, client
+    return start
+
+def test_ready_once_models_are_loaded(serve):
+    server, client = serve(FakeModels())
+
+    assert client.ping()['ready'] is False
+    # Messages sent while loading wait for the models
+    assert client.extract("hola") == {'length': 4}
+    assert client.ping() == {'ready': True, 'error': None, 'version': 'fake:shared:0'}
+
+def test_batch_of_messages(serve):
+    server, client = serve(FakeModels(delay=0))
+
+    assert client.extract_batch(["hola", "buenos días", ""]) == [{'length': 4}, {'length': 11}, {'length': 0}]
+    assert client.extract_batch([]) == []
+
+def test_failed_load_answers_every_message(serve):
+    server, client = serve(FakeModels(error="no transformers"))
+
+    # Sent while loading, answered with the load error instead of waiting for the client timeout
+    start = time.monotonic()
+    with pytest.raises(RuntimeError, match="no transformers"):
+        client.extract("hola")
+    assert time.monotonic() - start < 1
+    assert client.ping()['error'] == "no transformers"
+    with pytest.raises(RuntimeError, match="Models failed to load"):
+        client.extract("adiós")
+
+def test_requires_a_shared_key(tmp_path):
+    with pytest.raises(ValueError):
+        InferenceClient(address=str(tmp_path / 'inference.sock'), authkey=b'')
+    with pytest.raises(ValueError):
+        InferenceServer(address=str(tmp_path / 'inference.sock'), authkey=b'', extractor=FakeExtractor(FakeModels()))
@@ -0,0 +1,141 @@
+# Local imports
+import threading
+import time
+
+# Third party imports
+import openai
+import pytest
+
+# Project imports
+from app.fake_openai import FakeOpenAIServer
+from app.llm_client import CircuitBreaker, LLMClient, LLMUnavailableError
+
+PARAMS = {'model': 'gpt-4', 'messages': [{'role': 'user', 'content': 'hola'}]}
+
+@pytest.fixture
+def fake_server():
+    """
+    Start fake OpenAI servers with the given behaviour and shut them down after the test
+    """
+    servers = []
+
+    def start(**kwargs):
+        server = FakeOpenAIServer(**kwargs)
+        server.start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def make_client(server, **kwargs):
+    """
+    LLM client pointed at a fake server, with short backoff so retries don't slow the tests down
+    """
+    options = {'timeout': 2, 'deadline': 5, 'max_retries': 2, 'backoff': 0.01}
+    options.update(kwargs)
+    return LLMClient(api_key='test', base_url=server.base_url, **options)
+
+@pytest.mark.parametrize('status', [429, 500, 503])
+def test_retries_then_succeeds(fake_server, status):
+    server = fake_server(fail_status=status, fail_first=2)
+    client = make_client(server)
+
+    response = client.create(**PARAMS)
+
+    assert 'hola' in response.choices[0].message.content
+    assert server.requests == 3
+    assert client.breaker.failures == 0
+    assert client.breaker.state == 'closed'
+
+def test_gives_up_after_max_retries(fake_server):
+    server = fake_server(fail_status=500, fail_first=10)
+    client = make_client(server, max_retries=2)
+
+    with pytest.raises(LLMUnavailableError):
+        client.create(**PARAMS)
+    assert server.requests == 3
+
+def test_deadline_runs_out(fake_server):
+    server = fake_server(latency=0.5)
+    client = make_client(server, timeout=0.2, deadline=0.6, max_retries=10)
+
+    start = time.monotonic()
+    with pytest.raises(LLMUnavailableError):
+        client.create(**PARAMS)
+    # Attempts stop at the deadline instead of using up every retry
+    assert time.monotonic() - start < 1.0
+    assert server.requests < 10
+
+def test_client_errors_pass_through_without_retry(fake_server):
+    server = fake_server(fail_status=400, fail_first=1)
+    client = make_client(server, max_retries=3)
+
+    with pytest.raises(openai.BadRequestError):
+        client.create(**PARAMS)
+    assert server.requests == 1
+    assert client.breaker.failures == 0
+
+def test_breaker_opens_then_half_opens_then_closes(fake_server):
+    server = fake_server(fail_status=500, fail_first=2)
+    client = make_client(server, max_retries=0, breaker=CircuitBreaker(threshold=2, reset_after=0.3))
+
+    for _ in range(2):
+        with pytest.raises(LLMUnavailableError):
+            client.create(**PARAMS)
+    assert client.breaker.state == 'open'
+
+    # Open: fails fast without calling upstream
+    with pytest.raises(LLMUnavailableError):
+        client.create(**PARAMS)
+    assert server.requests == 2
+
+    time.sleep(0.35)
+    assert client.breaker.state == 'half_open'
+    client.create(**PARAMS)
+    assert server.requests == 3
+    assert client.breaker.state == 'closed'
+
+def test_client_error_keeps_breaker_open(fake_server):
+    server = fake_server(fail_status=500, fail_first=2)
+    breaker = CircuitBreaker(threshold=2, reset_after=0.3)
+    client = make_client(server, max_retries=0, breaker=breaker)
+    for _ in range(2):
+        with pytest.raises(LLMUnavailableError):
+            client.create(**PARAMS)
+
+    time.sleep(0.35)
+    server.fail_first, server.fail_status = server.requests + 1, 400
+    with pytest.raises(openai.BadRequestError):
+        client.create(**PARAMS)
+
+    # The trial slot is free again but the breaker is not closed by a client error
+    assert breaker.state == 'half_open'
+    assert breaker.failures == 2
+    assert not breaker.trial_running
+
+def test_concurrency_limit(fake_server):
+    server = fake_server(latency=0.5)
+    client = make_client(server, max_concurrency=1)
+    busy = threading.Thread(target=client.create, kwargs=PARAMS)
+    busy.start()
+    time.sleep(0.1)
+
+    # The only slot is taken for longer than this request's deadline
+    client.deadline = 0.1
+    with pytest.raises(LLMUnavailableError):
+        client.create(**PARAMS)
+    busy.join()
+    assert server.requests == 1
+
+def test_stream(fake_server):
+    server = fake_server(fail_status=503, fail_first=1)
+    client = make_client(server)
+
+    chunks = list(client.stream(**PARAMS))
+
+    reply = ''.join(chunk.choices[0].delta.content or '' for chunk in chunks if chunk.choices)
+    assert reply == server.reply(PARAMS)
+    assert server.requests == 2
@@ -0,0 +1,89 @@
+# Local imports
+from datetime import datetime
+
+# Third party imports
+import mongomock
+import pytest
+from bson import ObjectId
+
+# Project imports
+from app.migrate_messages import drop_legacy, migrate
+
+SAD = {'NEG': 0.8, 'NEU': 0.15, 'POS': 0.05}
+HAPPY = {'NEG': 0.05, 'NEU': 0.15, 'POS': 0.8}
+
+def old_message(text, sentiment):
+    """
+    Message embedded in a conversation header, as the baseline save_conver pushed it
+    """
+    return {'user_message': text, 'bot_message': "respuesta", 'emotions': {'sadness': 0.7}, 'sentiment': sentiment,
+            'hate': {'hateful': 0.1}, 'irony': {'ironic': 0.1}}
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()['procstop']
+
+@pytest.fixture
+def conversation_id(db):
+    """
+    Old conversation where several messages share the same sentiment. Entities are stored per type in message
+    order with the sentiment of their message, as the baseline did with $push/$each.
+    """
+    messages = [
+        old_message("Hoy no tengo ganas de nada", SAD),
+        old_message("Marta no me habla desde el lunes", SAD),
+        old_message("Fui a Sevilla y me encantó", HAPPY),
+        old_message("Tampoco he dormido bien", SAD),
+        old_message("Pedro y Marta se han ido a Madrid sin mí", SAD),
+    ]
+    entities = {
+        'people': [["Marta", SAD], ["Pedro", SAD], ["Marta", SAD]],
+        'places': [["Sevilla", HAPPY], ["Madrid", SAD]],
+        'orgs': [],
+        'others': []
+    }
+    return db.conversations.insert_one({'user_id': ObjectId(), 'start_time': datetime(2024, 5, 1, 10), 'duration': 3,
+                                        'messages': messages, 'entities': entities}).inserted_id
+
+def migrated_messages(db, conversation_id):
+    return list(db.messages.find({'conversation_id': conversation_id}).sort('seq', 1))
+
+def test_entities_go_to_the_message_that_mentions_them(db, conversation_id):
+    stats = migrate(db)
+
+    assert stats == {'conversations': 1, 'messages': 5, 'ambiguous_entities': 0}
+    messages = migrated_messages(db, conversation_id)
+    assert [message['seq'] for message in messages] == [1, 2, 3, 4, 5]
+    assert [message['user_message'][:4] for message in messages] == ["Hoy ", "Mart", "Fui ", "Tamp", "Pedr"]
+    assert [message['entities']['people'] for message in messages] == [[], ["Marta"], [], [], ["Pedro", "Marta"]]
+    assert [message['entities']['places'] for message in messages] == [[], [], ["Sevilla"], [], ["Madrid"]]
+
+def test_headers_keep_the_old_fields_until_dropped(db, conversation_id):
+    migrate(db)
+
+    header = db.conversations.find_one({'_id': conversation_id})
+    assert header['message_count'] == 5
+    assert header['messages_migrated'] is True
+    assert len(header['messages']) == 5 and header['entities']['people']
+
+    assert drop_legacy(db) == 1
+    header = db.conversations.find_one({'_id': conversation_id})
+    assert 'messages' not in header and 'entities' not in header
+    assert header['message_count'] == 5
+
+def test_migration_runs_once(db, conversation_id):
+    migrate(db)
+    # A message saved after the migration continues the seq
+    db.conversations.update_one({'_id': conversation_id}, {'$inc': {'message_count': 1}})
+
+    assert migrate(db)['conversations'] == 0
+    assert db.conversations.find_one({'_id': conversation_id})['message_count'] == 6
+    assert len(migrated_messages(db, conversation_id)) == 5
+
+def test_ambiguous_entities_are_counted(db):
+    # Both messages have the same sentiment and mention Marta, only one of them was detected
+    messages = [old_message("Marta dice que sí", SAD), old_message("Marta dice que no", SAD)]
+    db.conversations.insert_one({'user_id': ObjectId(), 'start_time': datetime(2024, 5, 1), 'messages': messages,
+                                 'entities': {'people': [["Marta", SAD]]}})
+
+    assert migrate(db)['ambiguous_entities'] == 1
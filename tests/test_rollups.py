@@ -0,0 +1,96 @@
+# Local imports
+import random
+from datetime import datetime, timedelta
+
+# Third party imports
+import mongomock
+import pandas as pd
+import pytest
+
+# Project imports
+from app.analytics import DataAnalyzer
+from app.chatbot import Chatbot
+from app.rollups import rebuild_rollups
+
+EMOTIONS = ['joy', 'sadness', 'anger', 'fear', 'surprise', 'disgust', 'others']
+PEOPLE = ["Marta", "Pedro", "Lucía"]
+N_MESSAGES = 60
+
+def probabilities(rng, labels):
+    """
+    Random probabilities of every label, as the models return them
+    """
+    values = [rng.random() for _ in labels]
+    total = sum(values)
+    return {label: value / total for label, value in zip(labels, values)}
+
+def features(rng):
+    """
+    features_dict of a message with random probabilities and some people mentioned
+    """
+    return {
+        'emotion': probabilities(rng, EMOTIONS),
+        'entities': {'people': rng.sample(PEOPLE, rng.randint(0, 2)), 'places': [], 'orgs': [], 'others': []},
+        'sentiment': probabilities(rng, ['POS', 'NEU', 'NEG']),
+        'hate': probabilities(rng, ['hateful', 'targeted', 'aggressive']),
+        'irony': probabilities(rng, ['ironic', 'not ironic'])
+    }
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()['procstop']
+
+@pytest.fixture
+def user_id(db):
+    """
+    User with N_MESSAGES saved through save_conver in two conversations over several days
+    """
+    rng = random.Random(16)
+    user_id = db.users.insert_one({'username': 'ana', 'gender': 'Female'}).inserted_id
+    start = datetime(2024, 5, 1, 9)
+    for conversation in range(2):
+        chatbot = Chatbot(api_key=None, db=db, backend=object())
+        chatbot.user_id = user_id
+        chatbot.start_conver()
+        for i in range(N_MESSAGES // 2):
+            timestamp = start + timedelta(days=conversation * 3, hours=7 * i)
+            chatbot.save_conver(db, "mensaje", "respuesta", features(rng), timestamp=timestamp)
+    return user_id
+
+def analyzer(db, user_id, mode):
+    analyzer = DataAnalyzer(db=db, conversation_id=None)
+    analyzer.user_id = user_id
+    assert analyzer.get_history(mode)
+    return analyzer
+
+def test_rollups_give_the_same_daily_aggregates(db, user_id):
+    rollup, python = analyzer(db, user_id, 'rollup'), analyzer(db, user_id, 'python')
+
+    assert len(rollup.sentiment_df) < len(python.sentiment_df)
+    pd.testing.assert_frame_equal(rollup.sentiment_by_date(), python.sentiment_by_date(), rtol=1e-5)
+    pd.testing.assert_frame_equal(rollup.daily_emotions(), python.daily_emotions(), check_freq=False, rtol=1e-5)
+    pd.testing.assert_frame_equal(rollup.emotion_totals(), python.emotion_totals(), check_index_type=False, rtol=1e-5)
+
+    # Entities get the mean sentiment of every message that mentions them
+    rollup_entities = rollup.entity_df.set_index('entity')['sentiment_pos'].sort_index()
+    python_entities = python.entity_df.groupby('entity')['sentiment_pos'].mean().sort_index()
+    pd.testing.assert_series_equal(rollup_entities, python_entities, check_names=False, check_index_type=False, rtol=1e-5)
+
+def rollup_documents(db):
+    """
+    Rollups by day without their ids, with the floats rounded to compare sums made in another order
+    """
+    def rounded(value):
+        if isinstance(value, dict):
+            return {key: rounded(item) for key, item in value.items()}
+        if isinstance(value, float):
+            return round(value, 9)
+        return value
+    return {rollup['day']: rounded(rollup) for rollup in db.analytics_rollups.find({}, {'_id': 0})}
+
+def test_rebuild_reproduces_the_incremental_rollups(db, user_id):
+    incremental = rollup_documents(db)
+
+    assert rebuild_rollups(db, batch_size=7) == N_MESSAGES
+    assert rollup_documents(db) == incremental
+    assert sum(rollup['messages'] for rollup in incremental.values()) == N_MESSAGES
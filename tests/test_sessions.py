@@ -0,0 +1,87 @@
+# Third party imports
+import mongomock
+import pytest
+
+# Project imports
+from app.chatbot import Chatbot
+from app.sessions import ConversationStore
+
+def features(emotion, people=()):
+    """
+    features_dict of a message with a dominant emotion and some people mentioned
+    """
+    return {
+        'emotion': {emotion: 0.8, 'others': 0.2},
+        'entities': {'people': list(people), 'places': [], 'orgs': [], 'others': []},
+        'sentiment': {'POS': 0.2, 'NEU': 0.3, 'NEG': 0.5},
+        'hate': {'hateful': 0.1},
+        'irony': {'ironic': 0.2}
+    }
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()['procstop']
+
+@pytest.fixture
+def user(db):
+    user_id = db.users.insert_one({'username': 'ana', 'gender': 'Female'}).inserted_id
+    return db.users.find_one({'_id': user_id})
+
+def worker(db):
+    """
+    Conversation store of one gunicorn worker, every worker shares the database
+    """
+    return ConversationStore(db, lambda: Chatbot(api_key=None, db=db, backend=object()))
+
+def send(store, db, user, message_features, conversation_id):
+    """
+    Serve a message the way /chat does: update the context of the session chatbot, then save the message
+    """
+    chatbot = store.get(str(user['_id']), str(conversation_id))
+    with chatbot.lock:
+        chatbot.update_context(message_features)
+    chatbot.save_conver(db, "mensaje", "respuesta", message_features)
+    return chatbot
+
+def test_cached_chatbot_catches_up_with_other_workers(db, user):
+    worker_a, worker_b = worker(db), worker(db)
+    conversation_id = worker_a.start(user).conversation_id
+
+    send(worker_a, db, user, features('joy', ["Marta"]), conversation_id)
+    send(worker_b, db, user, features('sadness', ["Pedro"]), conversation_id)
+    send(worker_a, db, user, features('anger', ["Lucía"]), conversation_id)
+    send(worker_b, db, user, features('fear'), conversation_id)
+
+    # Both workers see the four messages, whichever answered them
+    chatbot_a = worker_a.get(str(user['_id']), str(conversation_id))
+    chatbot_b = worker_b.get(str(user['_id']), str(conversation_id))
+    for chatbot in (chatbot_a, chatbot_b):
+        assert chatbot.applied_seq == 4
+        assert set(chatbot.context['people']) == {"Marta", "Pedro", "Lucía"}
+    assert chatbot_a.context['emotions'] == pytest.approx(chatbot_b.context['emotions'])
+    assert chatbot_a.get_system_role() == chatbot_b.get_system_role()
+
+def test_rehydrated_chatbot_picks_up_a_late_write(db, user):
+    worker_a, worker_b = worker(db), worker(db)
+    chatbot_a = worker_a.start(user)
+    conversation_id = chatbot_a.conversation_id
+
+    # Worker A answered the message but its deferred write hasn't landed when worker B rehydrates
+    chatbot_a.update_context(features('joy', ["Marta"]))
+    chatbot_b = worker_b.get(str(user['_id']), str(conversation_id))
+    assert chatbot_b.applied_seq == 0
+    chatbot_a.save_conver(db, "mensaje", "respuesta", features('joy', ["Marta"]))
+
+    chatbot_b = worker_b.get(str(user['_id']), str(conversation_id))
+    assert chatbot_b.applied_seq == 1
+    assert "Marta" in chatbot_b.context['people']
+
+def test_own_messages_are_not_replayed(db, user):
+    store = worker(db)
+    conversation_id = store.start(user).conversation_id
+    for _ in range(3):
+        send(store, db, user, features('joy', ["Marta"]), conversation_id)
+
+    chatbot = store.get(str(user['_id']), str(conversation_id))
+    assert chatbot.applied_seq == 3
+    assert chatbot.context['people']["Marta"]['mentions'] == 3